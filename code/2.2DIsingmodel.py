@@ -1,113 +1,714 @@
+import argparse
+import json
+
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib import colors
 
+import disorder
+import kernels
+from batch_render import (RenderOptions, add_render_arguments, figure_style,
+                          finish_figure, options_from_args, save_data)
+from disorder import checkerboard_sweep, sublattice_sites, total_energy
+from kernels import metropolis_field_sweep, metropolis_sweep, periodic_neighbours
+from numerics import logsumexp
+from stage_cache import (Experiment, Stage, add_cache_arguments, cache_from_args,
+                         load_config)
 
-plt.style.use('dark_background')
 
 class IsingRG:
     """
-    2D Ising Model and Renormalization Group Flow Simulator
+    d-dimensional Ising Model and Renormalization Group Flow Simulator
+
+    Spins live on an L^d hypercubic lattice with periodic boundaries
+    (d=2 by default). Every instance owns its random generator, so runs are
+    reproducible from `seed` and can be checkpointed and resumed.
+
+    Quenched disorder (see disorder.py):
+        h: uniform external field
+        J: per-bond couplings, shape (d, L, ..., L); J[a, x] couples x
+           and x + e_a (default: J = 1 everywhere)
+        occupied: site-dilution mask; vacant sites hold spin 0
     """
-    def __init__(self, L=64, T=2.27):
+    def __init__(self, L=64, T=2.27, d=2, seed=None, h=0.0, J=None, occupied=None):
         self.L = L
         self.T = T
-        # Initialize random state (+1 or -1)
-        self.lattice = np.random.choice([-1, 1], size=(L, L))
-        
-    def energy_change(self, i, j):
+        self.d = d
+        self.h = h
+        self.J = None if J is None else np.asarray(J, dtype=float)
+        self.occupied = None if occupied is None else np.asarray(occupied, dtype=bool)
+        self.rng = np.random.default_rng(seed)
+        self.sweeps = 0
+        # Initialize random state (+1 or -1); int8 keeps L=64^3 at 256 kB
+        self.lattice = self.rng.choice(np.array([-1, 1], dtype=np.int8),
+                                       size=(L,) * d)
+        if self.occupied is not None:
+            self.lattice[~self.occupied] = 0
+        self._sublattices = None
+        self._neighbours = None
+        self._couplings = None
+
+    @property
+    def uniform(self):
+        """Pure ferromagnet without field: the integer energy path applies."""
+        return self.J is None and self.h == 0 and self.occupied is None
+
+    @property
+    def n_spins(self):
+        """Number of occupied sites."""
+        return self.lattice.size if self.occupied is None else int(self.occupied.sum())
+
+    def neighbour_sum(self):
+        """Sum of the 2d nearest neighbours of every site, as one array."""
+        h = np.zeros_like(self.lattice)
+        for axis in range(self.lattice.ndim):
+            h += np.roll(self.lattice, 1, axis=axis)
+            h += np.roll(self.lattice, -1, axis=axis)
+        return h
+
+    def energy_change(self, *site):
         """
         Calculate energy change from flipping a spin (periodic boundary conditions)
-        E = -J * sum(s_i * s_j), with J=1
+        E = -sum(J_ij * s_i * s_j) - h * sum(s_i), with J_ij = 1 by default
         """
-        top = self.lattice[(i - 1) % self.L, j]
-        bottom = self.lattice[(i + 1) % self.L, j]
-        left = self.lattice[i, (j - 1) % self.L]
-        right = self.lattice[i, (j + 1) % self.L]
-        neighbors = top + bottom + left + right
+        neighbors = 0
+        for axis in range(self.d):
+            for step in (-1, 1):
+                nb = list(site)
+                nb[axis] = (nb[axis] + step) % self.L
+                # Bond (axis, x) joins x and x + e_axis
+                coupling = 1 if self.J is None else \
+                    self.J[(axis,) + (tuple(site) if step == 1 else tuple(nb))]
+                neighbors += coupling * self.lattice[tuple(nb)]
         # dE = E_new - E_old = -(-s) * neighbors - (-s * neighbors) = 2 * s * neighbors
-        return 2 * self.lattice[i, j] * neighbors
+        return 2 * self.lattice[site] * (neighbors + self.h)
+
+    def neighbour_couplings(self):
+        """
+        (N, 2d) bond strengths matching the kernels.periodic_neighbours
+        table: column 2a holds the bond to x - e_a, column 2a + 1 the bond
+        to x + e_a (all 1 without J).
+        """
+        if self.J is None:
+            return np.ones((self.lattice.size, 2 * self.d))
+        return np.stack([coupling.ravel() for axis in range(self.d)
+                         for coupling in (np.roll(self.J[axis], 1, axis), self.J[axis])],
+                        axis=1)
 
     def metropolis_step(self):
-        """Perform one Metropolis Monte Carlo sweep"""
-        # Attempt L*L flips, this is called one MCS (Monte Carlo Sweep)
-        for _ in range(self.L * self.L):
-            i = np.random.randint(0, self.L)
-            j = np.random.randint(0, self.L)
-            dE = self.energy_change(i, j)
-            
-            # Metropolis criterion: accept if energy decreases, or with Boltzmann probability if increases
-            if dE <= 0 or np.random.rand() < np.exp(-dE / self.T):
-                self.lattice[i, j] *= -1
-
-    def simulate(self, steps=1000):
-        """Thermalize the system"""
+        """
+        Perform one random-sequential Metropolis Monte Carlo sweep
+
+        The sequential loop runs in kernels.metropolis_sweep (compiled with
+        numba when it is installed); sites and thresholds are drawn here,
+        so results do not depend on the backend. With couplings, a field
+        or vacancies, kernels.metropolis_field_sweep evaluates real-valued
+        local fields instead of the integer acceptance table.
+        """
+        # Attempt L^d flips, this is called one MCS (Monte Carlo Sweep)
+        n_sites = self.lattice.size
+        if self._neighbours is None:
+            self._neighbours = periodic_neighbours(self.lattice.shape)
+        sites = self.rng.integers(0, self.L, size=(n_sites, self.d))
+        thresholds = self.rng.random(n_sites)
+        flat_sites = np.ravel_multi_index(sites.T, self.lattice.shape)
+        if not self.uniform:
+            if self._couplings is None:
+                self._couplings = self.neighbour_couplings()
+            metropolis_field_sweep(self.lattice.reshape(-1), self._neighbours, self._couplings,
+                                   float(self.h), flat_sites, thresholds, 1.0 / self.T)
+            self.sweeps += 1
+            return
+        # Metropolis criterion: accept if energy decreases, or with Boltzmann probability if increases
+        acceptance = np.exp(-np.arange(-4 * self.d, 4 * self.d + 1) / self.T)
+        metropolis_sweep(self.lattice.reshape(-1), self._neighbours, flat_sites,
+                         thresholds, acceptance)
+        self.sweeps += 1
+
+    def checkerboard_step(self):
+        """
+        Perform one vectorized Metropolis sweep using sublattice updates.
+
+        Sites whose coordinates sum to an even/odd number form two
+        sublattices; no two sites of one sublattice are neighbours, so each
+        half can be updated simultaneously with array operations.
+        """
+        if self._sublattices is None:
+            self._sublattices = sublattice_sites(self.lattice.shape)
+        if not self.uniform:
+            # Couplings, field or vacancies: real-valued local fields
+            checkerboard_sweep(self.lattice, self.d, self.T, self.rng,
+                               self.J, self.h, self._sublattices)
+            self.sweeps += 1
+            return
+        # dE = 2*s*h takes the values -4d, -4d+4, ..., 4d; tabulate exp(-dE/T)
+        dE_values = np.arange(-4 * self.d, 4 * self.d + 1)
+        acceptance = np.minimum(1.0, np.exp(-dE_values / self.T))
+        flat = self.lattice.reshape(-1)
+        # Gather only the sublattice being updated and its neighbours
+        for sites, up, down in self._sublattices:
+            s = flat[sites]
+            h = flat[up].sum(axis=0, dtype=np.int32) + flat[down].sum(axis=0, dtype=np.int32)
+            dE = 2 * s * h
+            accept = self.rng.random(sites.shape[0]) < acceptance[dE + 4 * self.d]
+            flat[sites] = np.where(accept, -s, s)
+        self.sweeps += 1
+
+    def simulate(self, steps=1000, method=None):
+        """
+        Thermalize the system
+
+        method: 'checkerboard' (vectorized sublattice sweeps) or 'random'
+                (single-site random-sequential Metropolis); by default
+                checkerboard, or random for an odd L, which has no
+                checkerboard decomposition
+        """
+        if method is None:
+            method = "random" if self.L % 2 else "checkerboard"
+        step = {"checkerboard": self.checkerboard_step,
+                "random": self.metropolis_step}[method]
         for _ in range(steps):
-            self.metropolis_step()
+            step()
+
+    def magnetization(self):
+        """Magnetization per spin m = (1/N) sum_i s_i"""
+        return self.lattice.sum(dtype=float) / self.n_spins
+
+    def energy(self):
+        """Energy per spin e = -(1/N) sum_<ij> s_i s_j, each bond counted once"""
+        if not self.uniform:
+            return total_energy(self.lattice, self.d, self.J, self.h) / self.n_spins
+        lattice = self.lattice.astype(np.int32)
+        bonds = sum(np.sum(lattice * np.roll(lattice, -1, axis=axis))
+                    for axis in range(lattice.ndim))
+        return -bonds / lattice.size
+
+    def time_series(self, n_samples, thin=1, method=None):
+        """
+        Record total energy E and magnetization M after every `thin` sweeps.
+
+        Both are extensive integers (E = -sum_<ij> s_i s_j, M = sum_i s_i),
+        which is what histogram reweighting works with; with couplings J
+        or a field h, E is real-valued. Thermalize first.
+        """
+        integer = self.J is None and self.h == 0
+        E = np.empty(n_samples, dtype=np.int64 if integer else float)
+        M = np.empty(n_samples, dtype=np.int64)
+        for i in range(n_samples):
+            self.simulate(steps=thin, method=method)
+            e_total = self.energy() * self.n_spins
+            E[i] = round(e_total) if integer else e_total
+            M[i] = self.lattice.sum(dtype=np.int64)
+        return E, M
+
+    def stream(self, n_samples, thin=1, method=None):
+        """
+        Yield the lattice after every `thin` sweeps, n_samples times.
+
+        The yielded array is the live lattice, updated in place by the next
+        sweep; consume it (e.g. with RGPipeline) or copy it before resuming.
+        """
+        for _ in range(n_samples):
+            self.simulate(steps=thin, method=method)
+            yield self.lattice
 
     def coarse_grain(self, block_size=2):
         """
         Perform Kadanoff block spin transformation (majority rule)
         """
-        new_L = self.L // block_size
-        new_lattice = np.zeros((new_L, new_L))
-        
-        for i in range(new_L):
-            for j in range(new_L):
-                # Extract block_size x block_size block
-                block = self.lattice[i*block_size:(i+1)*block_size, 
-                                   j*block_size:(j+1)*block_size]
-                # Majority rule
-                avg_spin = np.sum(block)
-                if avg_spin > 0:
-                    new_lattice[i, j] = 1
-                elif avg_spin < 0:
-                    new_lattice[i, j] = -1
-                else:
-                    # If tied, choose randomly
-                    new_lattice[i, j] = np.random.choice([-1, 1])
-        return new_lattice
-
-def plot_rg_flow():
-    # 2D Ising model critical temperature Tc = 2/ln(1+sqrt(2)) = 2.269
-    # We simulate slightly above Tc to observe correlation length
-    sim = IsingRG(L=128, T=2.3) 
+        return block_spin(self.lattice, block_size, self.rng)
+
+    def save_checkpoint(self, path):
+        """Save lattice, parameters and RNG state so a run can be resumed."""
+        disorder = {name: value for name, value in
+                    (("J", self.J), ("occupied", self.occupied)) if value is not None}
+        np.savez(path, lattice=self.lattice, L=self.L, T=self.T, d=self.d,
+                 h=self.h, sweeps=self.sweeps,
+                 rng_state=json.dumps(self.rng.bit_generator.state), **disorder)
+
+    @classmethod
+    def from_checkpoint(cls, path):
+        """Restore a simulator written by save_checkpoint."""
+        with np.load(path) as data:
+            sim = cls(L=int(data["L"]), T=float(data["T"]), d=int(data["d"]),
+                      h=float(data["h"]) if "h" in data else 0.0,
+                      J=data["J"] if "J" in data else None,
+                      occupied=data["occupied"] if "occupied" in data else None)
+            sim.lattice = data["lattice"].copy()
+            sim.sweeps = int(data["sweeps"])
+            sim.rng.bit_generator.state = json.loads(str(data["rng_state"]))
+        return sim
+
+
+def block_spin(lattice, block_size=2, rng=None, out=None):
+    """
+    Majority-rule block spins of a d-dimensional lattice.
+
+    The lattice is reshaped to (n, b, n, b, ...) and summed over the block
+    axes, so every block is reduced in one vectorized pass. Trailing sites
+    that do not fill a whole block are dropped; ties are broken randomly.
+    The result is written to `out` (int8) when given.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    b = block_size
+    new_shape = [n // b for n in lattice.shape]
+    cropped = lattice[tuple(slice(0, n * b) for n in new_shape)]
+    blocks = cropped.reshape([x for n in new_shape for x in (n, b)])
+    block_sum = blocks.sum(axis=tuple(range(1, 2 * lattice.ndim, 2)), dtype=np.int32)
+
+    # Majority rule
+    if out is None:
+        out = np.empty(new_shape, dtype=np.int8)
+    np.sign(block_sum, out=out, casting="unsafe")
+    ties = out == 0
+    # If tied, choose randomly
+    n_ties = int(ties.sum())
+    if n_ties:
+        out[ties] = 2 * rng.integers(0, 2, size=n_ties, dtype=np.int8) - 1
+    return out
+
+
+def nearest_neighbour_correlation(lattice):
+    """<s_i s_j> over nearest-neighbour pairs, periodic in every direction."""
+    lattice = lattice.astype(np.int32)
+    return np.mean([np.mean(lattice * np.roll(lattice, -1, axis=axis))
+                    for axis in range(lattice.ndim)])
+
+
+def magnetization(lattice):
+    """Magnetization per spin of a configuration."""
+    return lattice.mean(dtype=float)
+
+
+RG_OBSERVABLES = {
+    "magnetization": magnetization,
+    "abs_magnetization": lambda lattice: abs(magnetization(lattice)),
+    "nn_correlation": nearest_neighbour_correlation,
+}
+
+
+class RGPipeline:
+    """
+    Block-spin pyramid b = 1, 2, 4, 8, ... of configurations of one shape.
+
+    One int8 buffer per level is allocated up front and reused for every
+    configuration, so streaming thousands of snapshots allocates nothing
+    per level and constructs no simulator objects. Level 0 is the input
+    lattice itself, not a copy.
+
+    Usage:
+        pipeline = RGPipeline(sim.lattice.shape)
+        flow = pipeline.observe(sim.stream(200, thin=5))
+    """
+    def __init__(self, shape, block_size=2, levels=None, seed=None):
+        self.shape = tuple(shape)
+        self.block_size = block_size
+        self.rng = np.random.default_rng(seed)
+        self.buffers = [np.empty(level_shape, dtype=np.int8)
+                        for level_shape in self.level_shapes(shape, block_size, levels)]
+
+    @staticmethod
+    def level_shapes(shape, block_size=2, levels=None):
+        """Shapes of the coarse levels b = block_size, block_size^2, ..."""
+        shapes = []
+        level_shape = tuple(shape)
+        while min(level_shape) >= block_size and (levels is None or len(shapes) < levels):
+            level_shape = tuple(n // block_size for n in level_shape)
+            shapes.append(level_shape)
+        return shapes
+
+    @property
+    def n_levels(self):
+        """Number of levels including the original lattice."""
+        return len(self.buffers) + 1
+
+    def pyramid(self, lattice):
+        """
+        Lazily yield (b, lattice at scale b) for b = 1, 2, 4, ...
+
+        Coarse levels live in the pipeline's buffers and are overwritten
+        by the next configuration; copy them to keep them.
+        """
+        if lattice.shape != self.shape:
+            raise ValueError(f"expected a lattice of shape {self.shape}, got {lattice.shape}")
+        yield 1, lattice
+        b = 1
+        for buffer in self.buffers:
+            lattice = block_spin(lattice, self.block_size, self.rng, out=buffer)
+            b *= self.block_size
+            yield b, lattice
+
+    def observe(self, configurations, observables=None):
+        """
+        Measure observables on every level of every configuration.
+
+        observables maps names to functions of a lattice (default:
+        RG_OBSERVABLES). Returns {"scale": (n_levels,)} plus one
+        (n_configurations, n_levels) array per observable.
+        """
+        observables = observables or RG_OBSERVABLES
+        rows = {name: [] for name in observables}
+        for lattice in configurations:
+            values = {name: [] for name in observables}
+            for _, level in self.pyramid(lattice):
+                for name, func in observables.items():
+                    values[name].append(func(level))
+            for name in observables:
+                rows[name].append(values[name])
+        result = {"scale": self.block_size ** np.arange(self.n_levels)}
+        result.update({name: np.array(v, dtype=float).reshape(-1, self.n_levels)
+                       for name, v in rows.items()})
+        return result
+
+
+# ============================================================
+# Ferrenberg-Swendsen histogram reweighting
+# ============================================================
+# A run at beta_k samples E with probability g(E) exp(-beta_k E) / Z_k, so
+# the energy histograms of a few runs determine the density of states g(E)
+# and with it every canonical average at any nearby temperature. All sums
+# are done in log space because beta * E is of order N.
+
+class MultiHistogram:
+    """
+    Multi-histogram (WHAM) reweighting of IsingRG time series.
+
+    Parameters:
+        E_runs, M_runs: Per-run arrays of total energy and magnetization,
+                        e.g. from IsingRG.time_series
+        T_runs: Simulation temperature of each run
+        n_sites: Number of spins N (for per-site observables)
+
+    With a single run this reduces to single-histogram reweighting. Since
+    Ising energies are discrete, samples are pooled by distinct energy and
+    all arrays are (n_runs or n_T, n_energies) rather than per sample.
+    """
+    def __init__(self, E_runs, M_runs, T_runs, n_sites):
+        E_all = np.concatenate([np.asarray(E) for E in E_runs])
+        M_all = np.abs(np.concatenate([np.asarray(M) for M in M_runs])).astype(float)
+        self.n_sites = n_sites
+        self.beta_runs = 1.0 / np.asarray(T_runs, dtype=float)
+        self.log_n = np.log([len(E) for E in E_runs])
+        self.energies, inverse, counts = np.unique(E_all, return_inverse=True,
+                                                   return_counts=True)
+        self.energies = self.energies.astype(float)
+        self.log_hist = np.log(counts)
+        # Per-energy sums of |M|^k, so magnetic averages need no per-sample work
+        self.m_moments = np.stack([np.bincount(inverse, weights=M_all ** k)
+                                   for k in (1, 2, 4)]) / counts
+        self.log_z = np.zeros(len(self.beta_runs))
+        self.iterations = 0
+
+    def log_dos(self, log_z=None):
+        """ln g(E) up to a constant, given the run free energies ln Z_k."""
+        log_z = self.log_z if log_z is None else log_z
+        denom = logsumexp(self.log_n[:, None] - np.outer(self.beta_runs, self.energies)
+                          - log_z[:, None], axis=0)
+        return self.log_hist - denom
+
+    def solve(self, tol=1e-10, max_iter=100000):
+        """Iterate the self-consistency equations for ln Z_k until converged."""
+        for self.iterations in range(1, max_iter + 1):
+            log_g = self.log_dos()
+            log_z = logsumexp(log_g[None, :] - np.outer(self.beta_runs, self.energies),
+                              axis=1)
+            log_z -= log_z[0]  # ln Z is only defined up to a constant
+            delta = np.max(np.abs(log_z - self.log_z))
+            self.log_z = log_z
+            if delta < tol:
+                break
+        return self
+
+    def log_weights(self, T_values):
+        """Normalized ln P_T(E) for every temperature in T_values, (n_T, n_E)."""
+        beta = 1.0 / np.atleast_1d(np.asarray(T_values, dtype=float))
+        log_p = self.log_dos()[None, :] - np.outer(beta, self.energies)
+        return log_p - logsumexp(log_p, axis=1)[:, None]
+
+    def observables(self, T_values):
+        """
+        Reweighted per-site observables on a temperature grid.
+
+        Returns a dict with T, energy, specific_heat, magnetization (<|m|>),
+        susceptibility and binder (U_4 = 1 - <m^4> / 3<m^2>^2).
+        """
+        T = np.atleast_1d(np.asarray(T_values, dtype=float))
+        p = np.exp(self.log_weights(T))
+        N = self.n_sites
+        # Subtract the mean energy of the data before squaring to avoid cancellation
+        shift = self.energies.mean()
+        e1 = p @ (self.energies - shift)
+        e2 = p @ (self.energies - shift) ** 2
+        m1, m2, m4 = (p @ moment for moment in self.m_moments)
+        return {
+            "T": T,
+            "energy": (e1 + shift) / N,
+            "specific_heat": (e2 - e1 ** 2) / (T ** 2 * N),
+            "magnetization": m1 / N,
+            "susceptibility": (m2 - m1 ** 2) / (T * N),
+            "binder": 1.0 - m4 / (3.0 * m2 ** 2),
+        }
+
+
+def temperature_scan(L, T_runs, n_samples=2000, thermalize=500, thin=1,
+                     seed=None):
+    """
+    Simulate a handful of temperatures and return the solved MultiHistogram.
+
+    Choose T_runs close enough that neighbouring energy histograms overlap;
+    the returned object interpolates observables continuously between them.
+    """
+    seeds = np.random.SeedSequence(seed).spawn(len(T_runs))
+    E_runs, M_runs = [], []
+    for T, s in zip(T_runs, seeds):
+        sim = IsingRG(L=L, T=T, seed=s)
+        sim.simulate(steps=thermalize)
+        E, M = sim.time_series(n_samples, thin=thin)
+        E_runs.append(E)
+        M_runs.append(M)
+    return MultiHistogram(E_runs, M_runs, T_runs, n_sites=sim.lattice.size).solve()
+
+
+# ============================================================
+# Adaptive T_c search from Binder-cumulant crossings
+# ============================================================
+# U_4(T) = 1 - <m^4> / 3<m^2>^2 is scale invariant at T_c, so the curves of
+# different L cross there. Far from the crossing a run tells little about
+# T_c; the search therefore spends its budget only inside a window around
+# the current estimate, fits U_L(T) linearly there and shrinks the window
+# as the estimate sharpens.
+
+def binder_cumulant(M, n_blocks=10):
+    """U_4 of a magnetization time series and its blocked jackknife error."""
+    m = np.asarray(M, dtype=float)
+    n = len(m) // n_blocks * n_blocks
+    m2 = (m[:n] ** 2).reshape(n_blocks, -1).mean(axis=1)
+    m4 = (m[:n] ** 4).reshape(n_blocks, -1).mean(axis=1)
+    U = 1.0 - m4.mean() / (3.0 * m2.mean() ** 2)
+    # Leave-one-block-out estimates
+    m2_j = (m2.sum() - m2) / (n_blocks - 1)
+    m4_j = (m4.sum() - m4) / (n_blocks - 1)
+    U_j = 1.0 - m4_j / (3.0 * m2_j ** 2)
+    return U, np.sqrt((n_blocks - 1) * np.mean((U_j - U_j.mean()) ** 2))
+
+
+class BinderCrossingSearch:
+    """
+    Locate T_c from the crossing of the Binder cumulants of two or more L.
+
+    Parameters:
+        L_values: Lattice sizes; the two largest define the estimate
+        T_low, T_high: Bracket that must contain the crossing
+        n_samples, thermalize, thin: Length of every run
+        simulator: Callable (L, T, seed) -> object with simulate() and
+                   time_series(), by default IsingRG; pass e.g.
+                   functools.partial(IsingRG, d=3) for other models
+
+    Every run is kept as (T, U, error) per L, so later rounds reuse all
+    earlier runs that fall inside the current window.
+    """
+    def __init__(self, L_values=(8, 16, 32), T_low=2.0, T_high=2.6, n_samples=1000,
+                 thermalize=300, thin=1, simulator=None, seed=None):
+        self.L_values = sorted(L_values)
+        self.T_low, self.T_high = T_low, T_high
+        self.n_samples, self.thermalize, self.thin = n_samples, thermalize, thin
+        self.simulator = simulator or (lambda L, T, seed: IsingRG(L=L, T=T, seed=seed))
+        self.seeds = np.random.SeedSequence(seed)
+        self.runs = {L: [] for L in self.L_values}
+        self.sweeps = 0
+        self.site_updates = 0
+
+    def measure(self, L, T):
+        """One run at (L, T); returns and records (T, U, error)."""
+        sim = self.simulator(L=L, T=T, seed=self.seeds.spawn(1)[0])
+        sim.simulate(steps=self.thermalize)
+        _, M = sim.time_series(self.n_samples, thin=self.thin)
+        sweeps = self.thermalize + self.n_samples * self.thin
+        self.sweeps += sweeps
+        self.site_updates += sweeps * sim.lattice.size
+        run = (T,) + binder_cumulant(M)
+        self.runs[L].append(run)
+        return run
+
+    def fit(self, L, T_center, width):
+        """
+        Weighted linear fit U = a + b (T - T_center) to the runs within
+        width of T_center. Returns the coefficients and their covariance.
+        """
+        T, U, err = np.array([run for run in self.runs[L]
+                              if abs(run[0] - T_center) <= width]).T
+        if len(np.unique(T)) < 2:
+            raise ValueError(f"L={L} needs runs at two temperatures near {T_center}")
+        X = np.column_stack([np.ones_like(T), T - T_center]) / err[:, None]
+        cov = np.linalg.inv(X.T @ X)
+        return cov @ X.T @ (U / err), cov
+
+    def crossing(self, L_a, L_b, T_center, width):
+        """Crossing temperature of two linear fits and its propagated error."""
+        (a_i, b_i), C_i = self.fit(L_a, T_center, width)
+        (a_j, b_j), C_j = self.fit(L_b, T_center, width)
+        D = b_j - b_i
+        x = (a_i - a_j) / D
+        g = np.array([1.0 / D, x / D])
+        return T_center + x, np.sqrt(g @ C_i @ g + g @ C_j @ g)
+
+    def bracket_crossing(self, T_grid):
+        """First sign change of U_a - U_b of the two largest L on a common grid."""
+        L_a, L_b = self.L_values[-2:]
+        U = {L: np.array([self.measure(L, T)[1] for T in T_grid]) for L in (L_a, L_b)}
+        diff = U[L_a] - U[L_b]
+        change = np.flatnonzero(np.sign(diff[:-1]) != np.sign(diff[1:]))
+        if not change.size:
+            raise ValueError(f"Binder cumulants of L={L_a} and L={L_b} do not cross "
+                             f"in [{self.T_low}, {self.T_high}]")
+        k = change[0]
+        return T_grid[k] + (T_grid[k + 1] - T_grid[k]) * diff[k] / (diff[k] - diff[k + 1])
+
+    def run(self, tol=2e-3, n_initial=4, max_rounds=12):
+        """
+        Coarse grid first, then rounds of three new temperatures per L at
+        T_c and T_c +- width / 2, each followed by a refit. An estimate
+        inside the window is accepted and the window halves (never below
+        4 sigma); one outside only moves the window towards it. Stops once
+        an accepted estimate has sigma < tol.
+
+        Returns a dict with T_c, error, converged, crossings (every pair of
+        consecutive L), history (T_c, error, width per round), sweeps,
+        site_updates (the cost measure across different L) and n_runs.
+        """
+        T_grid = np.linspace(self.T_low, self.T_high, n_initial)
+        for L in self.L_values[:-2]:
+            for T in T_grid:
+                self.measure(L, T)
+        T_c = self.bracket_crossing(T_grid)
+        width = T_grid[1] - T_grid[0]
+        history, converged = [], False
+        for _ in range(max_rounds):
+            for T in (T_c - width / 2, T_c, T_c + width / 2):
+                for L in self.L_values:
+                    self.measure(L, T)
+            estimate, sigma = self.crossing(*self.L_values[-2:], T_c, width)
+            history.append((estimate, sigma, width))
+            if abs(estimate - T_c) > width / 2:
+                # The linear fit is not trustworthy that far out: move
+                # towards the estimate, keep the window
+                T_c = float(np.clip(estimate, T_c - width / 2, T_c + width / 2))
+                continue
+            T_c = float(estimate)
+            if sigma < tol:
+                converged = True
+                break
+            width = max(width / 2, 4 * sigma)
+        crossings = {}
+        for L_a, L_b in zip(self.L_values[:-1], self.L_values[1:]):
+            try:
+                crossings[(L_a, L_b)] = self.crossing(L_a, L_b, T_c, width)
+            except ValueError:
+                pass
+        return {
+            "T_c": T_c,
+            "error": history[-1][1],
+            "converged": converged,
+            "crossings": crossings,
+            "history": np.array(history),
+            "sweeps": self.sweeps,
+            "site_updates": self.site_updates,
+            "n_runs": sum(len(runs) for runs in self.runs.values()),
+        }
+
+
+# Default stage parameters of plot_rg_flow; T slightly above Tc = 2.269 so
+# the snapshots show a large but finite correlation length
+RG_FLOW_CONFIG = {
+    "simulate": {"L": 128, "T": 2.3, "steps": 1500, "seed": None},
+    "coarse_grain": {"levels": 2, "block_size": 2, "seed": None},
+    "render": {},
+}
+
+
+def thermalized_lattice(L=128, T=2.3, steps=1500, seed=None):
+    """Lattice after `steps` checkerboard sweeps from a random start."""
+    sim = IsingRG(L=L, T=T, seed=seed)
     print("Equilibrating system near critical point (this may take a few seconds)...")
-    sim.simulate(steps=1500)  # Ensure proper thermalization
-    
-    original = sim.lattice
-    # First renormalization step
-    rg_1 = sim.coarse_grain(block_size=2)
-    
-    # Prepare for second renormalization step by creating a new instance
-    # For demonstration simplicity, we directly process rg_1
+    sim.simulate(steps=steps)  # Ensure proper thermalization
+    return sim.lattice.copy()
+
+
+def coarse_grain_levels(lattice, levels=2, block_size=2, seed=None):
+    """The lattice followed by `levels` block-spin steps."""
     # Note: Actually evolution should be under the renormalized Hamiltonian
     # This shows configuration space flow through "snapshots"
-    rg_2_dummy = IsingRG(L=64, T=2.3) 
-    rg_2_dummy.lattice = rg_1
-    rg_final = rg_2_dummy.coarse_grain(block_size=2)  # Equivalent to 4x4 blocks in original lattice
-    
-    # Visualization
-    fig, axes = plt.subplots(1, 3, figsize=(18, 6))
+    pipeline = RGPipeline(lattice.shape, block_size=block_size, levels=levels, seed=seed)
+    return [level.copy() for _, level in pipeline.pyramid(lattice)]
+
+
+def compute_observable_flow(L=64, T=2.27, n_samples=200, thin=5, thermalize=500,
+                            seed=None):
+    """Per-level RG observables averaged over a stream of configurations."""
+    sim = IsingRG(L=L, T=T, seed=seed)
+    sim.simulate(steps=thermalize)
+    flow = RGPipeline(sim.lattice.shape, seed=seed).observe(sim.stream(n_samples, thin))
+    return {name: values if name == "scale" else values.mean(axis=0)
+            for name, values in flow.items()}
+
+
+@figure_style('dark_background')
+def render_rg_flow(levels, block_size=2, options=None):
+    """Draw the lattice and its block-spin levels side by side."""
+    import matplotlib.pyplot as plt
+    from matplotlib import colors
+
+    fig, axes = plt.subplots(1, len(levels), figsize=(6 * len(levels), 6), squeeze=False)
     # Use dark purple/yellow colormap for high contrast and dark theme compatibility
     cmap = colors.ListedColormap(['#440154', '#fde725']) 
     
-    axes[0].imshow(original, cmap=cmap, interpolation='nearest')
-    axes[0].set_title(f"Original Lattice ({128}x{128})\nMicroscopic Fluctuations", color='white')
-    axes[0].axis('off')
-    
-    axes[1].imshow(rg_1, cmap=cmap, interpolation='nearest')
-    axes[1].set_title(f"First RG Step (b=2)\n{64}x{64}", color='white')
-    axes[1].axis('off')
-    
-    axes[2].imshow(rg_final, cmap=cmap, interpolation='nearest')
-    axes[2].set_title(f"Second RG Step (b=4)\n{32}x{32}", color='white')
-    axes[2].axis('off')
+    for level, (ax, lattice) in enumerate(zip(axes[0], levels)):
+        n = lattice.shape[0]
+        ax.imshow(lattice, cmap=cmap, interpolation='nearest')
+        if level == 0:
+            ax.set_title(f"Original Lattice ({n}x{n})\nMicroscopic Fluctuations", color='white')
+        else:
+            ax.set_title(f"RG Step {level} (b={block_size ** level})\n{n}x{n}", color='white')
+        ax.axis('off')
     
     plt.suptitle("Real-Space Renormalization Group Flow: Emergence of Macroscopic Order", 
                  fontsize=16, color='white', y=1.05)
     plt.tight_layout()
-    plt.show()
+    return finish_figure(fig, "ising_rg_flow", options, bbox_inches="tight")
+
+
+def plot_rg_flow(options=None, cache=None, config=None):
+    """
+    Snapshot figure as a memoized simulate -> coarse_grain -> render
+    experiment: with a StageCache, the 1500 thermalization sweeps run only
+    when the simulate parameters change.
+    """
+    options = options or RenderOptions()
+    config = load_config(config or RG_FLOW_CONFIG)
+    config["render"]["block_size"] = config["coarse_grain"]["block_size"]
+    config["render"]["output"] = {"dpi": options.dpi, "fmt": options.fmt,
+                                  "output_dir": options.output_dir, "plot": options.plot}
+
+    def render(levels, block_size, output):
+        if not options.plot:
+            return save_data("ising_rg_flow", options, original=levels[0],
+                             rg_1=levels[1], rg_final=levels[-1])
+        return render_rg_flow(levels, block_size, options)
+
+    # Compute keys cover the model and the sweep kernels it calls, so a
+    # change to the dynamics reruns the thermalization
+    experiment = Experiment([Stage("simulate", thermalized_lattice,
+                                   code=(IsingRG, disorder, kernels)),
+                             Stage("coarse_grain", coarse_grain_levels, code=(RGPipeline,)),
+                             # An interactive figure must be shown every time
+                             Stage("render", render, produces_files=True,
+                                   code=(render_rg_flow,), cacheable=options.batch)],
+                            cache=cache)
+    return experiment.run(config)["render"]
 
 if __name__ == "__main__":
-    plot_rg_flow()
+    parser = argparse.ArgumentParser(description="2D Ising model RG flow snapshots")
+    # Like the original script, an interactive run only shows the figure
+    add_render_arguments(parser, default_output_dir=None)
+    add_cache_arguments(parser)
+    args = parser.parse_args()
+    plot_rg_flow(options_from_args(args), cache_from_args(args),
+                 load_config(RG_FLOW_CONFIG, args.config))
@@ -6,12 +6,20 @@ Run this script after TERP has completed optimization. It will output three figu
 3. bc_terp_feature_importance.png    — Important features bar chart
 """
 
+import argparse
+import os
+import sys
+
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib import cm
-from sklearn.datasets import load_breast_cancer
 
-plt.style.use("dark_background")
+# Shared helpers live one level up in code/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from batch_render import (FigurePool, add_render_arguments, figure_style,  # noqa: E402
+                          finish_figure, options_from_args, save_data)
+
+# matplotlib and scikit-learn are imported inside the plotting functions:
+# the free-energy computations need only NumPy
+PLOT_STYLE = "dark_background"
 
 
 def load_terp_results(
@@ -28,14 +36,103 @@ def load_terp_results(
     except FileNotFoundError:
         # If optimal point file not found, find minimum zeta at fixed theta
         theta0 = 5.0
-        zeta = U + theta0 * S
-        j_star = np.argmin(zeta)
+        j_star = optimal_j_exact(U, S, theta0)
         U_star, S_star = U[j_star], S[j_star]
     return U, S, U_star, S_star
 
 
-def plot_energy_entropy_curve(U, S, U_star, S_star):
+# ============================================================
+# Free-energy computation layer
+# ============================================================
+# Each interpretation j is a straight line zeta_j(theta) = U_j + theta * S_j,
+# so the whole landscape is an outer sum of two vectors. Broadcasting gives
+# it without any repeated copies of U or S, and the optimum j*(theta) is the
+# lower envelope of the lines (convex hull trick). Indices below are 0-based,
+# i.e. index j corresponds to j + 1 features.
+
+def free_energy_grid(U, S, theta_vals):
+    """zeta_j(theta) on a (n_j, n_theta) grid via broadcasting."""
+    U = np.asarray(U, dtype=float)
+    S = np.asarray(S, dtype=float)
+    theta_vals = np.asarray(theta_vals, dtype=float)
+    return U[:, None] + theta_vals[None, :] * S[:, None]
+
+
+def optimal_j_grid(U, S, theta_vals, chunk_size=4096):
+    """
+    Brute-force argmin_j zeta_j(theta) over a theta grid.
+
+    The grid is processed in chunks of theta so that memory stays at
+    n_j * chunk_size even for very fine grids.
+    """
+    theta_vals = np.atleast_1d(np.asarray(theta_vals, dtype=float))
+    j_star = np.empty(theta_vals.shape[0], dtype=np.intp)
+    for start in range(0, theta_vals.shape[0], chunk_size):
+        stop = start + chunk_size
+        zeta = free_energy_grid(U, S, theta_vals[start:stop])
+        j_star[start:stop] = np.argmin(zeta, axis=0)
+    return j_star
+
+
+def lower_envelope(U, S):
+    """
+    Lower envelope of the lines zeta_j(theta) = U_j + theta * S_j.
+
+    Returns:
+        hull: Line indices on the envelope, ordered by increasing theta
+        breaks: hull[k] is optimal on [breaks[k-1], breaks[k]);
+                len(breaks) == len(hull) - 1
+    """
+    U = np.asarray(U, dtype=float)
+    S = np.asarray(S, dtype=float)
+    # As theta grows the optimal line has ever smaller slope, so sort by
+    # slope descending; for equal slopes the smallest intercept comes first
+    order = np.lexsort((np.arange(U.shape[0]), U, -S))
+
+    hull, breaks = [], []
+    for j in order:
+        if hull and S[hull[-1]] == S[j]:
+            continue  # Parallel and not lower: never optimal
+        while hull:
+            i = hull[-1]
+            x = (U[j] - U[i]) / (S[i] - S[j])  # Where line j overtakes line i
+            if breaks and x <= breaks[-1]:
+                hull.pop()
+                breaks.pop()
+            else:
+                break
+        if hull:
+            breaks.append((U[j] - U[hull[-1]]) / (S[hull[-1]] - S[j]))
+        hull.append(j)
+    return np.array(hull, dtype=np.intp), np.array(breaks, dtype=float)
+
+
+def optimal_j_exact(U, S, theta_vals):
+    """Exact argmin_j zeta_j(theta) from the lower envelope, O((n + m) log n)."""
+    hull, breaks = lower_envelope(U, S)
+    idx = np.searchsorted(breaks, theta_vals, side="right")
+    return hull[idx]
+
+
+def theta_transitions(U, S, theta_min=0.0, theta_max=np.inf):
+    """
+    "Phase transition" points where the optimal j* jumps.
+
+    Returns:
+        theta_c: Transition temperatures in [theta_min, theta_max]
+        j_before, j_after: Optimal indices just below and above each theta_c
+    """
+    hull, breaks = lower_envelope(U, S)
+    mask = (breaks >= theta_min) & (breaks <= theta_max)
+    k = np.nonzero(mask)[0]
+    return breaks[k], hull[k], hull[k + 1]
+
+
+@figure_style(PLOT_STYLE)
+def plot_energy_entropy_curve(U, S, U_star, S_star, options=None):
     """Energy-Entropy trajectory, analogous to RG flow."""
+    import matplotlib.pyplot as plt
+
     j_axis = np.arange(1, len(U) + 1)
 
     fig, ax = plt.subplots(figsize=(7, 5))
@@ -61,25 +158,26 @@ def plot_energy_entropy_curve(U, S, U_star, S_star):
     ax.legend(frameon=False)
 
     plt.tight_layout()
-    plt.savefig("bc_terp_energy_entropy_curve.png", dpi=300,
-                bbox_inches="tight")
-    plt.show()
+    return finish_figure(fig, "bc_terp_energy_entropy_curve", options,
+                         bbox_inches="tight")
 
 
+@figure_style(PLOT_STYLE)
 def plot_free_energy_surface(U, S,
-                             theta_min=0.0, theta_max=8.0, n_theta=80):
+                             theta_min=0.0, theta_max=8.0, n_theta=80,
+                             options=None):
     """3D free energy landscape: zeta_j(theta) = U_j + theta * S_j."""
+    import matplotlib.pyplot as plt
+    from matplotlib import cm
+
     U = np.asarray(U)
     S = np.asarray(S)
     j_axis = np.arange(1, len(U) + 1)
 
     theta_vals = np.linspace(theta_min, theta_max, n_theta)
-    Theta, J = np.meshgrid(theta_vals, j_axis)
-
-    U_rep = np.repeat(U.reshape(-1, 1), n_theta, axis=1)
-    S_rep = np.repeat(S.reshape(-1, 1), n_theta, axis=1)
-
-    Z = U_rep + Theta * S_rep  # zeta_j(theta)
+    Z = free_energy_grid(U, S, theta_vals)  # zeta_j(theta)
+    # Read-only broadcast views instead of meshgrid copies
+    Theta, J = np.broadcast_arrays(theta_vals[None, :], j_axis[:, None])
 
     fig = plt.figure(figsize=(9, 6))
     ax = fig.add_subplot(111, projection="3d")
@@ -101,13 +199,16 @@ def plot_free_energy_surface(U, S,
     ax.grid(alpha=0.15)
 
     plt.tight_layout()
-    plt.savefig("bc_terp_free_energy_landscape.png", dpi=300,
-                bbox_inches="tight")
-    plt.show()
+    return finish_figure(fig, "bc_terp_free_energy_landscape", options,
+                         bbox_inches="tight")
 
 
-def plot_feature_importance():
+@figure_style(PLOT_STYLE)
+def plot_feature_importance(options=None):
     """Plot bar chart of important features selected by TERP, with medical meaning."""
+    import matplotlib.pyplot as plt
+    from sklearn.datasets import load_breast_cancer
+
     data = load_breast_cancer()
     feature_names = data.feature_names
     w = np.load("TERP_results_2/optimal_feature_weights.npy")
@@ -124,13 +225,35 @@ def plot_feature_importance():
     ax.set_xlabel("Absolute weight (importance)")
     ax.set_title("Top TERP Features (Breast Cancer)")
     plt.tight_layout()
-    plt.savefig("bc_terp_feature_importance.png", dpi=300,
-                bbox_inches="tight")
-    plt.show()
+    return finish_figure(fig, "bc_terp_feature_importance", options,
+                         bbox_inches="tight")
+
+
+def save_free_energy_data(U, S, U_star, S_star, options=None,
+                          theta_min=0.0, theta_max=8.0, n_theta=80):
+    """Data-only output: the landscape, j*(theta) and its transition points."""
+    theta_vals = np.linspace(theta_min, theta_max, n_theta)
+    theta_c, j_before, j_after = theta_transitions(U, S, theta_min, theta_max)
+    return save_data(
+        "bc_terp_free_energy", options,
+        U=U, S=S, U_star=U_star, S_star=S_star,
+        theta=theta_vals, zeta=free_energy_grid(U, S, theta_vals),
+        j_star=optimal_j_exact(U, S, theta_vals),
+        theta_c=theta_c, j_before=j_before, j_after=j_after,
+        feature_weights=np.load("TERP_results_2/optimal_feature_weights.npy"),
+    )
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="TERP free-energy figures")
+    add_render_arguments(parser)
+    options = options_from_args(parser.parse_args())
+
     U, S, U_star, S_star = load_terp_results()
-    plot_energy_entropy_curve(U, S, U_star, S_star)
-    plot_free_energy_surface(U, S, theta_min=0.0, theta_max=8.0, n_theta=80)
-    plot_feature_importance()
+    if not options.plot:
+        save_free_energy_data(U, S, U_star, S_star, options)
+    with FigurePool(options) as pool:
+        pool.submit(plot_energy_entropy_curve, U, S, U_star, S_star, options)
+        pool.submit(plot_free_energy_surface, U, S, theta_min=0.0,
+                    theta_max=8.0, n_theta=80, options=options)
+        pool.submit(plot_feature_importance, options)
@@ -2,181 +2,189 @@
 Lecture 4 Practice Code: 3D Percolation Phase Transition Analysis and Visualization
 ================================================================
 Features:
-1. Monte Carlo simulation of 3D site percolation
+1. Monte Carlo simulation of 3D site percolation (plus bond and site-bond
+   percolation on square, triangular, cubic, BCC and FCC lattices)
 2. Order parameter and susceptibility calculation with finite-size scaling analysis
 3. Data collapse to verify universality class membership
 4. Generate 3D visualization GIF of percolation cluster evolution
+5. Fractal dimension (mass, mass-radius, box counting) and chemical-distance
+   exponent of the largest cluster (see cluster_geometry.py)
 
 Author: Renormalization Group Lecture Series Companion Code
 ================================================================
 """
 
 import numpy as np
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D
-from collections import defaultdict
-import matplotlib.animation as animation
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from functools import lru_cache
+import argparse
 import os
 
-# Set plotting style
-plt.style.use('dark_background')
-plt.rcParams['font.family'] = 'DejaVu Sans'
-plt.rcParams['mathtext.fontset'] = 'dejavusans'
-
-# ============================================================
-# Part 1: Union-Find Data Structure
-# ============================================================
-# Union-Find is an efficient data structure for handling connectivity problems.
-# In percolation problems, we need to quickly determine whether two sites
-# belong to the same cluster and merge clusters when adding new connections.
-# With path compression and union by rank optimization, each operation has
-# amortized time complexity close to O(1).
-
-class UnionFind:
-    """
-    Union-Find data structure for efficient connected component computation.
-    """
-    def __init__(self, n):
-        # parent[i] stores the parent node of node i
-        # Initially each node is its own parent (i.e., each node forms a separate cluster)
-        self.parent = list(range(n))
-        # size[i] stores the size of the tree rooted at node i
-        self.size = [1] * n
-        # Track the current number of connected components
-        self.n_components = n
-    
-    def find(self, x):
-        """
-        Find the root node of the cluster containing node x.
-        Uses path compression optimization: directly connect all visited nodes to the root.
-        """
-        if self.parent[x] != x:
-            self.parent[x] = self.find(self.parent[x])  # Path compression
-        return self.parent[x]
-    
-    def union(self, a, b):
-        """
-        Merge the clusters containing nodes a and b.
-        Uses union by rank optimization: attach smaller tree to larger tree for balance.
-        """
-        ra, rb = self.find(a), self.find(b)
-        if ra == rb:
-            return False  # Already in the same cluster
-        # Attach smaller tree to larger tree
-        if self.size[ra] < self.size[rb]:
-            ra, rb = rb, ra
-        self.parent[rb] = ra
-        self.size[ra] += self.size[rb]
-        self.n_components -= 1
-        return True
-    
-    def get_cluster_sizes(self):
-        """Get all cluster sizes, sorted in descending order"""
-        cnt = defaultdict(int)
-        for i in range(len(self.parent)):
-            root = self.find(i)
-            cnt[root] += 1
-        sizes = sorted(cnt.values(), reverse=True)
-        return sizes
-    
-    def get_cluster_labels(self):
-        """
-        Return the cluster label for each node.
-        Labels are sorted by cluster size: largest cluster has label 0, second largest has label 1, etc.
-        """
-        cluster_map = defaultdict(list)
-        for i in range(len(self.parent)):
-            root = self.find(i)
-            cluster_map[root].append(i)
-        
-        # Sort clusters by size in descending order
-        sorted_clusters = sorted(cluster_map.values(), key=len, reverse=True)
-        labels = np.zeros(len(self.parent), dtype=int)
-        for label, cluster in enumerate(sorted_clusters):
-            for node in cluster:
-                labels[node] = label
-        return labels
+from batch_render import (FigurePool, RenderOptions, add_render_arguments,
+                          figure_style, finish_figure, options_from_args, save_data)
+from cluster_geometry import box_counting, fit_power_law, mass_radius, spanning_length
+# Connected components: compiled union-find if numba is available, else
+# vectorized hook-and-compress
+import kernels
+from kernels import find_roots
+from shared_buffers import SharedBufferPool
+from stage_cache import (Experiment, Stage, add_cache_arguments, cache_from_args,
+                         load_config)
 
+# Plotting style, applied by figure_style only while a figure is drawn, so
+# importing this module loads neither matplotlib nor changes its settings
+PLOT_STYLE = 'dark_background'
+PLOT_RC = {'font.family': 'DejaVu Sans', 'mathtext.fontset': 'dejavusans'}
 
 # ============================================================
-# Part 2: 3D Site Percolation Core Simulation Functions
+# Part 1: 3D Site Percolation Core Simulation Functions
 # ============================================================
 # 3D site percolation model: on an L x L x L cubic lattice, each site is
 # "occupied" with probability p. If two adjacent sites are both occupied,
 # they belong to the same connected cluster. When p exceeds the critical
 # probability p_c = 0.3116, a macroscopic cluster spanning the entire
 # system (percolating cluster) emerges.
+#
+# The same machinery handles other lattices and percolation modes:
+# - site:      sites occupied with probability p, all bonds between them open
+# - bond:      every site present, each bond open with probability p
+# - site-bond: sites occupied with probability p, bonds between occupied
+#              sites open with probability p_bond
+# Lattices are described by neighbour-offset tables in primitive (integer)
+# coordinates, listing one direction of every nearest-neighbour bond.
+
+LATTICES = {
+    # 2D
+    'square': [(1, 0), (0, 1)],
+    'triangular': [(1, 0), (0, 1), (1, -1)],
+    # 3D
+    'cubic': [(1, 0, 0), (0, 1, 0), (0, 0, 1)],
+    'bcc': [(1, 0, 0), (0, 1, 0), (0, 0, 1), (1, 1, 1)],
+    'fcc': [(1, 0, 0), (0, 1, 0), (0, 0, 1), (1, -1, 0), (1, 0, -1), (0, 1, -1)],
+}
 
-def generate_percolation_config(L, p):
+
+@lru_cache(maxsize=16)
+def lattice_bonds(L, lattice='cubic', periodic=False):
     """
-    Generate a 3D site percolation configuration and compute connected clusters.
+    All nearest-neighbour bonds of an L^d lattice as two index arrays.
+    
+    Sites are numbered in C order, e.g. idx = x*L*L + y*L + z in 3D.
+    With open boundaries, bonds leaving the box are dropped.
+    
+    Returns:
+        bond_a, bond_b: Read-only int arrays, bond k joins bond_a[k]-bond_b[k]
+    """
+    offsets = np.array(LATTICES[lattice])
+    d = offsets.shape[1]
+    coords = np.indices((L,) * d).reshape(d, -1)
+    sites = np.arange(L ** d)
+    bond_a, bond_b = [], []
+    for offset in offsets:
+        neighbour = coords + offset[:, None]
+        if periodic:
+            neighbour %= L
+            keep = slice(None)
+        else:
+            keep = np.all((neighbour >= 0) & (neighbour < L), axis=0)
+        bond_a.append(sites[keep])
+        bond_b.append(np.ravel_multi_index(neighbour[:, keep], (L,) * d))
+    bond_a, bond_b = np.concatenate(bond_a), np.concatenate(bond_b)
+    bond_a.flags.writeable = False
+    bond_b.flags.writeable = False
+    return bond_a, bond_b
+
+
+def label_clusters(occupied, bond_a, bond_b, bond_open=None):
+    """
+    Shared labelling core for every lattice and percolation mode.
     
     Parameters:
-        L: Linear size of the cubic lattice
-        p: Occupation probability
+        occupied: Boolean array, which sites take part
+        bond_a, bond_b: Candidate bonds (see lattice_bonds)
+        bond_open: Optional boolean array, which bonds are open
+    
+    Returns:
+        cluster_labels: Label per site ranked by size (largest cluster is 0),
+                        -1 for unoccupied sites
+        sizes: Array of all cluster sizes (descending order)
+    """
+    N = occupied.shape[0]
+    active = occupied[bond_a] & occupied[bond_b]
+    if bond_open is not None:
+        active &= bond_open
+    root = find_roots(N, bond_a[active], bond_b[active])
+    
+    # Cluster sizes in one O(N) pass: count sites per root
+    occupied_roots = root[occupied]
+    counts = np.bincount(occupied_roots, minlength=N)
+    roots = np.flatnonzero(counts)
+    sizes = counts[roots]
+    
+    # Rank clusters by size in descending order
+    order = np.argsort(-sizes, kind='stable')
+    rank_of_root = np.full(N, -1, dtype=int)
+    rank_of_root[roots[order]] = np.arange(order.shape[0])
+    cluster_labels = np.full(N, -1, dtype=int)
+    cluster_labels[occupied] = rank_of_root[occupied_roots]
+    return cluster_labels, sizes[order]
+
+
+def generate_percolation_config(L, p, lattice='cubic', mode='site',
+                                p_bond=None, periodic=False, rng=None):
+    """
+    Generate a percolation configuration and compute connected clusters.
+    
+    Parameters:
+        L: Linear size of the lattice
+        p: Occupation probability (bond probability in 'bond' mode)
+        lattice: Key of LATTICES ('cubic', 'bcc', 'fcc', 'square', 'triangular')
+        mode: 'site', 'bond' or 'site-bond'
+        p_bond: Bond probability, required in 'site-bond' mode
+        periodic: Periodic instead of open boundaries
+        rng: Optional numpy Generator (default: the global np.random state)
     
     Returns:
         occupied: Boolean array indicating whether each site is occupied
         cluster_labels: Cluster label for each site (unoccupied sites have label -1)
         S1: Order parameter (relative size of largest cluster)
         chi: Susceptibility (second moment excluding largest cluster)
-        sizes: List of all cluster sizes (descending order)
-    """
-    N = L * L * L
-    # Randomly decide whether each site is occupied
-    occupied = np.random.random(N) < p
-    n_occupied = np.sum(occupied)
-    
-    # If no sites are occupied, return zero values
-    if n_occupied == 0:
-        return occupied, np.full(N, -1, dtype=int), 0, 0, []
-    
-    # Build index mapping for occupied sites
-    # index_map: original index -> compressed index
-    # reverse_map: compressed index -> original index
-    occupied_indices = np.where(occupied)[0]
-    index_map = {old: new for new, old in enumerate(occupied_indices)}
-    reverse_map = {new: old for old, new in index_map.items()}
-    
-    # Build edge list: connect adjacent occupied sites
-    edges = []
-    for idx in occupied_indices:
-        # Convert 1D index to 3D coordinates
-        x, y, z = idx // (L*L), (idx // L) % L, idx % L
-        # Check three positive direction neighbors
-        for dx, dy, dz in [(1, 0, 0), (0, 1, 0), (0, 0, 1)]:
-            nx, ny, nz = x + dx, y + dy, z + dz
-            if nx < L and ny < L and nz < L:
-                nidx = nx * L * L + ny * L + nz
-                if occupied[nidx]:
-                    edges.append((index_map[idx], index_map[nidx]))
-    
-    # Use Union-Find to compute connected components
-    uf = UnionFind(n_occupied)
-    for a, b in edges:
-        uf.union(a, b)
-    
-    sizes = uf.get_cluster_sizes()
-    cluster_labels_occupied = uf.get_cluster_labels()
-    
-    # Map labels back to original index space
-    cluster_labels = np.full(N, -1, dtype=int)
-    for new_idx, old_idx in reverse_map.items():
-        cluster_labels[old_idx] = cluster_labels_occupied[new_idx]
+        sizes: Array of all cluster sizes (descending order)
+    """
+    random = np.random.random if rng is None else rng.random
+    bond_a, bond_b = lattice_bonds(L, lattice, periodic)
+    N = L ** len(LATTICES[lattice][0])
+    
+    if mode == 'site':
+        # Randomly decide whether each site is occupied
+        occupied = random(N) < p
+        bond_open = None
+    elif mode == 'bond':
+        occupied = np.ones(N, dtype=bool)
+        bond_open = random(bond_a.shape[0]) < p
+    elif mode == 'site-bond':
+        if p_bond is None:
+            raise ValueError("'site-bond' mode needs a bond probability p_bond")
+        occupied = random(N) < p
+        bond_open = random(bond_a.shape[0]) < p_bond
+    else:
+        raise ValueError(f"unknown percolation mode: {mode!r}")
+    
+    cluster_labels, sizes = label_clusters(occupied, bond_a, bond_b, bond_open)
     
     # Compute physical quantities
     # Order parameter S1: fraction of total sites in largest cluster
-    s1 = sizes[0] if sizes else 0
+    s1 = sizes[0] if len(sizes) else 0
     S1 = s1 / N
     
     # Susceptibility chi: second moment excluding largest cluster
     # This measures fluctuations in "typical cluster size"
-    chi = sum(s**2 for s in sizes[1:]) / N if len(sizes) > 1 else 0
+    chi = np.sum(sizes[1:].astype(float) ** 2) / N if len(sizes) > 1 else 0
     
     return occupied, cluster_labels, S1, chi, sizes
 
 
-def compute_observables(L, p, n_samples=50):
+def compute_observables(L, p, n_samples=50, histogram=None, **config_kwargs):
     """
     Perform Monte Carlo sampling for given parameters, return mean and standard error of observables.
     
@@ -184,6 +192,8 @@ def compute_observables(L, p, n_samples=50):
         L: System linear size
         p: Occupation probability
         n_samples: Number of Monte Carlo samples
+        histogram: Optional ClusterSizeHistogram fed with every sample
+        config_kwargs: Lattice/mode/boundary options for generate_percolation_config
     
     Returns:
         S1_mean, chi_mean: Mean values of observables
@@ -192,7 +202,9 @@ def compute_observables(L, p, n_samples=50):
     S1_list, chi_list = [], []
     
     for _ in range(n_samples):
-        _, _, S1, chi, _ = generate_percolation_config(L, p)
+        occupied, _, S1, chi, sizes = generate_percolation_config(L, p, **config_kwargs)
+        if histogram is not None:
+            histogram.add(sizes, occupied.shape[0])
         S1_list.append(S1)
         chi_list.append(chi)
     
@@ -201,6 +213,168 @@ def compute_observables(L, p, n_samples=50):
             np.std(chi_list)/np.sqrt(n_samples))
 
 
+# Multi-process generation: workers write configurations into shared
+# memory (see shared_buffers.py), so a large L costs no pickling
+
+def config_into_slot(handle, slot, L, p, seed, lattice='cubic', mode='site',
+                     p_bond=None, periodic=False):
+    """
+    Worker job: generate one configuration and write occupied and
+    cluster_labels into `slot` of the shared pool. Only S1, chi and the
+    number of clusters are returned through the pipe.
+    """
+    views = SharedBufferPool.attach(handle).views(slot)
+    occupied, labels, S1, chi, sizes = generate_percolation_config(
+        L, p, lattice, mode, p_bond, periodic, rng=np.random.default_rng(seed))
+    views['occupied'][...] = occupied
+    views['cluster_labels'][...] = labels
+    return {'p': p, 'S1': S1, 'chi': chi, 'n_clusters': len(sizes)}
+
+
+def stream_percolation_configs(L, p_values, n_samples=1, workers=None, n_slots=None,
+                               seed=None, lattice='cubic', mode='site', p_bond=None,
+                               periodic=False):
+    """
+    Generate n_samples configurations per p in a process pool and yield
+    (info, occupied, cluster_labels) as they finish. The arrays are
+    zero-copy views of a shared slot (labels as int32), recycled when the
+    next item is requested; at most n_slots (default 2 * workers)
+    configurations are in flight, so a slow consumer throttles the workers.
+    """
+    workers = workers or os.cpu_count()
+    N = L ** len(LATTICES[lattice][0])
+    layout = {'occupied': ((N,), np.bool_), 'cluster_labels': ((N,), np.int32)}
+    ps = [p for p in p_values for _ in range(n_samples)]
+    seeds = np.random.SeedSequence(seed).spawn(len(ps))
+    jobs = [(L, p, s, lattice, mode, p_bond, periodic) for p, s in zip(ps, seeds)]
+    with SharedBufferPool(layout, n_slots or 2 * workers) as buffers, \
+            ProcessPoolExecutor(max_workers=workers) as executor:
+        for _, views, info in buffers.imap(config_into_slot, jobs, executor):
+            yield info, views['occupied'], views['cluster_labels']
+
+
+# ============================================================
+# Part 2: Cluster-Size Distribution n_s(p)
+# ============================================================
+# n_s is the number of clusters of size s per lattice site. At p_c it decays
+# as a power law n_s ~ s^(-tau) (Fisher exponent, tau = 2.19 in 3D); away from
+# p_c it is cut off at a characteristic size s_xi ~ |p - p_c|^(-1/sigma).
+# Storing every cluster size of every sample is impossible for large runs,
+# so sizes are streamed into logarithmic bins: memory is O(number of bins)
+# no matter how many samples are accumulated, and histograms from different
+# workers can simply be added together.
+
+class ClusterSizeHistogram:
+    """
+    Streaming, log-binned cluster-size histogram.
+    
+    Bins are integer ranges [edges[k], edges[k+1]) spaced evenly in log s,
+    so small sizes keep unit resolution while large sizes share wide bins.
+    """
+    def __init__(self, max_size, bins_per_decade=10):
+        n_edges = int(np.ceil(np.log10(max_size + 1) * bins_per_decade)) + 1
+        edges = np.floor(np.logspace(0, np.log10(max_size + 1), n_edges))
+        self.edges = np.unique(np.append(edges.astype(np.int64), max_size + 1))
+        self.counts = np.zeros(self.edges.shape[0] - 1, dtype=np.int64)
+        self.n_sites = 0      # Total number of lattice sites accumulated
+        self.n_samples = 0
+    
+    def add(self, sizes, n_sites, exclude_largest=False):
+        """
+        Accumulate the cluster sizes of one configuration.
+        
+        Parameters:
+            sizes: Cluster sizes in descending order (as from label_clusters)
+            n_sites: Number of lattice sites of the configuration
+            exclude_largest: Drop the largest (possibly spanning) cluster
+        
+        Raises ValueError if a cluster is larger than max_size, e.g. when a
+        histogram sized for one L is fed a larger lattice.
+        """
+        sizes = np.asarray(sizes)
+        if exclude_largest:
+            sizes = sizes[1:]
+        if sizes.shape[0]:
+            if sizes.max() >= self.edges[-1]:
+                raise ValueError(f"cluster of size {sizes.max()} exceeds the histogram's "
+                                 f"max_size = {self.edges[-1] - 1}")
+            bins = np.searchsorted(self.edges, sizes, side='right') - 1
+            self.counts += np.bincount(bins, minlength=self.counts.shape[0])
+        self.n_sites += n_sites
+        self.n_samples += 1
+    
+    def merge(self, other):
+        """Add the counts of another histogram with identical bins (e.g. from a worker)."""
+        if not np.array_equal(self.edges, other.edges):
+            raise ValueError("cannot merge histograms with different bins")
+        self.counts += other.counts
+        self.n_sites += other.n_sites
+        self.n_samples += other.n_samples
+        return self
+    
+    def __iadd__(self, other):
+        return self.merge(other)
+    
+    def distribution(self):
+        """
+        Binned n_s per site.
+        
+        Returns:
+            s: Geometric bin centres
+            n_s: Clusters per site per unit size in each bin
+            n_s_err: Poisson standard errors
+        """
+        width = np.diff(self.edges)
+        s = np.sqrt(self.edges[:-1] * (self.edges[1:] - 1))
+        norm = width * max(self.n_sites, 1)
+        return s, self.counts / norm, np.sqrt(self.counts) / norm
+    
+    def _fit_range(self, s_min, s_max):
+        s, n_s, _ = self.distribution()
+        mask = (self.counts > 0) & (s >= s_min) & (s <= s_max)
+        # Poisson statistics: var(log n_s) = 1 / count
+        return s[mask], n_s[mask], np.sqrt(self.counts[mask])
+    
+    def fit_tau(self, s_min=10, s_max=np.inf):
+        """
+        Fisher exponent from a weighted power-law fit n_s ~ s^(-tau).
+        
+        Returns:
+            tau, tau_err
+        """
+        s, n_s, w = self._fit_range(s_min, s_max)
+        (slope, _), cov = np.polyfit(np.log(s), np.log(n_s), 1, w=w, cov='unscaled')
+        return -slope, np.sqrt(cov[0, 0])
+    
+    def fit_cutoff(self, s_min=10, s_max=np.inf):
+        """
+        Fit n_s = A s^(-tau) exp(-s / s_xi), linear in (log A, tau, 1/s_xi).
+        
+        Returns:
+            tau: Fisher exponent
+            s_xi: Cutoff cluster size (np.inf if no cutoff is visible)
+        """
+        s, n_s, w = self._fit_range(s_min, s_max)
+        design = np.column_stack([np.ones_like(s), -np.log(s), -s]) * w[:, None]
+        coef, *_ = np.linalg.lstsq(design, np.log(n_s) * w, rcond=None)
+        _, tau, inv_s_xi = coef
+        return tau, (1 / inv_s_xi if inv_s_xi > 0 else np.inf)
+
+
+def fit_cutoff_exponent(p_values, s_xi_values, p_c=0.3116):
+    """
+    Cutoff scaling s_xi ~ |p - p_c|^(-1/sigma) from fitted cutoff sizes.
+    
+    Returns:
+        sigma: Cutoff exponent (sigma = 0.45 for 3D percolation)
+    """
+    p_values, s_xi_values = np.asarray(p_values), np.asarray(s_xi_values)
+    mask = np.isfinite(s_xi_values) & (p_values != p_c)
+    slope, _ = np.polyfit(np.log(np.abs(p_values[mask] - p_c)),
+                          np.log(s_xi_values[mask]), 1)
+    return -1 / slope
+
+
 # ============================================================
 # Part 3: 3D Visualization and GIF Generation
 # ============================================================
@@ -208,7 +382,8 @@ def compute_observables(L, p, n_samples=50):
 # as occupation probability p increases from low to high, observe how cluster
 # structure evolves from isolated small dots to a large network spanning the system.
 
-def create_percolation_gif(L=15, p_values=None, output_path='percolation_3d.gif'):
+@figure_style(PLOT_STYLE, PLOT_RC)
+def create_percolation_gif(L=15, p_values=None, output_path='percolation_3d.gif', dpi=100):
     """
     Generate a GIF animation of 3D percolation cluster evolution.
     
@@ -219,7 +394,11 @@ def create_percolation_gif(L=15, p_values=None, output_path='percolation_3d.gif'
         L: System linear size (recommend 10-20, larger is slow)
         p_values: Sequence of occupation probabilities to display
         output_path: Output GIF file path
+        dpi: Resolution of the GIF frames
     """
+    import matplotlib.pyplot as plt
+    import matplotlib.animation as animation
+    
     if p_values is None:
         # Gradual transition from subcritical to supercritical
         p_values = np.linspace(0.15, 0.45, 30)
@@ -242,40 +421,12 @@ def create_percolation_gif(L=15, p_values=None, output_path='percolation_3d.gif'
         
         # Compute cluster structure
         N = L * L * L
-        n_occupied = np.sum(occupied)
         
-        if n_occupied > 0:
-            # Reuse logic from generate_percolation_config
-            occupied_indices = np.where(occupied)[0]
-            index_map = {old: new for new, old in enumerate(occupied_indices)}
-            reverse_map = {new: old for old, new in index_map.items()}
-            
-            edges = []
-            for idx in occupied_indices:
-                x, y, z = idx // (L*L), (idx // L) % L, idx % L
-                for dx, dy, dz in [(1, 0, 0), (0, 1, 0), (0, 0, 1)]:
-                    nx, ny, nz = x + dx, y + dy, z + dz
-                    if nx < L and ny < L and nz < L:
-                        nidx = nx * L * L + ny * L + nz
-                        if occupied[nidx]:
-                            edges.append((index_map[idx], index_map[nidx]))
-            
-            uf = UnionFind(n_occupied)
-            for a, b in edges:
-                uf.union(a, b)
-            
-            sizes = uf.get_cluster_sizes()
-            cluster_labels_occupied = uf.get_cluster_labels()
-            
-            cluster_labels = np.full(N, -1, dtype=int)
-            for new_idx, old_idx in reverse_map.items():
-                cluster_labels[old_idx] = cluster_labels_occupied[new_idx]
-            
-            S1 = sizes[0] / N if sizes else 0
-            chi = sum(s**2 for s in sizes[1:]) / N if len(sizes) > 1 else 0
-        else:
-            cluster_labels = np.full(N, -1, dtype=int)
-            S1, chi = 0, 0
+        # Reuse the labelling core of generate_percolation_config
+        bond_a, bond_b = lattice_bonds(L)
+        cluster_labels, sizes = label_clusters(occupied, bond_a, bond_b)
+        S1 = sizes[0] / N if len(sizes) else 0
+        chi = np.sum(sizes[1:].astype(float) ** 2) / N if len(sizes) > 1 else 0
         
         # Plot occupied sites
         occupied_mask = occupied.reshape(L, L, L)
@@ -349,55 +500,458 @@ def create_percolation_gif(L=15, p_values=None, output_path='percolation_3d.gif'
     
     anim = animation.FuncAnimation(fig, update, frames=len(p_values), 
                                    interval=250, blit=False)
-    anim.save(output_path, writer='pillow', fps=4, dpi=100)
+    anim.save(output_path, writer='pillow', fps=4, dpi=dpi)
     plt.close()
     print(f"GIF saved: {output_path}")
 
 
 # ============================================================
-# Part 4: Complete FSS Analysis Pipeline
+# Part 4: Error-Targeted Adaptive Sampling
 # ============================================================
+# A fixed number of samples per (L, p) wastes work far from p_c, where S1
+# and chi barely fluctuate, and is too little near p_c, where chi
+# fluctuates wildly. The controller below keeps drawing batches for the
+# point whose relative standard error is furthest above the tolerance,
+# until every point converges or the global budget is spent.
 
-def run_fss_analysis(output_dir='.'):
+def sample_moments(L, p, n_samples, seed=None, **config_kwargs):
     """
-    Run complete finite-size scaling analysis and generate analysis plots.
+    Sums over n_samples configurations, mergeable across batches:
+    [n, sum S1, sum S1^2, sum chi, sum chi^2].
     """
-    print("=" * 70)
-    print("3D Site Percolation Finite-Size Scaling Analysis")
-    print("=" * 70)
+    rng = np.random.default_rng(seed)
+    S1, chi = np.empty(n_samples), np.empty(n_samples)
+    for i in range(n_samples):
+        _, _, S1[i], chi[i], _ = generate_percolation_config(L, p, rng=rng, **config_kwargs)
+    return np.array([n_samples, S1.sum(), (S1 ** 2).sum(), chi.sum(), (chi ** 2).sum()])
+
+
+def _moment_statistics(sums):
+    """Means and standard errors of S1 and chi from sample_moments sums."""
+    n = sums[0]
+    mean = sums[[1, 3]] / n
+    var = np.maximum(sums[[2, 4]] / n - mean ** 2, 0.0)
+    return mean, np.sqrt(var / max(n - 1, 1))
+
+
+class AdaptiveSampler:
+    """
+    Draw percolation samples where the statistical error is largest.
+
+    Parameters:
+        L_values, p_values: Grid of points to measure
+        rel_tol: Target relative standard error of both S1 and chi
+        min_samples: First batch of every point
+        batch_size: Smallest follow-up batch; larger batches are sized
+                    from the samples a point still needs
+        max_samples: Global budget of configurations (None: unlimited)
+        max_point_samples: Cap per point, so a point whose chi is close to
+                           0 cannot absorb the whole budget
+        workers: Process pool size (<= 1 samples inline)
+        config_kwargs: Lattice/mode/boundary options for generate_percolation_config
+
+    Every batch has its own seed from a per-point SeedSequence, so a point's
+    samples do not depend on how batches were scheduled on the pool.
+    """
+    def __init__(self, L_values, p_values, rel_tol=0.02, min_samples=20, batch_size=10,
+                 max_samples=None, max_point_samples=5000, workers=None, seed=None,
+                 **config_kwargs):
+        self.points = [(L, p) for L in L_values for p in p_values]
+        self.rel_tol = rel_tol
+        self.min_samples = min_samples
+        self.batch_size = batch_size
+        self.max_samples = max_samples
+        self.max_point_samples = max_point_samples
+        self.workers = os.cpu_count() if workers is None else workers
+        self.config_kwargs = config_kwargs
+        self.seeds = dict(zip(self.points, np.random.SeedSequence(seed).spawn(len(self.points))))
+        self.sums = {point: np.zeros(5) for point in self.points}
+        self.pending = {point: 0 for point in self.points}
+        self.drawn = 0
+
+    def relative_error(self, point):
+        """max over S1, chi of stderr / |mean| (0 where both error and mean vanish)."""
+        if self.sums[point][0] < 2:
+            return np.inf
+        mean, err = _moment_statistics(self.sums[point])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rel = np.where(err > 0, err / np.abs(mean), 0.0)
+        return float(rel.max())
+
+    def next_batch(self):
+        """(point, n) of the most urgent point that has no batch in flight, or None."""
+        budget = np.inf if self.max_samples is None else self.max_samples - self.drawn
+        candidates = [point for point in self.points
+                      if not self.pending[point]
+                      and self.sums[point][0] < self.max_point_samples
+                      and self.relative_error(point) > self.rel_tol]
+        if not candidates or budget <= 0:
+            return None
+        point = max(candidates, key=self.relative_error)
+        n_done = self.sums[point][0]
+        if n_done < 2:
+            # No error estimate yet (e.g. min_samples=1 or a batch cut short
+            # by the budget): top the point up to a first full batch
+            n = max(self.min_samples, self.batch_size)
+        else:
+            # sigma ~ 1/sqrt(n): samples still needed to reach rel_tol. Ask
+            # for half of them, at most doubling the point, so priorities
+            # are re-evaluated often
+            needed = n_done * (self.relative_error(point) / self.rel_tol) ** 2 - n_done
+            n = max(self.batch_size, min(int(np.ceil(needed / 2)), int(n_done)))
+        n = int(min(n, budget, self.max_point_samples - n_done))
+        self.pending[point] = n
+        self.drawn += n
+        return point, n
+
+    def _record(self, point, sums):
+        self.sums[point] += sums
+        self.pending[point] = 0
+
+    def _submit(self, run_batch):
+        """Hand the most urgent batch to run_batch(L, p, n, seed); False if none is left."""
+        batch = self.next_batch()
+        if batch is None:
+            return False
+        (L, p), n = batch
+        run_batch((L, p), L, p, n, self.seeds[(L, p)].spawn(1)[0])
+        return True
+
+    def run(self):
+        """Sample until every point converges, hits its cap or the budget is spent."""
+        if self.workers <= 1:
+            def run_inline(point, *args):
+                self._record(point, sample_moments(*args, **self.config_kwargs))
+            while self._submit(run_inline):
+                pass
+            return self.results()
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            futures = {}
+            def run_in_pool(point, *args):
+                futures[pool.submit(sample_moments, *args, **self.config_kwargs)] = point
+            while True:
+                # Keep every worker busy with the currently most urgent points
+                while len(futures) < 2 * self.workers and self._submit(run_in_pool):
+                    pass
+                if not futures:
+                    break
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    self._record(futures.pop(future), future.result())
+        return self.results()
+
+    def results(self):
+        """run_fss_analysis-style results, plus n_samples per point."""
+        results = {}
+        for L, p in self.points:
+            entry = results.setdefault(L, {'p': [], 'S1': [], 'chi': [], 'S1_err': [],
+                                           'chi_err': [], 'n_samples': []})
+            (S1, chi), (S1_err, chi_err) = _moment_statistics(self.sums[(L, p)])
+            for key, value in (('p', p), ('S1', S1), ('chi', chi), ('S1_err', S1_err),
+                               ('chi_err', chi_err),
+                               ('n_samples', int(self.sums[(L, p)][0]))):
+                entry[key].append(value)
+        return results
+
+
+# ============================================================
+# Part 5: Fractal Geometry of the Largest Cluster
+# ============================================================
+# At p_c the largest cluster is a fractal. Its mass grows as M ~ L^d_f
+# (3D: d_f ~ 2.52). The same exponent appears inside one cluster, in the
+# mass within a radius r of one of its sites, M(r) ~ r^d_f, and in the
+# number of occupied boxes of side b, N(b) ~ b^-d_f.
+# The shortest path across it grows as l_min ~ L^d_min (3D: d_min ~ 1.37).
+# Samples are measured in batches: the batch's cluster masks are box
+# counted together. With several workers the configurations are generated
+# in a process pool and read from shared-memory slots.
+
+def mask_geometry(masks, lattice='cubic', mode='site', periodic=False):
+    """
+    Geometry of a batch of largest-cluster masks, shape (n,) + (L,) * d.
     
-    # Parameter settings
-    p_c = 0.3116  # Critical probability for 3D site percolation
-    p_values = np.linspace(0.20, 0.42, 25)
-    L_values = [8, 12, 16, 20]
-    n_samples = 50
+    Returns a dict of per-sample arrays:
+        mass: Sites in the largest cluster
+        l_min: Chemical distance between opposite faces, averaged over
+               the axes the cluster spans (NaN if it spans none; site
+               mode with open boundaries only, since closed bonds are
+               not kept)
+        box_size, box_counts: Box-counting levels, (n, n_levels)
+        radii, mass_radius: Cluster sites within r of its site nearest
+                            the box centre
+    """
+    n_samples, L, d = masks.shape[0], masks.shape[1], masks.ndim - 1
+    radii = 2.0 ** np.arange(int(np.log2(max(L // 4, 1))) + 1)
+    l_min = np.full(n_samples, np.nan)
+    if mode == 'site' and not periodic:
+        for i, mask in enumerate(masks):
+            lengths = [spanning_length(mask, axis, LATTICES[lattice]) for axis in range(d)]
+            if max(lengths) >= 0:
+                l_min[i] = np.mean([length for length in lengths if length >= 0])
+    boxes = box_counting(masks, d)
+    return {
+        'mass': masks.reshape(n_samples, -1).sum(axis=1),
+        'l_min': l_min,
+        'box_size': boxes['box_size'],
+        'box_counts': boxes['counts'],
+        'radii': radii,
+        'mass_radius': np.array([mass_radius(mask, radii) for mask in masks]),
+    }
+
+
+def geometry_batch(L, p, n_samples, seed=None, lattice='cubic', mode='site',
+                   p_bond=None, periodic=False):
+    """mask_geometry of the largest cluster in n_samples new configurations."""
+    rng = np.random.default_rng(seed)
+    d = len(LATTICES[lattice][0])
+    masks = np.empty((n_samples,) + (L,) * d, dtype=bool)
+    for i in range(n_samples):
+        _, labels, _, _, _ = generate_percolation_config(L, p, lattice, mode, p_bond,
+                                                         periodic, rng=rng)
+        masks[i] = (labels == 0).reshape((L,) * d)
+    return mask_geometry(masks, lattice, mode, periodic)
+
+
+def geometry_batches(L, p, n_samples, batch_size=8, workers=1, seed=None, **config_kwargs):
+    """
+    Yield mask_geometry results for n_samples configurations of size L,
+    batch_size at a time.
     
+    With workers > 1, pool workers generate and label the configurations
+    into shared slots (stream_percolation_configs) and the largest cluster
+    is read straight from the slot, so no labels are pickled; otherwise
+    the batches are generated inline.
+    """
+    if workers is None or workers <= 1:
+        sizes = [min(batch_size, n_samples - start) for start in range(0, n_samples, batch_size)]
+        for n, s in zip(sizes, np.random.SeedSequence(seed).spawn(len(sizes))):
+            yield geometry_batch(L, p, n, s, **config_kwargs)
+        return
+    shape = (L,) * len(LATTICES[config_kwargs.get('lattice', 'cubic')][0])
+    geometry_kwargs = {key: config_kwargs[key] for key in ('lattice', 'mode', 'periodic')
+                       if key in config_kwargs}
+    masks = []
+    for _, _, labels in stream_percolation_configs(L, [p], n_samples, workers, seed=seed,
+                                                   **config_kwargs):
+        masks.append((labels == 0).reshape(shape))
+        if len(masks) == batch_size:
+            yield mask_geometry(np.stack(masks), **geometry_kwargs)
+            masks = []
+    if masks:
+        yield mask_geometry(np.stack(masks), **geometry_kwargs)
+
+
+def measure_cluster_geometry(L_values, p=0.3116, n_samples=20, batch_size=8,
+                             workers=1, seed=None, **config_kwargs):
+    """
+    Fractal and chemical-distance exponents of the largest cluster at p.
+    
+    Parameters:
+        L_values: System sizes (at least two for the L-scaling fits)
+        p: Occupation probability, normally p_c
+        n_samples: Configurations per L, measured in batches of batch_size
+        workers: Process pool size for generating configurations
+                 (<= 1 runs everything inline), see geometry_batches
+        config_kwargs: Lattice/mode/boundary options for generate_percolation_config
+    
+    Returns:
+        per_L: {L: merged mask_geometry arrays}
+        d_f_mass: From <M> ~ L^d_f
+        d_f_radius: From <M(r)> ~ r^d_f in the largest L (r <= L/4)
+        d_f_box: From <N(b)> ~ b^-d_f in the largest L (2 <= b <= L/4)
+        d_min: From <l_min> ~ L^d_min over spanning samples
+    """
+    seeds = np.random.SeedSequence(seed).generate_state(len(L_values))
+    per_L = {}
+    for L, L_seed in zip(L_values, seeds):
+        for batch in geometry_batches(L, p, n_samples, batch_size, workers, int(L_seed),
+                                      **config_kwargs):
+            entry = per_L.setdefault(L, {'box_size': batch['box_size'],
+                                         'radii': batch['radii']})
+            for key in ('mass', 'l_min', 'box_counts', 'mass_radius'):
+                entry[key] = np.concatenate([entry[key], batch[key]]) if key in entry else batch[key]
+    
+    L_array = np.array(list(per_L), dtype=float)
+    mass = np.array([per_L[L]['mass'].mean() for L in per_L])
+    largest = per_L[max(per_L)]
+    L_max = max(per_L)
+    in_box_range = (largest['box_size'] >= 2) & (largest['box_size'] <= max(L_max // 4, 2))
+    in_radius_range = largest['radii'] >= 2
+    results = {'per_L': per_L, 'd_f_mass': np.nan, 'd_f_radius': np.nan,
+               'd_f_box': np.nan, 'd_min': np.nan}
+    if len(per_L) > 1:
+        results['d_f_mass'] = fit_power_law(L_array, mass)[0]
+    if in_box_range.sum() > 1:
+        results['d_f_box'] = -fit_power_law(largest['box_size'][in_box_range],
+                                            largest['box_counts'].mean(axis=0)[in_box_range])[0]
+    if in_radius_range.sum() > 1:
+        results['d_f_radius'] = fit_power_law(largest['radii'][in_radius_range],
+                                              largest['mass_radius'].mean(axis=0)[in_radius_range])[0]
+    spanning = {L: per_L[L]['l_min'][~np.isnan(per_L[L]['l_min'])] for L in per_L}
+    spanning_L = [L for L in per_L if spanning[L].size]
+    if len(spanning_L) > 1:
+        results['d_min'] = fit_power_law(np.array(spanning_L, dtype=float),
+                                         [spanning[L].mean() for L in spanning_L])[0]
+    return results
+
+
+# ============================================================
+# Part 6: Complete FSS Analysis Pipeline
+# ============================================================
+
+# Default stage parameters of the FSS experiment; a JSON file passed with
+# --config only needs the entries it changes
+FSS_CONFIG = {
+    # p_c = 0.3116 is the critical probability for 3D site percolation
+    'measure': {'L_values': [8, 12, 16, 20],
+                'p_values': np.linspace(0.20, 0.42, 25).round(6).tolist(),
+                'n_samples': 50, 'seed': None,
+                # Error-targeted sampling: set rel_tol (e.g. 0.02) to let
+                # AdaptiveSampler place samples where the errors are large
+                'rel_tol': None, 'max_samples': None, 'workers': 1},
+    'fit': {},
     # 3D percolation critical exponents (literature values)
-    beta = 0.41    # Order parameter exponent
-    gamma = 1.80   # Susceptibility exponent
-    nu = 0.88      # Correlation length exponent
-    nu_bar = 3 * nu  # d * nu
+    'render': {'p_c': 0.3116, 'beta': 0.41, 'gamma': 1.80, 'nu': 0.88},
+    # GIF frames are small: their dpi is separate from the figures' --dpi
+    'animate': {'L': 15, 'dpi': 100},
+}
+
+
+def measure_fss(L_values, p_values, n_samples=50, seed=None, rel_tol=None,
+                max_samples=None, workers=1):
+    """
+    Monte Carlo S1 and chi (with errors) for every L on a grid of p.
     
-    # Monte Carlo sampling
+    With rel_tol set, samples are allocated by AdaptiveSampler instead:
+    n_samples is then the first batch of every point, and sampling goes on
+    until the relative errors reach rel_tol or max_samples are drawn.
+    """
     print("\nRunning Monte Carlo simulation...")
+    if rel_tol is not None:
+        sampler = AdaptiveSampler(L_values, p_values, rel_tol=rel_tol,
+                                  min_samples=n_samples, max_samples=max_samples,
+                                  workers=workers, seed=seed)
+        results = sampler.run()
+        for L in L_values:
+            counts = results[L]['n_samples']
+            print(f"  L = {L}: {sum(counts)} samples ({min(counts)}-{max(counts)} per point)")
+        return results
+    rng = np.random.default_rng(seed)
     results = {L: {'p': [], 'S1': [], 'chi': [], 'S1_err': [], 'chi_err': []} 
                for L in L_values}
     
     for L in L_values:
         print(f"  L = {L}:", end=" ")
         for i, p in enumerate(p_values):
-            S1, chi, S1_err, chi_err = compute_observables(L, p, n_samples)
+            S1, chi, S1_err, chi_err = compute_observables(L, p, n_samples, rng=rng)
             results[L]['p'].append(p)
             results[L]['S1'].append(S1)
             results[L]['chi'].append(chi)
             results[L]['S1_err'].append(S1_err)
             results[L]['chi_err'].append(chi_err)
+            
             if (i + 1) % 10 == 0:
                 print(f"{i+1}", end=" ")
         print("Done")
+    return results
+
+
+def fit_susceptibility_peaks(results):
+    """
+    Peak position and height of chi(p) for every L, and gamma/nu from
+    the finite-size scaling chi_max ~ L^(gamma/nu) (log-log least squares).
+    """
+    L_values = np.array(list(results), dtype=float)
+    peaks = [int(np.argmax(results[L]['chi'])) for L in results]
+    p_max = np.array([results[L]['p'][k] for L, k in zip(results, peaks)])
+    chi_max = np.array([results[L]['chi'][k] for L, k in zip(results, peaks)])
+    slope, _ = np.polyfit(np.log(L_values), np.log(chi_max), 1)
+    return {'L': L_values, 'p_max': p_max, 'chi_max': chi_max, 'gamma_over_nu': slope}
+
+
+def run_fss_analysis(output_dir='.', options=None, pool=None, cache=None, config=None):
+    """
+    Run complete finite-size scaling analysis and generate analysis plots.
+    
+    The analysis is an Experiment of three stages (measure -> fit ->
+    render), each memoized in `cache` under a hash of its parameters, so
+    only stages whose parameters changed are rerun.
+    
+    Parameters:
+        output_dir: Where to write outputs when no options are given
+        options: RenderOptions (format, dpi, data-only mode, ...)
+        pool: Optional FigurePool; the figure is then rendered in the
+              background while the caller continues
+        cache: Optional StageCache (None reruns every stage)
+        config: Stage parameters, FSS_CONFIG by default
+    """
+    options = options or RenderOptions(batch=True, output_dir=output_dir)
+    config = load_config(config or FSS_CONFIG)
+    # Output settings are part of the render key: a new format or dpi redraws
+    config['render']['output'] = {'dpi': options.dpi, 'fmt': options.fmt,
+                                  'output_dir': options.output_dir, 'plot': options.plot}
+    print("=" * 70)
+    print("3D Site Percolation Finite-Size Scaling Analysis")
+    print("=" * 70)
+    
+    def render(results, fit, p_c, beta, gamma, nu, output):
+        if options.plot:
+            print("\nGenerating analysis plots...")
+            if pool is None:
+                return render_fss_analysis(results, p_c, beta, gamma, nu, options)
+            pool.submit(render_fss_analysis, results, p_c, beta, gamma, nu, options)
+            return options.path('percolation_fss_analysis')
+        L_values = list(results)
+        data_path = save_data(
+            'percolation_fss_analysis', options,
+            L=np.array(L_values), p=np.array(results[L_values[0]]['p']),
+            **{key: np.array([results[L][key] for L in L_values])
+               for key in ('S1', 'chi', 'S1_err', 'chi_err')})
+        print(f"FSS data saved: {data_path}")
+        return data_path
+    
+    # A figure shown on screen or still being drawn by a pool worker is not
+    # a finished output, so only inline batch renders are cached
+    render_cacheable = options.batch and (pool is None or pool.executor is None)
+    # The measure key covers every helper a sample passes through, so a
+    # change to the lattice, the labelling or the sampler reruns it
+    measure_code = (generate_percolation_config, lattice_bonds, label_clusters, kernels,
+                    compute_observables, sample_moments, _moment_statistics, AdaptiveSampler)
+    experiment = Experiment([
+        Stage('measure', measure_fss, code=measure_code),
+        Stage('fit', fit_susceptibility_peaks),
+        Stage('render', render, inputs=('measure', 'fit'), produces_files=True,
+              code=(render_fss_analysis,), cacheable=render_cacheable),
+    ], cache=cache)
+    outputs = experiment.run(config)
+    results, fit = outputs['measure'], outputs['fit']
+    
+    # Output scaling law verification
+    beta, gamma, nu = (config['render'][key] for key in ('beta', 'gamma', 'nu'))
+    print("\n" + "=" * 70)
+    print("Scaling Law Verification")
+    print("=" * 70)
+    
+    alpha_perc = -0.62
+    print(f"\n3D Percolation Critical Exponents (Literature Values):")
+    print(f"  beta = {beta}, gamma = {gamma}, nu = {nu}, alpha = {alpha_perc}")
+    
+    rushbrooke = alpha_perc + 2*beta + gamma
+    print(f"\nRushbrooke Scaling Law: alpha + 2*beta + gamma = {rushbrooke:.2f} (Theoretical value: 2)")
+    print(f"Hyperscaling: d*nu = {3*nu:.2f}, 2-alpha = {2-alpha_perc:.2f}")
+    print(f"Susceptibility peaks: chi_max ~ L^{fit['gamma_over_nu']:.3f} "
+          f"(literature gamma/nu = {gamma/nu:.3f})")
+    
+    return results
+
+
+@figure_style(PLOT_STYLE, PLOT_RC)
+def render_fss_analysis(results, p_c, beta, gamma, nu, options=None):
+    """Draw the 2x2 FSS figure (raw curves and data collapses) from results."""
+    import matplotlib.pyplot as plt
     
-    # Generate analysis plots
-    print("\nGenerating analysis plots...")
+    L_values = list(results)
+    nu_bar = 3 * nu  # d * nu
     fig, axes = plt.subplots(2, 2, figsize=(14, 12))
     colors = plt.cm.viridis(np.linspace(0.2, 0.8, len(L_values)))
     
@@ -464,48 +1018,53 @@ def run_fss_analysis(output_dir='.'):
     plt.tight_layout()
     plt.suptitle('3D Site Percolation: Finite-Size Scaling Analysis', fontsize=16, y=1.02)
     
-    fig_path = os.path.join(output_dir, 'percolation_fss_analysis.png')
-    plt.savefig(fig_path, dpi=300, bbox_inches='tight', facecolor='black')
-    plt.close()
+    fig_path = finish_figure(fig, 'percolation_fss_analysis', options,
+                             bbox_inches='tight', facecolor='black')
     print(f"FSS analysis plot saved: {fig_path}")
-    
-    # Output scaling law verification
-    print("\n" + "=" * 70)
-    print("Scaling Law Verification")
-    print("=" * 70)
-    alpha_perc = -0.62
-    print(f"\n3D Percolation Critical Exponents (Literature Values):")
-    print(f"  beta = {beta}, gamma = {gamma}, nu = {nu}, alpha = {alpha_perc}")
-    
-    rushbrooke = alpha_perc + 2*beta + gamma
-    print(f"\nRushbrooke Scaling Law: alpha + 2*beta + gamma = {rushbrooke:.2f} (Theoretical value: 2)")
-    print(f"Hyperscaling: d*nu = {3*nu:.2f}, 2-alpha = {2-alpha_perc:.2f}")
-    
-    return results
+    return fig_path
 
 
-def main():
+def main(argv=None):
     """Main function: run complete analysis pipeline"""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    add_render_arguments(parser, default_output_dir=os.path.dirname(os.path.abspath(__file__)))
+    parser.add_argument('--gif-dpi', type=int,
+                        help="resolution of the GIF frames (default: 100)")
+    add_cache_arguments(parser)
+    args = parser.parse_args(argv)
+    options = options_from_args(args)
+    cache = cache_from_args(args)
+    config = load_config(FSS_CONFIG, args.config)
+    if args.gif_dpi is not None:
+        config['animate']['dpi'] = args.gif_dpi
+    # The analysis figure is never shown interactively, only saved
+    options.batch = True
+    
     print("\n" + "=" * 70)
     print("3D Percolation Phase Transition Analysis and Visualization")
     print("=" * 70)
     
-    # Set output directory
-    output_dir = os.path.dirname(os.path.abspath(__file__))
-    
-    # Run FSS analysis
-    print("\n[1/2] Running finite-size scaling analysis...")
-    run_fss_analysis(output_dir)
-    
-    # Generate GIF animation
-    print("\n[2/2] Generating 3D visualization animation...")
-    gif_path = os.path.join(output_dir, 'percolation_3d.gif')
-    create_percolation_gif(L=15, output_path=gif_path)
+    with FigurePool(options) as pool:
+        # Run FSS analysis
+        print("\n[1/2] Running finite-size scaling analysis...")
+        run_fss_analysis(options=options, pool=pool, cache=cache, config=config)
+        
+        # Generate GIF animation (skipped in data-only mode)
+        print("\n[2/2] Generating 3D visualization animation...")
+        if options.plot:
+            def animate(L, output_path, dpi):
+                pool.submit(create_percolation_gif, L=L, output_path=output_path, dpi=dpi)
+                return output_path
+            
+            gif_path = options.path('percolation_3d', 'gif')
+            Experiment([Stage('animate', animate, produces_files=True,
+                              code=(create_percolation_gif,),
+                              cacheable=pool.executor is None)], cache=cache).run(
+                {'animate': dict(config['animate'], output_path=gif_path)})
     
     print("\n" + "=" * 70)
     print("Analysis complete!")
     print("=" * 70)
 
-
 if __name__ == "__main__":
     main()
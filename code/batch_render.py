@@ -0,0 +1,207 @@
+"""
+Headless Batch Rendering Helpers
+================================================================
+Shared by the lecture scripts so that they can run on compute nodes
+without a display:
+1. Select the non-interactive Agg backend before any figure is created
+2. Save figures with a configurable resolution and file format
+3. Render figures in a worker pool while the simulation keeps going
+4. Skip plotting entirely and only emit the underlying data (.npz)
+5. Apply plot styles per figure (figure_style) instead of globally at
+   import time, so the simulation modules import without matplotlib
+
+Interactive use is unchanged: with default options every figure is saved
+as a 300-dpi PNG and then shown, exactly as before.
+================================================================
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+
+HEADLESS_BACKEND = "Agg"
+
+
+def use_headless_backend():
+    """
+    Switch matplotlib to the Agg backend.
+
+    pyplot resolves its default (GUI) backend lazily on the first figure,
+    so calling this after `import matplotlib.pyplot` but before plotting
+    still avoids loading any GUI toolkit.
+    """
+    import matplotlib
+    matplotlib.use(HEADLESS_BACKEND, force=True)
+
+
+@contextmanager
+def figure_style(style="dark_background", rc=None):
+    """
+    Apply a matplotlib style (and rcParams overrides) only while a figure
+    is built and saved; matplotlib itself is first imported here.
+
+    Works as a context manager yielding pyplot or as a decorator on a
+    rendering function, which then imports pyplot locally:
+        @figure_style("dark_background")
+        def render_something(data, options=None):
+            import matplotlib.pyplot as plt
+            ...
+    """
+    import matplotlib.pyplot as plt
+
+    with plt.style.context(style), plt.rc_context(rc):
+        yield plt
+
+
+class RenderOptions:
+    """
+    How the figure-producing entry points should emit their output.
+
+    Parameters:
+        batch: Non-interactive mode: Agg backend, never call plt.show()
+        dpi: Resolution of saved raster figures
+        fmt: File format passed to savefig ('png', 'pdf', 'svg', ...)
+        workers: Size of the rendering process pool (0 renders inline)
+        plot: If False, skip plotting and only write data files
+        output_dir: Directory for figures and data files
+        save: Write figures to output_dir; if False an interactive figure
+              is only shown (batch mode always saves)
+    """
+    def __init__(self, batch=False, dpi=300, fmt="png", workers=0,
+                 plot=True, output_dir=".", save=True):
+        self.batch = batch or workers > 0 or not plot
+        self.save = save or self.batch
+        self.dpi = dpi
+        self.fmt = fmt
+        self.workers = workers
+        self.plot = plot
+        self.output_dir = output_dir
+
+    def path(self, name, ext=None):
+        """Output path for a figure/data file called `name`."""
+        return os.path.join(self.output_dir, f"{name}.{ext or self.fmt}")
+
+
+def add_render_arguments(parser, default_output_dir="."):
+    """
+    Add the batch-mode command line flags to an argparse parser.
+
+    With default_output_dir=None, interactive figures are only shown and
+    are saved (to the current directory) only in batch mode or when
+    --output-dir is given.
+    """
+    group = parser.add_argument_group("rendering")
+    group.add_argument("--batch", action="store_true",
+                       default=os.environ.get("RG_BATCH", "") not in ("", "0"),
+                       help="headless mode: Agg backend, no windows "
+                            "(also enabled by RG_BATCH=1)")
+    group.add_argument("--dpi", type=int, default=300,
+                       help="resolution of saved figures (default: 300)")
+    group.add_argument("--format", dest="fmt", default="png",
+                       help="figure file format, e.g. png, pdf, svg")
+    group.add_argument("--workers", type=int, default=0,
+                       help="render figures in a pool of this many processes")
+    group.add_argument("--no-plot", dest="plot", action="store_false",
+                       help="skip plotting and only write .npz data")
+    group.add_argument("--output-dir", default=default_output_dir,
+                       help="directory for figures and data files" +
+                            ("" if default_output_dir is not None else
+                             " (without it, interactive figures are not saved)"))
+    return parser
+
+
+def options_from_args(args):
+    """Build RenderOptions from parsed arguments and apply the backend choice."""
+    options = RenderOptions(batch=args.batch, dpi=args.dpi, fmt=args.fmt,
+                            workers=args.workers, plot=args.plot,
+                            output_dir=args.output_dir or ".",
+                            save=args.output_dir is not None)
+    if options.batch:
+        use_headless_backend()
+    os.makedirs(options.output_dir, exist_ok=True)
+    return options
+
+
+def finish_figure(fig, name, options=None, **savefig_kwargs):
+    """
+    Save `fig` as <output_dir>/<name>.<fmt> (unless options.save is
+    False), then show it or close it.
+
+    Returns the path of the saved file, or None if it was not saved.
+    """
+    import matplotlib.pyplot as plt
+
+    options = options or RenderOptions()
+    path = None
+    if options.save:
+        path = options.path(name)
+        fig.savefig(path, dpi=options.dpi, format=options.fmt, **savefig_kwargs)
+    if options.batch:
+        plt.close(fig)
+    else:
+        plt.show()
+    return path
+
+
+def save_data(name, options=None, **arrays):
+    """Write the arrays behind a figure to <output_dir>/<name>.npz."""
+    options = options or RenderOptions()
+    path = options.path(name, "npz")
+    np.savez(path, **arrays)
+    return path
+
+
+class FigurePool:
+    """
+    Run figure-rendering jobs inline or in a process pool.
+
+    Jobs are module-level functions that build and save one figure. With
+    `options.workers > 0` they run in worker processes using the Agg
+    backend, so the caller can continue simulating while figures are drawn.
+    With `options.plot = False` every job is skipped.
+
+    Usage:
+        with FigurePool(options) as pool:
+            pool.submit(render_something, data, options)
+    """
+    def __init__(self, options=None):
+        self.options = options or RenderOptions()
+        self.executor = None
+        self.futures = []
+        if self.options.plot and self.options.workers > 0:
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.options.workers,
+                initializer=use_headless_backend)
+
+    def submit(self, func, *args, **kwargs):
+        """Schedule one rendering job (or run it now if there is no pool)."""
+        if not self.options.plot:
+            return None
+        if self.executor is None:
+            return func(*args, **kwargs)
+        future = self.executor.submit(func, *args, **kwargs)
+        self.futures.append(future)
+        return future
+
+    def wait(self):
+        """Block until all submitted jobs are done; re-raise any failure."""
+        results = [f.result() for f in self.futures]
+        self.futures = []
+        return results
+
+    def close(self):
+        if self.executor is not None:
+            try:
+                self.wait()
+            finally:
+                self.executor.shutdown()
+                self.executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
@@ -0,0 +1,176 @@
+"""
+Fractal Geometry of Percolation Clusters
+================================================================
+At p_c the incipient infinite cluster is a fractal: its mass grows as
+M ~ r^d_f (d_f = 91/48 in 2D, ~2.52 in 3D), and the shortest path inside
+it between two points a distance r apart grows as l ~ r^d_min (d_min ~
+1.13 in 2D, ~1.37 in 3D). This module measures both on boolean cluster
+masks of shape (L,) * d; masks may carry leading batch axes:
+1. Box counting: a reshape-sum pyramid halves the lattice level by level
+   (sum over 2^d children, zero-padded to even sizes), so the number of
+   occupied boxes N(b) ~ b^-d_f for every b = 1, 2, 4, ... costs one pass
+   over the data for the whole batch
+2. Mass-radius: cluster sites within distance r of a cluster site, M(r),
+   from one sort of the squared distances of the cluster's sites
+3. Chemical distance: level-synchronous breadth-first search over the
+   cluster, one vectorized step per distance shell; neighbours are
+   computed from the frontier's coordinates, so no (N, 2d) neighbour table
+   is needed and L = 128 in 3D (2M sites) stays cheap
+
+Usage:
+    from cluster_geometry import box_counting, fit_power_law, spanning_length
+    counts = box_counting(masks, d=3)
+    d_f = -fit_power_law(counts["box_size"], counts["counts"].mean(axis=0))[0]
+    l_min = spanning_length(masks[0])
+================================================================
+"""
+
+import numpy as np
+
+
+def fit_power_law(x, y):
+    """(exponent, prefactor) of y = prefactor * x^exponent, least squares in log-log."""
+    slope, intercept = np.polyfit(np.log(x), np.log(y), 1)
+    return slope, np.exp(intercept)
+
+
+# ============================================================
+# Box counting
+# ============================================================
+
+def box_pyramid(masks, d):
+    """
+    Yield (box_size, mass) for box_size = 1, 2, 4, ... until a single box
+    covers the lattice; mass holds the number of cluster sites per box,
+    shape batch + (ceil(L / box_size),) * d.
+    """
+    mass = np.asarray(masks, dtype=np.int32)
+    batch = mass.shape[:mass.ndim - d]
+    box_size = 1
+    while True:
+        yield box_size, mass
+        lattice = mass.shape[mass.ndim - d:]
+        if all(n == 1 for n in lattice):
+            return
+        pad = [(0, 0)] * len(batch) + [(0, n % 2) for n in lattice]
+        if any(after for _, after in pad):
+            mass = np.pad(mass, pad)
+        halves = [(n + 1) // 2 for n in lattice]
+        mass = mass.reshape(batch + tuple(x for n in halves for x in (n, 2)))
+        mass = mass.sum(axis=tuple(range(len(batch) + 1, len(batch) + 2 * d, 2)))
+        box_size *= 2
+
+
+def box_counting(masks, d):
+    """
+    Occupied-box counts of every mask in a batch.
+
+    Returns a dict:
+        box_size: (n_levels,) box side lengths 1, 2, 4, ...
+        counts: batch + (n_levels,) number of boxes holding cluster sites
+    """
+    sizes, counts = [], []
+    for box_size, mass in box_pyramid(masks, d):
+        sizes.append(box_size)
+        counts.append(np.count_nonzero(mass, axis=tuple(range(mass.ndim - d, mass.ndim))))
+    return {"box_size": np.array(sizes), "counts": np.stack(counts, axis=-1)}
+
+
+# ============================================================
+# Mass-radius relation
+# ============================================================
+
+def mass_radius(mask, radii, center=None):
+    """
+    Number of cluster sites within Euclidean distance r of `center` for
+    every r in radii. The default centre is the cluster site nearest to
+    the middle of the box: centred on an empty region, M(r) would mix the
+    cluster's mass with the probability of reaching it.
+    """
+    mask = np.asarray(mask)
+    coords = np.nonzero(mask)
+    if not coords[0].size:
+        return np.zeros(len(radii), dtype=np.int64)
+    if center is None:
+        middle = (np.array(mask.shape) - 1) / 2.0
+        nearest = np.argmin(sum((c - x0) ** 2 for c, x0 in zip(coords, middle)))
+        center = [c[nearest] for c in coords]
+    r2 = sum((c - x0) ** 2 for c, x0 in zip(coords, center))
+    r2.sort()
+    return np.searchsorted(r2, np.asarray(radii, dtype=float) ** 2, side="right")
+
+
+# ============================================================
+# Chemical distance
+# ============================================================
+
+def _bfs_levels(mask, sources, offsets=None, periodic=False):
+    """
+    Breadth-first search inside mask from the flat site indices sources.
+    Yields (distance, frontier) for every shell, frontier as flat indices.
+
+    offsets lists one direction of every bond (default: the hypercubic
+    unit vectors); both directions are followed.
+    """
+    shape = mask.shape
+    d = len(shape)
+    if offsets is None:
+        offsets = np.eye(d, dtype=np.int64)
+    steps = np.concatenate([np.asarray(offsets), -np.asarray(offsets)])
+    inside = mask.ravel()
+    visited = ~inside
+    claim = np.empty(inside.shape[0], dtype=np.int64)
+    frontier = np.unique(np.asarray(sources, dtype=np.int64))
+    frontier = frontier[inside[frontier]]
+    visited[frontier] = True
+    distance = 0
+    while frontier.size:
+        yield distance, frontier
+        coords = np.unravel_index(frontier, shape)
+        candidates = []
+        for step in steps:
+            nb = [c + s for c, s in zip(coords, step)]
+            if periodic:
+                nb = [c % n for c, n in zip(nb, shape)]
+                flat = np.ravel_multi_index(nb, shape)
+            else:
+                keep = np.logical_and.reduce([(c >= 0) & (c < n) for c, n in zip(nb, shape)])
+                flat = np.ravel_multi_index([c[keep] for c in nb], shape)
+            candidates.append(flat[~visited[flat]])
+        frontier = np.concatenate(candidates)
+        # Deduplicate without sorting: the last writer claims each site
+        claim[frontier] = np.arange(frontier.size)
+        frontier = frontier[claim[frontier] == np.arange(frontier.size)]
+        visited[frontier] = True
+        distance += 1
+
+
+def chemical_distances(mask, sources, offsets=None, periodic=False):
+    """
+    Shortest-path length inside the cluster from the nearest source to
+    every site (int32, -1 outside the cluster or unreachable).
+
+    sources: Flat site indices (sources outside mask are ignored)
+    offsets, periodic: Bond directions and boundaries, see _bfs_levels
+    """
+    mask = np.asarray(mask, dtype=bool)
+    distance = np.full(mask.size, -1, dtype=np.int32)
+    for level, frontier in _bfs_levels(mask, sources, offsets, periodic):
+        distance[frontier] = level
+    return distance.reshape(mask.shape)
+
+
+def spanning_length(mask, axis=0, offsets=None):
+    """
+    Chemical distance l_min between the faces x_axis = 0 and x_axis = L - 1
+    through the cluster (open boundaries), or -1 if it does not span.
+    """
+    mask = np.asarray(mask, dtype=bool)
+    index = np.arange(mask.size).reshape(mask.shape)
+    sources = np.take(index, 0, axis=axis).ravel()
+    target = np.zeros(mask.size, dtype=bool)
+    target[np.take(index, mask.shape[axis] - 1, axis=axis).ravel()] = True
+    for level, frontier in _bfs_levels(mask, sources, offsets):
+        if target[frontier].any():
+            return level
+    return -1
@@ -0,0 +1,313 @@
+"""
+Quenched-Disorder Ising Models: Random Bonds, Site Dilution, Field
+================================================================
+H = -sum_<ij> J_ij s_i s_j - h sum_i s_i on a periodic L^d lattice, with
+the couplings J_ij and the vacancies fixed (quenched) per realization:
+1. Couplings are stored per bond as J[..., axis, x], the bond between x
+   and x + e_axis; vacant sites hold spin 0, so they drop out of every
+   local field and energy without special cases
+2. All kernels accept arbitrary leading batch axes: one checkerboard
+   sweep updates a whole batch of disorder realizations at once
+3. Disorder averages are streamed: each batch reduces its realizations
+   to RunningMoments (count, mean, sum of squared deviations), batches
+   are merged pairwise (Chan et al.), so memory does not grow with the
+   number of realizations; batches can run in a process pool
+
+IsingRG uses the same kernels for its non-uniform energy path.
+
+Usage:
+    from disorder import disorder_average
+    result = disorder_average(16, 2.0, n_realizations=256, disorder="bimodal", p=0.1)
+    result["mean"]["susceptibility"], result["stderr"]["susceptibility"]
+================================================================
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+# ============================================================
+# Disorder generators
+# ============================================================
+
+def random_bonds(shape, d=2, disorder="bimodal", p=0.5, J0=1.0, width=1.0, rng=None):
+    """
+    Quenched couplings J[..., axis, x] for lattices of `shape` = batch
+    axes followed by d lattice axes.
+
+    disorder:
+        None:       uniform J0 everywhere; returns None, which every
+                    kernel treats as J = 1 without storing an array
+        'bimodal':  -J0 with probability p, +J0 otherwise (+-J spin glass
+                    at p = 0.5)
+        'gaussian': normal with mean J0 and standard deviation width
+        'dilute':   J0 with probability p, 0 otherwise (bond dilution)
+    """
+    if disorder is None:
+        if J0 != 1.0:
+            raise ValueError("uniform couplings other than J0 = 1 are a rescaled T")
+        return None
+    rng = rng if rng is not None else np.random.default_rng()
+    shape = tuple(shape)
+    bond_shape = shape[:len(shape) - d] + (d,) + shape[len(shape) - d:]
+    if disorder == "bimodal":
+        return np.where(rng.random(bond_shape) < p, -J0, J0)
+    if disorder == "gaussian":
+        return rng.normal(J0, width, size=bond_shape)
+    if disorder == "dilute":
+        return np.where(rng.random(bond_shape) < p, J0, 0.0)
+    raise ValueError(f"unknown bond disorder: {disorder!r}")
+
+
+def dilute_sites(shape, p, rng=None):
+    """Occupation mask: every site is present with probability p."""
+    rng = rng if rng is not None else np.random.default_rng()
+    return rng.random(shape) < p
+
+
+def random_spins(occupied, rng):
+    """+-1 spins on occupied sites, 0 on vacancies, as int8."""
+    spins = rng.choice(np.array([-1, 1], dtype=np.int8), size=occupied.shape)
+    spins[~occupied] = 0
+    return spins
+
+
+# ============================================================
+# Batched kernels
+# ============================================================
+
+def _bond_axis(J, d, k):
+    """Couplings along lattice direction k, shaped like the spins."""
+    return np.take(J, k, axis=J.ndim - d - 1)
+
+
+def local_field(spins, d, J=None, h=0.0):
+    """
+    h_i = sum_j J_ij s_j + h for every site; the last d axes of spins are
+    the lattice, any leading axes are a batch. J=None means J_ij = 1.
+    """
+    field = np.zeros(spins.shape)
+    for k in range(d):
+        axis = spins.ndim - d + k
+        up, down = np.roll(spins, -1, axis), np.roll(spins, 1, axis)
+        if J is None:
+            field += up
+            field += down
+        else:
+            Jk = _bond_axis(J, d, k)
+            field += Jk * up
+            field += np.roll(Jk, 1, axis) * down
+    return field + h
+
+
+def total_energy(spins, d, J=None, h=0.0):
+    """E = -sum_<ij> J_ij s_i s_j - h sum_i s_i of every lattice in the batch."""
+    lattice_axes = tuple(range(spins.ndim - d, spins.ndim))
+    s = spins.astype(float)
+    bonds = 0.0
+    for k, axis in enumerate(lattice_axes):
+        pair = s * np.roll(s, -1, axis)
+        bonds = bonds + np.sum(pair if J is None else _bond_axis(J, d, k) * pair,
+                               axis=lattice_axes)
+    return -bonds - h * np.sum(s, axis=lattice_axes)
+
+
+def sublattice_masks(shape):
+    """Even/odd checkerboard masks of a lattice with even side lengths."""
+    if any(n % 2 for n in shape):
+        raise ValueError("checkerboard updates need an even L")
+    parity = np.indices(shape).sum(axis=0) % 2
+    return parity == 0, parity == 1
+
+
+def sublattice_sites(shape):
+    """
+    Flat indices of the even and odd sublattices and of their neighbours:
+    [(sites, up, down), ...], where up[k] / down[k] index the neighbours
+    at x + e_k / x - e_k (periodic). A sweep then gathers only the half
+    of the lattice it updates.
+    """
+    index = np.arange(int(np.prod(shape))).reshape(shape)
+    sublattices = []
+    for mask in sublattice_masks(shape):
+        sublattices.append((index[mask],
+                            np.stack([np.roll(index, -1, k)[mask] for k in range(len(shape))]),
+                            np.stack([np.roll(index, 1, k)[mask] for k in range(len(shape))])))
+    return sublattices
+
+
+def checkerboard_sweep(spins, d, T, rng, J=None, h=0.0, sublattices=None):
+    """
+    One Metropolis sweep of every lattice in the batch, in place: each
+    sublattice is updated at once with acceptance min(1, exp(-dE / T)),
+    dE = 2 s_i h_i. Vacancies (s = 0) have dE = 0 and stay 0.
+
+    sublattices: sublattice_sites of the lattice shape (computed if None)
+    """
+    if sublattices is None:
+        sublattices = sublattice_sites(spins.shape[spins.ndim - d:])
+    batch = spins.shape[:spins.ndim - d]
+    flat = spins.reshape(batch + (-1,))
+    J_flat = None if J is None else J.reshape(batch + (d, -1))
+    for sites, up, down in sublattices:
+        field = np.full(batch + sites.shape, float(h))
+        for k in range(d):
+            if J_flat is None:
+                field += flat[..., up[k]]
+                field += flat[..., down[k]]
+            else:
+                # Bond (k, x) joins x and x + e_k
+                field += J_flat[..., k, sites] * flat[..., up[k]]
+                field += J_flat[..., k, down[k]] * flat[..., down[k]]
+        s = flat[..., sites]
+        dE = 2 * s * field
+        accept = rng.random(dE.shape) < np.exp(-np.maximum(dE, 0.0) / T)
+        flat[..., sites] = np.where(accept, -s, s)
+    if not np.shares_memory(flat, spins):
+        spins[...] = flat.reshape(spins.shape)
+
+
+# ============================================================
+# Streaming statistics
+# ============================================================
+
+class RunningMoments:
+    """
+    Count, mean and M2 = sum (x - mean)^2 of a stream of samples, updated
+    a batch at a time; merging two accumulators is exact (Chan et al.),
+    so batches may be reduced in any order or in separate processes.
+    """
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def update(self, values):
+        """Add a batch of samples (first axis = samples)."""
+        values = np.asarray(values, dtype=float)
+        other = RunningMoments()
+        other.count = values.shape[0]
+        other.mean = values.mean(axis=0)
+        other.m2 = ((values - other.mean) ** 2).sum(axis=0)
+        return self.merge(other)
+
+    def merge(self, other):
+        if other.count == 0:
+            return self
+        n = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * (other.count / n)
+        self.m2 = self.m2 + other.m2 + delta ** 2 * (self.count * other.count / n)
+        self.count = n
+        return self
+
+    @property
+    def variance(self):
+        """Unbiased sample variance."""
+        return self.m2 / (self.count - 1) if self.count > 1 else np.nan * self.m2
+
+    @property
+    def stderr(self):
+        return np.sqrt(self.variance / self.count)
+
+
+# ============================================================
+# Disorder averaging
+# ============================================================
+
+OBSERVABLES = ("energy", "specific_heat", "abs_magnetization", "susceptibility", "binder")
+
+
+def simulate_batch(L, T, n_realizations, d=2, h=0.0, disorder=None, p=0.5,
+                   J0=1.0, width=1.0, site_p=1.0, thermalize=500, n_samples=500,
+                   thin=1, seed=None):
+    """
+    Simulate n_realizations disorder samples side by side and return the
+    per-realization thermal averages, each an (n_realizations,) array:
+    energy and abs_magnetization per occupied site, specific_heat,
+    susceptibility (from |m|) and the Binder cumulant.
+
+    Thermal moments are accumulated as running sums, so memory is a few
+    copies of the batch of lattices, independent of n_samples.
+    """
+    rng = np.random.default_rng(seed)
+    shape = (n_realizations,) + (L,) * d
+    J = random_bonds(shape, d, disorder, p, J0, width, rng)
+    occupied = dilute_sites(shape, site_p, rng)
+    spins = random_spins(occupied, rng)
+    lattice_axes = tuple(range(1, d + 1))
+    n_sites = np.maximum(occupied.sum(axis=lattice_axes), 1)
+    sublattices = sublattice_sites((L,) * d)
+
+    for _ in range(thermalize):
+        checkerboard_sweep(spins, d, T, rng, J, h, sublattices)
+    sums = {key: np.zeros(n_realizations) for key in ("e", "e2", "m", "m2", "m4")}
+    for _ in range(n_samples):
+        for _ in range(thin):
+            checkerboard_sweep(spins, d, T, rng, J, h, sublattices)
+        e = total_energy(spins, d, J, h) / n_sites
+        m = np.abs(spins.sum(axis=lattice_axes, dtype=np.int64)) / n_sites
+        sums["e"] += e
+        sums["e2"] += e * e
+        sums["m"] += m
+        sums["m2"] += m * m
+        sums["m4"] += m ** 4
+    avg = {key: value / n_samples for key, value in sums.items()}
+    with np.errstate(invalid="ignore", divide="ignore"):
+        binder = 1.0 - avg["m4"] / (3.0 * avg["m2"] ** 2)
+    return {
+        "energy": avg["e"],
+        "specific_heat": n_sites * (avg["e2"] - avg["e"] ** 2) / T ** 2,
+        "abs_magnetization": avg["m"],
+        "susceptibility": n_sites * (avg["m2"] - avg["m"] ** 2) / T,
+        "binder": binder,
+    }
+
+
+def _batch_moments(kwargs):
+    """Worker entry point: one batch reduced to RunningMoments per observable."""
+    observables = simulate_batch(**kwargs)
+    return {name: RunningMoments().update(observables[name]) for name in OBSERVABLES}
+
+
+def _merge_batches(totals, batches):
+    for batch in batches:
+        for name in OBSERVABLES:
+            totals[name].merge(batch[name])
+    return totals
+
+
+def disorder_average(L, T, n_realizations=256, batch_size=32, workers=None, seed=None,
+                     **model):
+    """
+    Disorder average of the thermal observables over n_realizations
+    quenched samples, simulated in batches of batch_size (in a process
+    pool when more than one worker is available).
+
+    model: keyword arguments of simulate_batch (d, h, disorder, p, J0,
+           width, site_p, thermalize, n_samples, thin)
+
+    Returns a dict with n_realizations and, each keyed by observable:
+        mean: disorder average [<O>]
+        variance: realization-to-realization variance of <O>
+        stderr: standard error of the disorder average
+    """
+    sizes = [min(batch_size, n_realizations - start)
+             for start in range(0, n_realizations, batch_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    jobs = [dict(model, L=L, T=T, n_realizations=n, seed=s) for n, s in zip(sizes, seeds)]
+    workers = min(len(jobs), workers or os.cpu_count())
+    totals = {name: RunningMoments() for name in OBSERVABLES}
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            _merge_batches(totals, pool.map(_batch_moments, jobs))
+    else:
+        _merge_batches(totals, map(_batch_moments, jobs))
+    return {
+        "n_realizations": n_realizations,
+        "mean": {name: acc.mean for name, acc in totals.items()},
+        "variance": {name: acc.variance for name, acc in totals.items()},
+        "stderr": {name: acc.stderr for name, acc in totals.items()},
+    }
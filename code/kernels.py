@@ -0,0 +1,321 @@
+"""
+Optional JIT-Compiled Kernels for Sequential Inner Loops
+================================================================
+Some algorithms do not vectorize: random-sequential Metropolis, growing
+a single (Ising or embedded O(n)) Wolff cluster, sequential union-find.
+Their kernels live here and are written once as plain loops over NumPy
+arrays:
+1. If numba is installed, each kernel is compiled with njit(cache=True)
+   the first time it runs; the machine code is cached on disk
+   (__pycache__), so later runs start without recompiling
+2. Otherwise the very same loops run as ordinary Python, and array-level
+   work uses the vectorized NumPy implementations
+
+The backend is chosen at import time; RG_KERNELS=numpy forces the
+fallback. numba itself is imported only when a kernel first runs, so
+importing this module (and the scripts built on it) costs no more than
+NumPy. Every kernel takes its random numbers as arrays drawn by the
+caller, so both backends produce identical results for a fixed seed.
+check_backend_parity() (or `python kernels.py --check`) verifies this.
+================================================================
+"""
+
+import argparse
+import functools
+import importlib.util
+import os
+
+import numpy as np
+
+if os.environ.get("RG_KERNELS", "").lower() == "numpy":
+    BACKEND = "numpy"
+else:
+    BACKEND = "numba" if importlib.util.find_spec("numba") is not None else "numpy"
+
+
+class _LazyKernel:
+    """A kernel compiled with numba.njit on its first call."""
+    def __init__(self, func):
+        functools.update_wrapper(self, func)
+        self.py_func = func
+        self._compiled = None
+
+    def __call__(self, *args):
+        if self._compiled is None:
+            import numba
+            self._compiled = numba.njit(cache=True, nogil=True)(self.py_func)
+        return self._compiled(*args)
+
+
+def kernel(func):
+    """Compile func with numba when available; keep the plain function otherwise."""
+    if BACKEND == "numpy":
+        func.py_func = func
+        return func
+    return _LazyKernel(func)
+
+
+def periodic_neighbours(shape):
+    """(N, 2d) table of flat neighbour indices on a periodic hypercubic lattice."""
+    index = np.arange(int(np.prod(shape))).reshape(shape)
+    return np.stack([np.roll(index, shift, axis).ravel()
+                     for axis in range(len(shape)) for shift in (1, -1)], axis=1)
+
+
+# ============================================================
+# Ising kernels
+# ============================================================
+
+@kernel
+def metropolis_sweep(spins, neighbours, sites, thresholds, acceptance):
+    """
+    Random-sequential Metropolis updates of a flat int8 spin array.
+
+    sites[k] is attempted with uniform thresholds[k]; acceptance[dE + 4d]
+    tabulates exp(-dE / T) for dE = 2 s h. Updates spins in place and
+    returns the number of accepted flips.
+    """
+    offset = neighbours.shape[1] * 2
+    accepted = 0
+    for k in range(sites.shape[0]):
+        site = sites[k]
+        h = 0
+        for j in range(neighbours.shape[1]):
+            h += spins[neighbours[site, j]]
+        dE = 2 * spins[site] * h
+        if dE <= 0 or thresholds[k] < acceptance[dE + offset]:
+            spins[site] = -spins[site]
+            accepted += 1
+    return accepted
+
+
+@kernel
+def metropolis_field_sweep(spins, neighbours, couplings, field, sites, thresholds, beta):
+    """
+    Random-sequential Metropolis updates with real-valued local fields.
+
+    couplings[i, j] is the bond between i and neighbours[i, j] (random
+    bonds), field the uniform external field; vacant sites (spin 0) are
+    skipped. Updates spins in place and returns the number of accepted
+    flips.
+    """
+    accepted = 0
+    for k in range(sites.shape[0]):
+        site = sites[k]
+        s = spins[site]
+        if s == 0:
+            continue
+        h = field
+        for j in range(neighbours.shape[1]):
+            h += couplings[site, j] * spins[neighbours[site, j]]
+        dE = 2.0 * s * h
+        if dE <= 0.0 or thresholds[k] < np.exp(-beta * dE):
+            spins[site] = -s
+            accepted += 1
+    return accepted
+
+
+@kernel
+def grow_cluster(spins, neighbours, seed_site, p_add, randoms):
+    """
+    Grow a Wolff cluster of equal spins from seed_site by breadth-first
+    search, adding each aligned neighbour with probability p_add.
+
+    randoms holds one uniform per bond test, consumed in order (at most
+    N * 2d are needed). Returns the cluster's flat site indices; spins
+    are not modified.
+    """
+    n = spins.shape[0]
+    in_cluster = np.zeros(n, dtype=np.bool_)
+    queue = np.empty(n, dtype=np.int64)
+    queue[0] = seed_site
+    in_cluster[seed_site] = True
+    head, tail, draw = 0, 1, 0
+    value = spins[seed_site]
+    while head < tail:
+        site = queue[head]
+        head += 1
+        for j in range(neighbours.shape[1]):
+            nb = neighbours[site, j]
+            if in_cluster[nb] or spins[nb] != value:
+                continue
+            r = randoms[draw]
+            draw += 1
+            if r < p_add:
+                in_cluster[nb] = True
+                queue[tail] = nb
+                tail += 1
+    return queue[:tail]
+
+
+@kernel
+def grow_embedded_cluster(projections, neighbours, seed_site, two_beta, randoms, offset):
+    """
+    Wolff cluster of an O(n) model in its embedded Ising model: with
+    sigma_i = s_i . r, the bond ij is added with probability
+    1 - exp(-2 beta sigma_i sigma_j) if sigma_i sigma_j > 0.
+
+    randoms[offset:] supplies one uniform per bond test (at most N * 2d).
+    Returns the cluster's flat site indices and the next unused offset.
+    """
+    n = projections.shape[0]
+    in_cluster = np.zeros(n, dtype=np.bool_)
+    queue = np.empty(n, dtype=np.int64)
+    queue[0] = seed_site
+    in_cluster[seed_site] = True
+    head, tail, draw = 0, 1, offset
+    while head < tail:
+        site = queue[head]
+        head += 1
+        for j in range(neighbours.shape[1]):
+            nb = neighbours[site, j]
+            if in_cluster[nb]:
+                continue
+            coupling = projections[site] * projections[nb]
+            if coupling <= 0:
+                continue
+            r = randoms[draw]
+            draw += 1
+            if r < 1.0 - np.exp(-two_beta * coupling):
+                in_cluster[nb] = True
+                queue[tail] = nb
+                tail += 1
+    return queue[:tail], draw
+
+
+# ============================================================
+# Union-find kernels
+# ============================================================
+
+@kernel
+def union_find_roots(n, bond_a, bond_b):
+    """
+    Sequential union-find with path halving. Each union hooks the larger
+    root under the smaller, so root[i] is the smallest node index in the
+    component of node i, exactly as in find_roots_numpy.
+    """
+    parent = np.arange(n)
+    for k in range(bond_a.shape[0]):
+        a, b = bond_a[k], bond_b[k]
+        while parent[a] != a:
+            parent[a] = parent[parent[a]]
+            a = parent[a]
+        while parent[b] != b:
+            parent[b] = parent[parent[b]]
+            b = parent[b]
+        if a < b:
+            parent[b] = a
+        elif b < a:
+            parent[a] = b
+    for i in range(n):
+        parent[i] = parent[parent[i]]
+    return parent
+
+
+def find_roots_numpy(n, bond_a, bond_b):
+    """
+    Connected components of a graph with n nodes, fully vectorized.
+
+    Hook-and-compress: every root is hooked onto the smallest root among
+    its neighbours, then pointer jumping flattens all trees. Repeat until
+    no bond joins two different roots.
+
+    Returns:
+        root: root[i] is the smallest node index in the component of node i
+    """
+    root = np.arange(n)
+    while True:
+        ra, rb = root[bond_a], root[bond_b]
+        active = ra != rb
+        if not active.any():
+            return root
+        ra, rb = ra[active], rb[active]
+        np.minimum.at(root, np.maximum(ra, rb), np.minimum(ra, rb))
+        # Pointer jumping: root values only decrease, so this terminates
+        while True:
+            jumped = root[root]
+            if np.array_equal(jumped, root):
+                break
+            root = jumped
+
+
+def find_roots(n, bond_a, bond_b):
+    """Component roots (smallest node index) with the fastest available backend."""
+    if BACKEND == "numba":
+        return union_find_roots(n, np.ascontiguousarray(bond_a), np.ascontiguousarray(bond_b))
+    return find_roots_numpy(n, bond_a, bond_b)
+
+
+# ============================================================
+# Backend parity check
+# ============================================================
+
+def check_backend_parity(seed=0, L=16):
+    """
+    Run every kernel compiled and as plain Python on the same seeded
+    inputs, and the union-find kernel against the vectorized NumPy
+    version. Raises AssertionError on any mismatch; returns the names of
+    the checks that ran.
+    """
+    rng = np.random.default_rng(seed)
+    checks = []
+    for d in (2, 3):
+        shape = (L,) * d
+        neighbours = periodic_neighbours(shape)
+        spins = rng.choice(np.array([-1, 1], dtype=np.int8), size=neighbours.shape[0])
+        sites = rng.integers(0, spins.size, size=4 * spins.size)
+        thresholds = rng.random(sites.size)
+        acceptance = np.minimum(1.0, np.exp(-np.arange(-4 * d, 4 * d + 1) / 2.3))
+        results = []
+        for func in (metropolis_sweep, metropolis_sweep.py_func):
+            s = spins.copy()
+            results.append((func(s, neighbours, sites, thresholds, acceptance), s))
+        assert results[0][0] == results[1][0] and np.array_equal(results[0][1], results[1][1]), \
+            f"metropolis_sweep differs between backends (d={d})"
+        checks.append(f"metropolis_sweep d={d}")
+
+        couplings = rng.normal(1.0, 0.5, size=neighbours.shape)
+        vacant = spins * (rng.random(spins.size) < 0.9).astype(np.int8)
+        field_results = []
+        for func in (metropolis_field_sweep, metropolis_field_sweep.py_func):
+            s = vacant.copy()
+            field_results.append((func(s, neighbours, couplings, 0.3, sites, thresholds, 1 / 2.3), s))
+        assert field_results[0][0] == field_results[1][0] \
+            and np.array_equal(field_results[0][1], field_results[1][1]), \
+            f"metropolis_field_sweep differs between backends (d={d})"
+        checks.append(f"metropolis_field_sweep d={d}")
+
+        randoms = rng.random(neighbours.size)
+        seed_site = int(rng.integers(spins.size))
+        clusters = [func(results[0][1], neighbours, seed_site, 0.6, randoms)
+                    for func in (grow_cluster, grow_cluster.py_func)]
+        assert np.array_equal(clusters[0], clusters[1]), \
+            f"grow_cluster differs between backends (d={d})"
+        checks.append(f"grow_cluster d={d}")
+
+        projections = rng.standard_normal(spins.size)
+        clusters = [func(projections, neighbours, seed_site, 0.8, np.tile(randoms, 2), 3)
+                    for func in (grow_embedded_cluster, grow_embedded_cluster.py_func)]
+        assert np.array_equal(clusters[0][0], clusters[1][0]) and clusters[0][1] == clusters[1][1], \
+            f"grow_embedded_cluster differs between backends (d={d})"
+        checks.append(f"grow_embedded_cluster d={d}")
+
+        bonds = np.column_stack([np.repeat(np.arange(spins.size), 2 * d), neighbours.ravel()])
+        bonds = bonds[rng.random(len(bonds)) < 0.3]
+        roots = [func(spins.size, bonds[:, 0].copy(), bonds[:, 1].copy())
+                 for func in (union_find_roots, union_find_roots.py_func, find_roots_numpy)]
+        assert all(np.array_equal(roots[0], r) for r in roots[1:]), \
+            f"union-find roots differ between backends (d={d})"
+        checks.append(f"union_find_roots d={d}")
+    return checks
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="JIT kernel backend")
+    parser.add_argument("--check", action="store_true",
+                        help="verify that compiled and Python kernels agree")
+    args = parser.parse_args()
+    print(f"kernel backend: {BACKEND}")
+    if args.check:
+        for name in check_backend_parity():
+            print(f"  ok  {name}")
@@ -0,0 +1,27 @@
+"""
+Shared Numerical Helpers
+================================================================
+Small numerical routines used by several lecture scripts:
+1. logsumexp: log(sum(exp(a))) without overflow, for log-weights such as
+   ln g(E) - E / T in histogram reweighting and Wang-Landau averages
+
+Usage:
+    from numerics import logsumexp
+    log_z = logsumexp(log_g[None, :] - np.outer(beta, energies), axis=1)
+================================================================
+"""
+
+import numpy as np
+
+
+def logsumexp(a, axis=None):
+    """
+    log(sum(exp(a))) without overflow. A slice that is entirely -inf (zero
+    total weight) gives -inf rather than NaN.
+    """
+    a = np.asarray(a, dtype=float)
+    a_max = np.max(a, axis=axis, keepdims=True)
+    a_max = np.where(np.isfinite(a_max), a_max, 0.0)
+    with np.errstate(divide="ignore"):
+        out = np.log(np.sum(np.exp(a - a_max), axis=axis, keepdims=True)) + a_max
+    return out.squeeze(axis) if axis is not None else out.item()
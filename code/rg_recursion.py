@@ -0,0 +1,267 @@
+"""
+Real-Space RG Recursion Relations: Decimation and Migdal-Kadanoff
+================================================================
+Numerical flows of the Ising couplings (K, h), with
+H / kT = -K sum_<ij> s_i s_j - h sum_i s_i:
+1. d = 1: exact decimation of b - 1 out of every b spins
+2. d > 1: Migdal-Kadanoff bond moving (b^(d-1) parallel bonds merged
+   into one chain), followed by the same 1D decimation
+3. Flows over whole grids of initial couplings in one vectorized pass
+4. Fixed points by Newton iteration, with the eigenvalues of the
+   linearized recursion and the exponents y = ln(lambda) / ln(b)
+
+The chain is decimated through its 2 x 2 transfer matrix
+    T[s, s'] = exp(K s s' + e (s + s')),
+where each bond carries the field e = h / (2d) at both ends. Everything is
+done on ln T with logaddexp, so strong couplings (K -> infinity on the
+ordered side) never overflow.
+
+The diagram is a flow -> fixed_points -> render Experiment (see
+stage_cache.py): with --cache the flow grid is stored on disk, keyed on
+(d, b, grid), so redrawing a diagram is free.
+================================================================
+"""
+
+import argparse
+
+import numpy as np
+
+from batch_render import (RenderOptions, add_render_arguments, figure_style,
+                          finish_figure, options_from_args, save_data)
+from stage_cache import (Experiment, Stage, add_cache_arguments, cache_from_args,
+                         load_config)
+
+# Default stage parameters of plot_flow_diagram; the command line flags
+# override them
+FLOW_CONFIG = {
+    "flow": {"d": 2, "b": 2, "K_range": [0.0, 1.0], "h_range": [-0.5, 0.5],
+             "shape": [400, 400], "n_steps": 30},
+    "fixed_points": {},
+    "render": {},
+}
+
+
+def decimate_chain(K, e, b=2):
+    """
+    Sum out b - 1 of every b spins of a chain with bond weights
+    exp(K s s' + e (s + s')). Returns the renormalized (K', e').
+    """
+    K = np.asarray(K, dtype=float)
+    e = np.asarray(e, dtype=float)
+    # ln T for (s, s') = (+,+), (+,-), (-,+), (-,-)
+    bond = (K + 2 * e, -K, -K, K - 2 * e)
+    chain = bond
+    for _ in range(b - 1):
+        pp, pm, mp, mm = chain
+        bp, bpm, bmp, bm = bond
+        chain = (np.logaddexp(pp + bp, pm + bmp), np.logaddexp(pp + bpm, pm + bm),
+                 np.logaddexp(mp + bp, mm + bmp), np.logaddexp(mp + bpm, mm + bm))
+    pp, pm, mp, mm = chain
+    return 0.25 * (pp + mm - pm - mp), 0.25 * (pp - mm)
+
+
+def recursion(K, h, d=2, b=2):
+    """
+    One RG step (K, h) -> (K', h') with rescaling factor b.
+
+    In d = 1 this is exact decimation; for d > 1 it is the Migdal-Kadanoff
+    approximation, in which bond moving multiplies K and the bond-end
+    fields by b^(d-1).
+    """
+    moved = b ** (d - 1)
+    K_new, e_new = decimate_chain(moved * np.asarray(K, dtype=float),
+                                  moved * np.asarray(h, dtype=float) / (2 * d), b)
+    return K_new, 2 * d * e_new
+
+
+def flow(K, h, d=2, b=2, n_steps=20):
+    """
+    Trajectories of all initial couplings at once.
+
+    K and h broadcast against each other; returns arrays of shape
+    (n_steps + 1,) + broadcast shape.
+    """
+    K, h = np.broadcast_arrays(np.asarray(K, dtype=float), np.asarray(h, dtype=float))
+    K_path = np.empty((n_steps + 1,) + K.shape)
+    h_path = np.empty_like(K_path)
+    K_path[0], h_path[0] = K, h
+    for n in range(n_steps):
+        K_path[n + 1], h_path[n + 1] = recursion(K_path[n], h_path[n], d, b)
+    return K_path, h_path
+
+
+def jacobian(K, h, d=2, b=2, eps=1e-6):
+    """d(K', h') / d(K, h) by central differences."""
+    J = np.empty((2, 2))
+    for col, (dK, dh) in enumerate(((eps, 0.0), (0.0, eps))):
+        plus = recursion(K + dK, h + dh, d, b)
+        minus = recursion(K - dK, h - dh, d, b)
+        J[:, col] = [(p - m) / (2 * eps) for p, m in zip(plus, minus)]
+    return J
+
+
+def find_fixed_point(K0, h0=0.0, d=2, b=2, tol=1e-12, max_iter=100):
+    """
+    Newton iteration for (K*, h*) = R(K*, h*) starting from (K0, h0).
+
+    Returns a dict with K, h, eigenvalues and eigenvectors of the
+    linearized recursion (sorted by decreasing |lambda|) and the RG
+    exponents y = ln|lambda| / ln(b); y > 0 marks a relevant direction.
+    """
+    x = np.array([K0, h0], dtype=float)
+    for _ in range(max_iter):
+        residual = np.array(recursion(x[0], x[1], d, b), dtype=float) - x
+        step = np.linalg.solve(jacobian(x[0], x[1], d, b) - np.eye(2), -residual)
+        x += step
+        if np.max(np.abs(step)) < tol:
+            break
+    else:
+        raise RuntimeError(f"Newton iteration from K0={K0}, h0={h0} did not converge")
+    eigenvalues, eigenvectors = np.linalg.eig(jacobian(x[0], x[1], d, b))
+    order = np.argsort(-np.abs(eigenvalues))
+    eigenvalues, eigenvectors = eigenvalues[order].real, eigenvectors[:, order].real
+    return {
+        "K": x[0],
+        "h": x[1],
+        "eigenvalues": eigenvalues,
+        "eigenvectors": eigenvectors,
+        "exponents": np.log(np.abs(eigenvalues)) / np.log(b),
+    }
+
+
+def in_sink(K, h, K_strong=10.0, K_weak=1e-3, h_strong=1.0):
+    """Whether (K, h) has reached a sink: strong coupling, strong field, or free spins."""
+    return (K > K_strong) | (np.abs(h) > h_strong) | ((K < K_weak) & (np.abs(h) < K_weak))
+
+
+def classify_flow(K_final, h_final, K_strong=10.0, h_strong=1.0):
+    """
+    Sink each trajectory ends in: +1 / -1 ordered or field-polarized (sign
+    of the field), 0 disordered (couplings decayed).
+    """
+    ordered = (K_final > K_strong) | (np.abs(h_final) > h_strong)
+    return np.where(ordered, np.where(h_final < 0, -1, 1), 0).astype(np.int8)
+
+
+def flow_grid(d=2, b=2, K_range=(0.0, 1.0), h_range=(-0.5, 0.5),
+              shape=(400, 400), n_steps=30):
+    """
+    RG flow on a (K, h) grid.
+
+    Returns a dict with K, h (grid axes) and, each (n_h, n_K):
+        dK, dh: one-step flow field
+        phase: classify_flow of the end points
+        steps_to_sink: RG steps until the trajectory reaches a sink; it
+                       diverges at the critical fixed point, which makes
+                       the phase boundary and crossover region visible
+    """
+    K_axis = np.linspace(*K_range, shape[0])
+    h_axis = np.linspace(*h_range, shape[1])
+    K, h = np.meshgrid(K_axis, h_axis)
+    K_end, h_end = recursion(K, h, d, b)
+    dK, dh = K_end - K, h_end - h
+    steps = np.where(in_sink(K, h), 0, n_steps).astype(np.int32)
+    for n in range(1, n_steps):
+        steps = np.where((steps == n_steps) & in_sink(K_end, h_end), n, steps)
+        K_end, h_end = recursion(K_end, h_end, d, b)
+    return {"K": K_axis, "h": h_axis, "dK": dK, "dh": dh,
+            "phase": classify_flow(K_end, h_end), "steps_to_sink": steps}
+
+
+def critical_fixed_points(d=2, b=2):
+    """Fixed points drawn on the diagram: the critical one on h = 0 (none for d = 1)."""
+    # d = 1 only has K* = 0 and infinity
+    return [] if d == 1 else [find_fixed_point(0.5, 0.0, d, b)]
+
+
+@figure_style("default")
+def render_flow_diagram(grid, fixed_points, d, b, options=None):
+    """Steps-to-sink map with streamlines of the one-step flow and fixed points."""
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(8, 6))
+    mesh = ax.pcolormesh(grid["K"], grid["h"], grid["steps_to_sink"],
+                         cmap="magma", shading="auto")
+    fig.colorbar(mesh, ax=ax, label="RG steps to reach a sink")
+    ax.streamplot(grid["K"], grid["h"], grid["dK"], grid["dh"],
+                  color="white", linewidth=0.6, density=1.4, arrowsize=0.8)
+    for fp in fixed_points:
+        ax.plot(fp["K"], fp["h"], "o", color="red", ms=8, zorder=5)
+        ax.annotate(f"$K^*={fp['K']:.4f}$\n$y={fp['exponents'][0]:.3f}$",
+                    (fp["K"], fp["h"]), xytext=(8, 8), textcoords="offset points",
+                    color="white")
+    ax.set_xlim(grid["K"][0], grid["K"][-1])
+    ax.set_ylim(grid["h"][0], grid["h"][-1])
+    ax.set_xlabel("Coupling $K = J / k_B T$")
+    ax.set_ylabel("Field $h$")
+    scheme = "Exact decimation" if d == 1 else "Migdal-Kadanoff"
+    ax.set_title(f"{scheme} RG Flow (d={d}, b={b})")
+    plt.tight_layout()
+    return finish_figure(fig, f"rg_flow_d{d}_b{b}", options, bbox_inches="tight")
+
+
+def plot_flow_diagram(options=None, cache=None, config=None):
+    """
+    Flow diagram as a memoized flow -> fixed_points -> render experiment:
+    with a StageCache, only a new grid or new (d, b) recomputes the flow.
+    """
+    options = options or RenderOptions()
+    config = load_config(config or FLOW_CONFIG)
+    d, b = config["flow"]["d"], config["flow"]["b"]
+    config["fixed_points"].update(d=d, b=b)
+    config["render"]["output"] = {"dpi": options.dpi, "fmt": options.fmt,
+                                  "output_dir": options.output_dir, "plot": options.plot}
+
+    def render(grid, fixed_points, output):
+        if not options.plot:
+            return save_data(f"rg_flow_d{d}_b{b}", options, **grid)
+        return render_flow_diagram(grid, fixed_points, d, b, options)
+
+    recursion_code = (recursion, decimate_chain)
+    experiment = Experiment([Stage("flow", flow_grid,
+                                   code=recursion_code + (in_sink, classify_flow)),
+                             Stage("fixed_points", critical_fixed_points, inputs=(),
+                                   code=recursion_code + (find_fixed_point, jacobian)),
+                             # An interactive figure must be shown every time
+                             Stage("render", render, inputs=("flow", "fixed_points"),
+                                   produces_files=True, code=(render_flow_diagram,),
+                                   cacheable=options.batch)],
+                            cache=cache)
+    outputs = experiment.run(config)
+    for fp in outputs["fixed_points"]:
+        # Thermal direction: the eigenvector along K
+        y_T = fp["exponents"][np.argmax(np.abs(fp["eigenvectors"][0]))]
+        print(f"K* = {fp['K']:.6f}, eigenvalues {fp['eigenvalues']}, "
+              f"y = {fp['exponents']}, nu = {1 / y_T:.4f}")
+    return outputs["render"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Real-space RG recursion flows")
+    parser.add_argument("--dim", type=int, help="dimension d (default: 2)")
+    parser.add_argument("--b", type=int, help="rescaling factor (default: 2)")
+    parser.add_argument("--resolution", type=int,
+                        help="grid points per axis (default: 400)")
+    parser.add_argument("--k-max", type=float, help="largest K (default: 1.0)")
+    parser.add_argument("--h-max", type=float, help="largest |h| (default: 0.5)")
+    add_render_arguments(parser)
+    add_cache_arguments(parser)
+    args = parser.parse_args(argv)
+
+    config = load_config(FLOW_CONFIG, args.config)
+    flow = config["flow"]
+    # Flags given on the command line override the config file
+    for name, value in (("d", args.dim), ("b", args.b)):
+        if value is not None:
+            flow[name] = value
+    if args.resolution is not None:
+        flow["shape"] = [args.resolution, args.resolution]
+    if args.k_max is not None:
+        flow["K_range"] = [0.0, args.k_max]
+    if args.h_max is not None:
+        flow["h_range"] = [-args.h_max, args.h_max]
+    return plot_flow_diagram(options_from_args(args), cache_from_args(args), config)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""
+Shared-Memory Slot Buffers for Multi-Process Pipelines
+================================================================
+Returning a configuration from a worker process normally pickles it:
+an L = 128 percolation run sends occupied (2 MB) plus int64 labels
+(16 MB) back through a pipe, and the parent copies them again. Here
+workers write straight into preallocated shared arrays instead:
+1. A SharedBufferPool holds n_slots copies of a fixed layout
+   ({field: (shape, dtype)}), one shared-memory block per field
+2. The parent acquires a free slot, submits a job carrying only the
+   pool's handle (block names, layout) and the slot index, and the
+   worker attaches once per process and fills that slot in place
+3. Consumers read the slot as plain numpy views (zero copy) and then
+   release it for reuse; with all slots busy the producer waits for the
+   consumer, so memory stays bounded (back-pressure)
+
+Usage:
+    layout = {"lattice": ((L, L), np.int8)}
+    with SharedBufferPool(layout, n_slots=8) as buffers:
+        for slot, views, result in buffers.imap(worker, jobs, executor):
+            consume(views["lattice"])
+
+where worker(handle, slot, *job) fills SharedBufferPool.attach(handle)
+.views(slot) and returns only small metadata.
+================================================================
+"""
+
+import collections
+import os
+import sys
+from concurrent.futures import FIRST_COMPLETED, wait
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Pools mapped in this process (created or attached), by the name of
+# their first block; close() removes a pool's entry
+_attached = {}
+
+
+def _attach_block(name):
+    """Open an existing block without taking ownership of its lifetime."""
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    # Before 3.13 attaching also registers the block with the resource
+    # tracker; pool workers share the owner's tracker, where this is a
+    # no-op, so the owner's unlink stays the only cleanup
+    return shared_memory.SharedMemory(name=name)
+
+
+def _block_exists(name):
+    try:
+        _attach_block(name).close()
+    except FileNotFoundError:
+        return False
+    return True
+
+
+class SharedBufferPool:
+    """
+    n_slots shared copies of a record layout {field: (shape, dtype)}.
+
+    The creating process owns the blocks and unlinks them in close();
+    processes that attach() only map them. Slot bookkeeping (acquire /
+    release) lives in the owning process.
+    """
+    def __init__(self, layout, n_slots, _names=None):
+        self.layout = {field: (tuple(shape), np.dtype(dtype).str)
+                       for field, (shape, dtype) in layout.items()}
+        self.n_slots = n_slots
+        self.owner = _names is None
+        self.pid = os.getpid()
+        self.blocks = {}
+        self.arrays = {}
+        for field, (shape, dtype) in self.layout.items():
+            size = max(1, n_slots * int(np.prod(shape)) * np.dtype(dtype).itemsize)
+            if self.owner:
+                block = shared_memory.SharedMemory(create=True, size=size)
+            else:
+                block = _attach_block(_names[field])
+            self.blocks[field] = block
+            self.arrays[field] = np.ndarray((n_slots,) + shape, dtype=dtype, buffer=block.buf)
+        self.free = collections.deque(range(n_slots))
+        self.key = next(iter(self.blocks.values())).name
+        if self.owner:
+            # attach() in the owning process (inline imap) reuses this pool
+            _attached[self.key] = self
+
+    @property
+    def owned(self):
+        """True in the process that created the blocks (not in forked children)."""
+        return self.owner and self.pid == os.getpid()
+
+    @property
+    def handle(self):
+        """Small picklable description that workers pass to attach()."""
+        return {"layout": self.layout, "n_slots": self.n_slots,
+                "names": {field: block.name for field, block in self.blocks.items()}}
+
+    @classmethod
+    def attach(cls, handle):
+        """
+        The pool behind handle, mapped once per process and then reused.
+        Mappings of pools whose owner has since unlinked them are dropped
+        first, so long-lived workers do not accumulate dead mappings.
+        """
+        key = next(iter(handle["names"].values()))
+        if key not in _attached:
+            for stale in [k for k, pool in _attached.items()
+                          if not pool.owned and not _block_exists(k)]:
+                _attached[stale].close()
+            _attached[key] = cls(handle["layout"], handle["n_slots"], _names=handle["names"])
+        return _attached[key]
+
+    def views(self, slot):
+        """{field: ndarray} of one slot; writes go straight to shared memory."""
+        return {field: array[slot] for field, array in self.arrays.items()}
+
+    def acquire(self):
+        """A free slot index, or None if every slot is in use."""
+        return self.free.popleft() if self.free else None
+
+    def release(self, slot):
+        self.free.append(slot)
+
+    def imap(self, worker, jobs, executor=None):
+        """
+        Run worker(handle, slot, *job) for every job, each in its own
+        slot, and yield (slot, views, result) as jobs complete.
+
+        At most n_slots jobs are in flight; the next job is submitted only
+        when the consumer hands a slot back by requesting the next item,
+        so the yielded views are valid until then. Without an executor the
+        jobs run inline, one slot at a time.
+        """
+        jobs = iter(jobs)
+        if executor is None:
+            for job in jobs:
+                slot = self.acquire()
+                try:
+                    yield slot, self.views(slot), worker(self.handle, slot, *job)
+                finally:
+                    self.release(slot)
+            return
+        handle = self.handle
+        running = {}
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and self.free:
+                    job = next(jobs, None)
+                    if job is None:
+                        exhausted = True
+                        break
+                    slot = self.acquire()
+                    running[executor.submit(worker, handle, slot, *job)] = slot
+                if not running:
+                    return
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    slot = running.pop(future)
+                    try:
+                        yield slot, self.views(slot), future.result()
+                    finally:
+                        self.release(slot)
+        finally:
+            for future in running:
+                future.cancel()
+            wait(running)
+            for slot in running.values():
+                self.release(slot)
+
+    def close(self):
+        """
+        Drop the views; the owner also unlinks the blocks. Views a consumer
+        still holds keep their mapping alive until they are garbage
+        collected, but must not be used after close().
+        """
+        if _attached.get(getattr(self, "key", None)) is self:
+            del _attached[self.key]
+        self.arrays = {}
+        for block in self.blocks.values():
+            try:
+                block.close()
+            except BufferError:
+                pass
+            if self.owned:
+                block.unlink()
+        self.blocks = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
@@ -0,0 +1,322 @@
+"""
+q-State Potts and O(n) Spin Models with the IsingRG Interface
+================================================================
+Companions to IsingRG for comparing universality classes. Both models
+live on a periodic L^d hypercubic lattice with J = 1, k_B = 1:
+1. PottsRG: H = -sum_<ij> delta(s_i, s_j), states s = 0..q-1 stored as
+   uint8; T_c = 1 / ln(1 + sqrt(q)) in 2D, continuous for q <= 4
+2. ONModel: H = -sum_<ij> s_i . s_j with unit n-vectors stored as
+   float32 (n = 2: XY model, n = 3: Heisenberg)
+
+Every model offers the IsingRG API: simulate(steps, method), energy(),
+magnetization(), time_series(), stream(), coarse_grain() and
+checkpoints. Updates:
+- 'checkerboard': sublattice sweeps vectorized over all sites of one
+  colour; heat-bath for Potts, Metropolis for O(n)
+- 'cluster': Swendsen-Wang for Potts (union-find over the open bonds),
+  Wolff embedding clusters for O(n) (kernels.grow_embedded_cluster),
+  which remove critical slowing down for large-L runs
+
+Block spins: plurality vote for Potts, normalized block sum for O(n),
+ties broken randomly in both cases.
+
+Usage:
+    from spin_models import PottsRG, XYModel, potts_critical_temperature
+    model = PottsRG(L=128, T=potts_critical_temperature(3), q=3)
+    model.simulate(200, method="cluster")
+    blocks = model.coarse_grain(block_size=2)
+================================================================
+"""
+
+import json
+
+import numpy as np
+
+from disorder import sublattice_masks
+from kernels import find_roots, grow_embedded_cluster, periodic_neighbours
+
+
+def potts_critical_temperature(q):
+    """Exact 2D transition temperature of the q-state Potts model."""
+    return 1.0 / np.log(1.0 + np.sqrt(q))
+
+
+class LatticeModel:
+    """
+    Shared machinery of the spin models: periodic neighbour table,
+    checkerboard sublattices, the simulate/stream/time_series loop and
+    checkpoints. Subclasses store their spins in self.lattice, shape
+    (L,) * d (+ (n,) for vector spins), and implement the updates and
+    observables.
+    """
+    def __init__(self, L=64, T=1.0, d=2, seed=None):
+        self.L = L
+        self.T = T
+        self.d = d
+        self.rng = np.random.default_rng(seed)
+        self.sweeps = 0
+        self.shape = (L,) * d
+        self.n_sites = L ** d
+        self.neighbours = periodic_neighbours(self.shape)
+        # Flat indices of the even and odd sites (raises for an odd L)
+        self.sublattice_sites = tuple(np.flatnonzero(mask)
+                                      for mask in sublattice_masks(self.shape))
+        # Each bond once: site -> its neighbour in the +1 roll of every axis
+        self.bond_a = np.repeat(np.arange(self.n_sites), d)
+        self.bond_b = self.neighbours[:, 0::2].ravel()
+
+    def parameters(self):
+        """Model parameters beyond L, T and d (for checkpoints)."""
+        return {}
+
+    def simulate(self, steps=1000, method="checkerboard"):
+        """
+        Run `steps` sweeps.
+
+        method: 'checkerboard' (vectorized local sweeps) or 'cluster'
+                (Swendsen-Wang / Wolff, see the subclass)
+        """
+        step = {"checkerboard": self.checkerboard_step,
+                "cluster": self.cluster_step}[method]
+        for _ in range(steps):
+            step()
+
+    def time_series(self, n_samples, thin=1, method="checkerboard"):
+        """Total energy E and order parameter M * N after every `thin` sweeps."""
+        E = np.empty(n_samples)
+        M = np.empty(n_samples)
+        for i in range(n_samples):
+            self.simulate(steps=thin, method=method)
+            E[i] = self.energy() * self.n_sites
+            M[i] = self.magnetization() * self.n_sites
+        return E, M
+
+    def stream(self, n_samples, thin=1, method="checkerboard"):
+        """
+        Yield the live lattice after every `thin` sweeps, n_samples times;
+        copy it before resuming to keep it.
+        """
+        for _ in range(n_samples):
+            self.simulate(steps=thin, method=method)
+            yield self.lattice
+
+    def _bond_pairs(self):
+        """Flat spin values at both ends of every bond."""
+        flat = self.lattice.reshape(self.n_sites, -1)
+        return flat[self.bond_a], flat[self.bond_b]
+
+    def save_checkpoint(self, path):
+        """Save lattice, parameters and RNG state so a run can be resumed."""
+        np.savez(path, lattice=self.lattice, L=self.L, T=self.T, d=self.d,
+                 sweeps=self.sweeps, parameters=json.dumps(self.parameters()),
+                 rng_state=json.dumps(self.rng.bit_generator.state))
+
+    @classmethod
+    def from_checkpoint(cls, path):
+        """Restore a model written by save_checkpoint."""
+        with np.load(path) as data:
+            model = cls(L=int(data["L"]), T=float(data["T"]), d=int(data["d"]),
+                        **json.loads(str(data["parameters"])))
+            model.lattice = data["lattice"].copy()
+            model.sweeps = int(data["sweeps"])
+            model.rng.bit_generator.state = json.loads(str(data["rng_state"]))
+        return model
+
+
+class PottsRG(LatticeModel):
+    """
+    q-state Potts model, H = -sum_<ij> delta(s_i, s_j).
+
+    The order parameter is m = (q * max_k n_k / N - 1) / (q - 1), with n_k
+    the number of sites in state k: 1 when ordered, ~0 when disordered.
+    """
+    def __init__(self, L=64, T=1.0, q=3, d=2, seed=None):
+        if not 2 <= q <= 255:
+            raise ValueError("q must be between 2 and 255 (uint8 states)")
+        super().__init__(L, T, d, seed)
+        self.q = q
+        self.lattice = self.rng.integers(0, q, size=self.shape, dtype=np.uint8)
+
+    def parameters(self):
+        return {"q": self.q}
+
+    def checkerboard_step(self):
+        """
+        Heat-bath sweep: every site of one sublattice draws its new state
+        from P(k) ~ exp(n_k / T), n_k = neighbours in state k.
+        """
+        flat = self.lattice.reshape(-1)
+        states = np.arange(self.q, dtype=np.uint8)
+        for sites in self.sublattice_sites:
+            nb = flat[self.neighbours[sites]]
+            counts = (nb[:, :, None] == states).sum(axis=1)
+            weights = np.exp((counts - counts.max(axis=1, keepdims=True)) / self.T)
+            cumulative = np.cumsum(weights, axis=1)
+            u = self.rng.random(len(sites)) * cumulative[:, -1]
+            flat[sites] = (cumulative < u[:, None]).sum(axis=1)
+        self.sweeps += 1
+
+    def cluster_step(self):
+        """
+        Swendsen-Wang sweep: open every satisfied bond with probability
+        1 - exp(-1 / T), then give each cluster a new random state.
+        """
+        flat = self.lattice.reshape(-1)
+        a, b = self.bond_a, self.bond_b
+        open_bonds = (flat[a] == flat[b]) & (self.rng.random(a.size) < -np.expm1(-1.0 / self.T))
+        root = find_roots(self.n_sites, a[open_bonds], b[open_bonds])
+        new_states = self.rng.integers(0, self.q, size=self.n_sites, dtype=np.uint8)
+        flat[:] = new_states[root]
+        self.sweeps += 1
+
+    def energy(self):
+        """Energy per site e = -(1/N) sum_<ij> delta(s_i, s_j)"""
+        s_a, s_b = self._bond_pairs()
+        return -np.count_nonzero(s_a == s_b) / self.n_sites
+
+    def magnetization(self):
+        """Potts order parameter m = (q max_k n_k / N - 1) / (q - 1)"""
+        counts = np.bincount(self.lattice.ravel(), minlength=self.q)
+        return (self.q * counts.max() / self.n_sites - 1.0) / (self.q - 1)
+
+    def coarse_grain(self, block_size=2):
+        """Plurality-vote block spins; ties are broken randomly."""
+        b = block_size
+        new_shape = [n // b for n in self.shape]
+        cropped = self.lattice[tuple(slice(0, n * b) for n in new_shape)]
+        blocks = cropped.reshape([x for n in new_shape for x in (n, b)])
+        block_axes = tuple(range(1, 2 * self.d, 2))
+        counts = np.stack([(blocks == k).sum(axis=block_axes) for k in range(self.q)])
+        # Counts are integers, so a uniform jitter in [0, 1) only breaks ties
+        counts = counts + self.rng.random(counts.shape)
+        return counts.argmax(axis=0).astype(np.uint8)
+
+
+def random_unit_vectors(rng, shape, n):
+    """Uniformly distributed unit n-vectors, float32, shape + (n,)."""
+    v = rng.standard_normal(tuple(shape) + (n,))
+    return (v / np.linalg.norm(v, axis=-1, keepdims=True)).astype(np.float32)
+
+
+class ONModel(LatticeModel):
+    """
+    O(n) vector model, H = -sum_<ij> s_i . s_j, with |s_i| = 1.
+
+    n = 2 is the XY model (BKT transition at T ~ 0.893 in 2D), n = 3 the
+    Heisenberg model. Spins are float32, (L,) * d + (n,).
+    """
+    def __init__(self, L=64, T=1.0, n=2, d=2, seed=None, step_size=1.0,
+                 clusters_per_sweep=None):
+        super().__init__(L, T, d, seed)
+        self.n = n
+        self.step_size = step_size
+        self.clusters_per_sweep = clusters_per_sweep
+        self.lattice = random_unit_vectors(self.rng, self.shape, n)
+        self._randoms = np.empty(0)
+        self._draw = 0
+
+    def parameters(self):
+        return {"n": self.n, "step_size": self.step_size,
+                "clusters_per_sweep": self.clusters_per_sweep}
+
+    def checkerboard_step(self):
+        """
+        Metropolis sweep: each sublattice proposes s' = normalize(s +
+        step_size * gaussian) at all its sites at once.
+        """
+        flat = self.lattice.reshape(self.n_sites, self.n)
+        for sites in self.sublattice_sites:
+            s = flat[sites]
+            h = flat[self.neighbours[sites]].sum(axis=1)
+            trial = s + self.step_size * self.rng.standard_normal(s.shape)
+            trial /= np.linalg.norm(trial, axis=1, keepdims=True)
+            dE = -np.einsum("ij,ij->i", trial - s, h)
+            accept = self.rng.random(len(sites)) < np.exp(-np.maximum(dE, 0.0) / self.T)
+            flat[sites[accept]] = trial[accept]
+        self.sweeps += 1
+
+    def _uniforms(self):
+        """Buffer with at least N * 2d unused uniforms for one cluster."""
+        needed = self.neighbours.size
+        if len(self._randoms) - self._draw < needed:
+            self._randoms = self.rng.random(2 * needed)
+            self._draw = 0
+        return self._randoms
+
+    def wolff_cluster(self):
+        """
+        Grow and flip one Wolff cluster: reflect its spins in the plane
+        perpendicular to a random unit vector r. Returns the cluster size.
+        """
+        flat = self.lattice.reshape(self.n_sites, self.n)
+        r = random_unit_vectors(self.rng, (), self.n).astype(float)
+        projections = flat @ r
+        seed_site = int(self.rng.integers(self.n_sites))
+        cluster, self._draw = grow_embedded_cluster(
+            projections, self.neighbours, seed_site, 2.0 / self.T,
+            self._uniforms(), self._draw)
+        flat[cluster] -= (2.0 * projections[cluster, None] * r).astype(np.float32)
+        return len(cluster)
+
+    def cluster_step(self):
+        """
+        One sweep of clusters_per_sweep Wolff clusters. The count must not
+        depend on the current state (stopping once N spins have flipped
+        biases the measurements), so unless given it is fixed by the first
+        sweep: clusters until about N spins have been flipped.
+        """
+        # Start every sweep with a fresh random buffer, so a run resumed
+        # from a checkpoint continues exactly
+        self._randoms, self._draw = np.empty(0), 0
+        if self.clusters_per_sweep is None:
+            flipped, count = 0, 0
+            while flipped < self.n_sites:
+                flipped += self.wolff_cluster()
+                count += 1
+            self.clusters_per_sweep = count
+        else:
+            for _ in range(self.clusters_per_sweep):
+                self.wolff_cluster()
+        # Reflections preserve |s| only up to float32 round-off
+        self.lattice /= np.linalg.norm(self.lattice, axis=-1, keepdims=True)
+        self.sweeps += 1
+
+    def energy(self):
+        """Energy per site e = -(1/N) sum_<ij> s_i . s_j"""
+        s_a, s_b = self._bond_pairs()
+        return -np.einsum("ij,ij->", s_a, s_b, dtype=float) / self.n_sites
+
+    def magnetization(self):
+        """|m| = |sum_i s_i| / N"""
+        total = self.lattice.reshape(self.n_sites, self.n).sum(axis=0, dtype=float)
+        return float(np.linalg.norm(total)) / self.n_sites
+
+    @property
+    def angles(self):
+        """XY angles in (-pi, pi], float32 (n = 2 only)."""
+        if self.n != 2:
+            raise ValueError("angles are defined for the XY model (n = 2)")
+        return np.arctan2(self.lattice[..., 1], self.lattice[..., 0])
+
+    def coarse_grain(self, block_size=2):
+        """Normalized block sums; blocks that sum to zero get a random direction."""
+        b = block_size
+        new_shape = [m // b for m in self.shape]
+        cropped = self.lattice[tuple(slice(0, m * b) for m in new_shape)]
+        blocks = cropped.reshape([x for m in new_shape for x in (m, b)] + [self.n])
+        total = blocks.sum(axis=tuple(range(1, 2 * self.d, 2)), dtype=float)
+        norm = np.linalg.norm(total, axis=-1, keepdims=True)
+        random = random_unit_vectors(self.rng, new_shape, self.n)
+        return np.where(norm > 1e-6, total / np.maximum(norm, 1e-12), random).astype(np.float32)
+
+
+class XYModel(ONModel):
+    """The O(2) model."""
+    def __init__(self, L=64, T=1.0, d=2, seed=None, step_size=1.0, clusters_per_sweep=None):
+        super().__init__(L, T, n=2, d=d, seed=seed, step_size=step_size,
+                         clusters_per_sweep=clusters_per_sweep)
+
+    def parameters(self):
+        parameters = super().parameters()
+        del parameters["n"]
+        return parameters
@@ -0,0 +1,268 @@
+"""
+Parameter-Hashed Experiment Stages with an On-Disk Cache
+================================================================
+A lecture pipeline is a chain of stages, e.g.
+    simulate -> coarse_grain -> measure -> fit -> render
+each a function of its parameters and of the outputs of earlier stages.
+Experiment runs such a chain from a config dict ({stage: params}):
+1. Every stage gets a key: the SHA-256 of its name, its parameters, the
+   source code of its function and the keys of its inputs. Changing a
+   parameter therefore invalidates that stage and everything downstream,
+   and nothing upstream
+2. Stage outputs are pickled under the key in a cache directory and
+   reused on the next run; editing a plot label reruns only `render`
+3. The cache is LRU under a size cap: a hit refreshes the entry's mtime,
+   and after every write the least recently used entries are deleted
+   until the directory fits in max_bytes
+4. Stages that write files (figures, GIFs) count as cached only while
+   those files still exist; a stage's key also covers the source of the
+   helpers it calls (Stage(..., code=...)), so editing a plot label in
+   the renderer redraws the figure
+5. Stages with side effects that must always happen (showing a window,
+   handing a figure to a background worker) are marked cacheable=False
+   and run every time
+
+Usage:
+    experiment = Experiment([Stage("simulate", simulate),
+                             Stage("render", render, produces_files=True)],
+                            cache=StageCache("stage_cache"))
+    outputs = experiment.run({"simulate": {"L": 64}, "render": {"dpi": 150}})
+================================================================
+"""
+
+import functools
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import tempfile
+
+import numpy as np
+
+DEFAULT_CACHE_DIR = "stage_cache"
+DEFAULT_CACHE_MB = 2048
+
+
+def _jsonable(value):
+    """json.dumps fallback for the numpy values that appear in configs."""
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"stage parameter of type {type(value).__name__} cannot be hashed")
+
+
+def _source(func):
+    """Source code of func (unwrapping partials), or its name if unavailable."""
+    while isinstance(func, functools.partial):
+        func = func.func
+    try:
+        return inspect.getsource(func)
+    except (OSError, TypeError):
+        return getattr(func, "__qualname__", repr(func))
+
+
+def stage_key(name, params, func=None, upstream=(), code=()):
+    """
+    Hex digest identifying one stage run: name, params, input keys and the
+    source of func and of the helpers (functions, classes or modules) in
+    `code`.
+    """
+    payload = json.dumps({"stage": name, "params": params, "upstream": list(upstream),
+                          "code": _source(func) if func is not None else None,
+                          "helpers": [_source(helper) for helper in code]},
+                         sort_keys=True, default=_jsonable)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class StageCache:
+    """
+    Pickled stage outputs in one directory, evicted least-recently-used.
+
+    Parameters:
+        cache_dir: Directory holding <key>.pkl files (created on demand)
+        max_bytes: Size cap; the most recent entry is kept even if it
+                   alone exceeds the cap
+    """
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_CACHE_MB * 2 ** 20):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pkl")
+
+    def load(self, key):
+        """(True, value) on a hit, refreshing its LRU position; (False, None) otherwise."""
+        path = self.path(key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return False, None
+        os.utime(path)
+        return True, value
+
+    def store(self, key, value):
+        """Write value atomically, then evict down to max_bytes."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self.path(key))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        self.evict()
+
+    def entries(self):
+        """(mtime, size, path) of every entry, least recently used first."""
+        if not os.path.isdir(self.cache_dir):
+            return []
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".pkl"):
+                stat = os.stat(os.path.join(self.cache_dir, name))
+                entries.append((stat.st_mtime, stat.st_size,
+                                os.path.join(self.cache_dir, name)))
+        return sorted(entries)
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits. Returns their paths."""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        removed = []
+        for _, size, path in entries[:-1]:
+            if total <= self.max_bytes:
+                break
+            os.unlink(path)
+            total -= size
+            removed.append(path)
+        return removed
+
+    def clear(self):
+        for _, _, path in self.entries():
+            os.unlink(path)
+
+
+class Stage:
+    """
+    One step of an Experiment.
+
+    Parameters:
+        name: Key of the stage's parameters in the config
+        func: Called as func(*outputs_of_inputs, **params)
+        inputs: Names of earlier stages whose outputs func receives; by
+                default the previous stage (none for the first stage)
+        produces_files: The output is a path (or list of paths) that must
+                        still exist for a cached result to count
+        code: Functions, classes or modules func calls whose source
+              belongs in the key, e.g. the renderer behind a small closure
+        cacheable: If False the stage always runs and is never stored
+                   (its upstream stages are still cached)
+    """
+    def __init__(self, name, func, inputs=None, produces_files=False, code=(),
+                 cacheable=True):
+        self.name = name
+        self.func = func
+        self.inputs = inputs
+        self.produces_files = produces_files
+        self.code = tuple(code)
+        self.cacheable = cacheable
+
+
+def _files_exist(output):
+    paths = [output] if isinstance(output, (str, os.PathLike)) else output or []
+    return all(os.path.exists(p) for p in paths)
+
+
+class Experiment:
+    """
+    A chain of Stages memoized in a StageCache.
+
+    With cache=None every stage runs every time, which is the plain,
+    uncached behaviour of the scripts.
+    """
+    def __init__(self, stages, cache=None, verbose=True):
+        self.stages = list(stages)
+        self.cache = cache
+        self.verbose = verbose
+        self.keys = {}
+        self.ran = []
+
+    def run(self, config):
+        """
+        Run (or fetch) every stage with parameters config[stage.name]
+        (empty if absent). Returns {stage name: output}; afterwards
+        self.ran lists the stages that actually executed.
+        """
+        outputs = {}
+        self.keys = {}
+        self.ran = []
+        previous = None
+        for stage in self.stages:
+            inputs = stage.inputs if stage.inputs is not None else \
+                ((previous,) if previous is not None else ())
+            params = config.get(stage.name, {})
+            key = stage_key(stage.name, params, stage.func,
+                            [self.keys[name] for name in inputs], stage.code)
+            self.keys[stage.name] = key
+            cached = self.cache is not None and stage.cacheable
+            hit, value = self.cache.load(key) if cached else (False, None)
+            if hit and stage.produces_files and not _files_exist(value):
+                hit = False
+            if self.verbose:
+                print(f"  [{stage.name}] {'cached' if hit else 'running'} ({key[:12]})")
+            if not hit:
+                value = stage.func(*(outputs[name] for name in inputs), **params)
+                self.ran.append(stage.name)
+                if cached:
+                    self.cache.store(key, value)
+            outputs[stage.name] = value
+            previous = stage.name
+        return outputs
+
+
+def load_config(defaults, path=None):
+    """
+    defaults updated stage by stage from a JSON file {stage: {param: value}},
+    so a config file only needs the parameters it changes.
+    """
+    config = {name: dict(params) for name, params in defaults.items()}
+    if path:
+        with open(path) as f:
+            for name, params in json.load(f).items():
+                config.setdefault(name, {}).update(params)
+    return config
+
+
+def add_cache_arguments(parser):
+    """Add the stage-cache command line flags to an argparse parser."""
+    group = parser.add_argument_group(
+        "stage cache",
+        "Caching is off by default; with --cache (or RG_CACHE_DIR set) stage "
+        "outputs are stored on disk and reused while their parameters and "
+        "code are unchanged.")
+    group.add_argument("--config", help="JSON file overriding stage parameters")
+    group.add_argument("--cache", dest="cache", action="store_true",
+                       default=bool(os.environ.get("RG_CACHE_DIR")),
+                       help="memoize stage outputs on disk and reuse them on the next run")
+    group.add_argument("--no-cache", dest="cache", action="store_false",
+                       help="rerun every stage and store nothing (the default)")
+    group.add_argument("--cache-dir", default=os.environ.get("RG_CACHE_DIR", DEFAULT_CACHE_DIR),
+                       help="directory for memoized stage outputs "
+                            f"(default: {DEFAULT_CACHE_DIR}, or RG_CACHE_DIR)")
+    group.add_argument("--cache-mb", type=float, default=DEFAULT_CACHE_MB,
+                       help=f"cache size cap in MB (default: {DEFAULT_CACHE_MB})")
+    return parser
+
+
+def cache_from_args(args):
+    """StageCache from parsed arguments, or None unless caching was enabled."""
+    if not args.cache:
+        return None
+    return StageCache(args.cache_dir, int(args.cache_mb * 2 ** 20))
@@ -0,0 +1,296 @@
+"""
+Wang-Landau Density of States for the 2D Ising Model
+================================================================
+One run estimates g(E) for an L x L periodic lattice; every canonical
+average at every temperature then follows from
+    Z(T) = sum_E g(E) exp(-E / T)
+instead of one IsingRG.simulate run per temperature.
+
+Implementation (replica-exchange Wang-Landau):
+1. The energy range is cut into overlapping windows; each window runs
+   in its own worker process with its own ln g(E) and modification
+   factor ln f, halved whenever its histogram is flat and then reduced
+   as 1/t (Belardinelli-Pereyra) so the error keeps decreasing
+2. Each window moves several walkers at once: one vectorized numpy step
+   attempts one single-spin flip per walker, with energies tracked
+   incrementally from dE = 2 s h
+3. Between rounds, walkers in neighbouring windows swap configurations,
+   which keeps every window ergodic
+4. Windows are stitched where ln g overlaps; g(E) = g(-E) on a bipartite
+   lattice, so only E <= 0 is sampled and the rest is mirrored
+
+Results are cached on disk per L and run settings
+(wl_cache/ising_L<L>_<hash>.npz).
+
+Energies follow IsingRG: E = -sum_<ij> s_i s_j, so E = -2N + 4k.
+================================================================
+"""
+
+import hashlib
+import inspect
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from numerics import logsumexp
+
+DEFAULT_CACHE_DIR = "wl_cache"
+
+
+def energy_windows(n_sites, n_windows=4, overlap=0.75):
+    """
+    Overlapping [first, last] energy-bin ranges covering E <= 0.
+
+    Bin k is E = -2N + 4k, so E <= 0 is k = 0 .. N/2. Consecutive windows
+    share a fraction `overlap` of their width.
+    """
+    top = n_sites // 2
+    width = top / (1 + (n_windows - 1) * (1 - overlap))
+    starts = np.arange(n_windows) * width * (1 - overlap)
+    return [(int(round(s)), min(top, int(round(s + width)))) for s in starts]
+
+
+class WangLandauWindow:
+    """
+    Walkers confined to one energy window, sharing ln g and the histogram.
+
+    Plain numpy state, so a window can be shipped to a worker process,
+    advanced there and sent back for replica exchange.
+    """
+    def __init__(self, L, first, last, n_walkers=16, ln_f=1.0, flatness=0.8,
+                 seed=None):
+        self.L = L
+        self.n_sites = L * L
+        self.first, self.last = first, last
+        self.ln_f = ln_f
+        self.flatness = flatness
+        self.moves = 0
+        self.one_over_t = False
+        self.rng = np.random.default_rng(seed)
+        self.ln_g = np.zeros(self.n_sites + 1)
+        self.hist = np.zeros(self.n_sites + 1, dtype=np.int64)
+        self.visited = np.zeros(self.n_sites + 1, dtype=bool)
+        self.lattices = self.rng.choice(np.array([-1, 1], dtype=np.int8),
+                                        size=(n_walkers, L, L))
+        # Flat neighbour table: spins are addressed as walker * N + site
+        site = np.arange(self.n_sites).reshape(L, L)
+        self._neighbours = np.stack([np.roll(site, shift, axis).ravel()
+                                     for axis in (0, 1) for shift in (1, -1)], axis=1)
+        self._offsets = np.arange(n_walkers) * self.n_sites
+        self.bins = (self._energies() + 2 * self.n_sites) // 4
+        self._enter_window()
+
+    def _energies(self):
+        s = self.lattices.astype(np.int32)
+        bonds = (s * np.roll(s, -1, axis=1)).sum(axis=(1, 2)) \
+            + (s * np.roll(s, -1, axis=2)).sum(axis=(1, 2))
+        return -bonds
+
+    def _propose(self, sites):
+        """Trial flip of sites[w] for every walker w: (flat indices, new bins)."""
+        spins = self.lattices.reshape(-1)
+        flat = self._offsets + sites
+        h = spins[self._neighbours[sites] + self._offsets[:, None]].sum(axis=1, dtype=np.int32)
+        return flat, self.bins + (spins[flat] * h) // 2
+
+    def _flip(self, flat, accept, new_bins):
+        self.lattices.reshape(-1)[flat[accept]] *= -1
+        self.bins = np.where(accept, new_bins, self.bins)
+
+    def _random_block(self, n_steps):
+        """Site choices and ln(uniforms) for n_steps vectorized steps."""
+        shape = (n_steps, len(self.bins))
+        return (self.rng.integers(0, self.n_sites, size=shape),
+                np.log(self.rng.random(shape)))
+
+    def _enter_window(self, max_steps=10 ** 6, block=1000):
+        """Greedy descent/ascent in energy until every walker is inside."""
+        for _ in range(0, max_steps, block):
+            for sites in self._random_block(block)[0]:
+                outside = np.maximum(self.first - self.bins, self.bins - self.last)
+                if np.all(outside <= 0):
+                    return
+                flat, new_bins = self._propose(sites)
+                new_outside = np.maximum(self.first - new_bins, new_bins - self.last)
+                self._flip(flat, (outside > 0) & (new_outside <= outside), new_bins)
+        raise RuntimeError("walkers could not reach their energy window")
+
+    def step(self, sites, log_u):
+        """One vectorized Wang-Landau update of all walkers."""
+        flat, new_bins = self._propose(sites)
+        inside = (new_bins >= self.first) & (new_bins <= self.last)
+        target = np.where(inside, new_bins, self.bins)
+        accept = inside & (log_u < self.ln_g[self.bins] - self.ln_g[target])
+        self._flip(flat, accept, new_bins)
+        np.add.at(self.ln_g, self.bins, self.ln_f)
+        np.add.at(self.hist, self.bins, 1)
+        self.visited[self.bins] = True
+        self.moves += len(self.bins)
+
+    def is_flat(self):
+        h = self.hist[self.visited]
+        return h.size > 0 and h.min() >= self.flatness * h.mean()
+
+    def run(self, n_steps, check_interval=1000):
+        """
+        Advance n_steps. ln f is halved whenever the histogram is flat
+        until it would drop below 1/t (t = moves per energy bin); from then
+        on ln f = 1/t, which avoids the error saturation of plain WL.
+        """
+        n_bins = self.last - self.first + 1
+        all_sites, all_log_u = self._random_block(n_steps)
+        for k in range(1, n_steps + 1):
+            self.step(all_sites[k - 1], all_log_u[k - 1])
+            if self.one_over_t:
+                self.ln_f = n_bins / self.moves
+            elif k % check_interval == 0 and self.is_flat():
+                self.ln_f /= 2.0
+                self.hist[:] = 0
+                if self.ln_f < n_bins / self.moves:
+                    self.one_over_t = True
+        return self
+
+
+def _advance(window, n_steps, check_interval):
+    """Worker entry point: run one window and send it back."""
+    return window.run(n_steps, check_interval)
+
+
+def replica_exchange(windows, rng, offset=0):
+    """Try to swap one random walker pair between neighbouring windows."""
+    accepted = 0
+    for k in range(offset, len(windows) - 1, 2):
+        a, b = windows[k], windows[k + 1]
+        x = rng.integers(len(a.bins))
+        y = rng.integers(len(b.bins))
+        ex, ey = a.bins[x], b.bins[y]
+        if not (b.first <= ex <= b.last and a.first <= ey <= a.last):
+            continue
+        log_p = a.ln_g[ex] - a.ln_g[ey] + b.ln_g[ey] - b.ln_g[ex]
+        if np.log(rng.random()) < log_p:
+            a.lattices[x], b.lattices[y] = b.lattices[y].copy(), a.lattices[x].copy()
+            a.bins[x], b.bins[y] = ey, ex
+            accepted += 1
+    return accepted
+
+
+def stitch(windows, n_sites):
+    """
+    Join the windows' ln g into one curve over E <= 0, mirror it to E > 0
+    and normalize to sum_E g(E) = 2^N. Unreachable energies get -inf.
+    """
+    ln_g = np.full(n_sites + 1, -np.inf)
+    prev = None
+    for k, w in enumerate(windows):
+        part = np.where(w.visited, w.ln_g, np.nan)
+        if prev is not None:
+            both = np.isfinite(prev) & np.isfinite(part)
+            if not both.any():
+                raise RuntimeError(
+                    f"windows {k - 1} and {k} share no visited energy bin "
+                    f"(bins {windows[k - 1].first}-{windows[k - 1].last} and "
+                    f"{w.first}-{w.last}); use a larger overlap or a longer run")
+            part = part + np.mean(prev[both] - part[both])
+            # Switch over in the middle of the overlap
+            cut = int(np.flatnonzero(both).mean())
+            keep = np.arange(n_sites + 1) >= cut
+        else:
+            keep = np.ones(n_sites + 1, dtype=bool)
+        take = keep & np.isfinite(part)
+        ln_g[take] = part[take]
+        prev = np.where(np.isfinite(ln_g), ln_g, np.nan)
+    half = n_sites // 2
+    ln_g[half + 1:] = ln_g[:half][::-1]
+    finite = np.isfinite(ln_g)
+    return ln_g - logsumexp(ln_g[finite]) + n_sites * np.log(2.0)
+
+
+def wang_landau(L, n_windows=4, overlap=0.75, n_walkers=16, ln_f_final=1e-6,
+                flatness=0.8, steps_per_round=2000, check_interval=1000,
+                workers=None, seed=None):
+    """
+    Replica-exchange Wang-Landau estimate of ln g(E) for an L x L lattice.
+
+    Returns (energies, ln_g) with energies = -2N + 4k for k = 0..N.
+    """
+    if L % 2:
+        raise ValueError("the E -> -E mirror needs an even L")
+    n_sites = L * L
+    rng = np.random.default_rng(seed)
+    seeds = np.random.SeedSequence(seed).spawn(n_windows)
+    windows = [WangLandauWindow(L, first, last, n_walkers, flatness=flatness, seed=s)
+               for (first, last), s in zip(energy_windows(n_sites, n_windows, overlap), seeds)]
+    with ProcessPoolExecutor(max_workers=workers or min(n_windows, os.cpu_count())) as pool:
+        round_ = 0
+        while any(w.ln_f > ln_f_final for w in windows):
+            futures = [pool.submit(_advance, w, steps_per_round, check_interval)
+                       if w.ln_f > ln_f_final else None for w in windows]
+            windows = [f.result() if f is not None else w
+                       for f, w in zip(futures, windows)]
+            replica_exchange(windows, rng, offset=round_ % 2)
+            round_ += 1
+    energies = -2 * n_sites + 4 * np.arange(n_sites + 1)
+    return energies, stitch(windows, n_sites)
+
+
+# Settings that do not change the estimate and stay out of the cache key
+_UNKEYED = ("L", "ln_f_final", "workers")
+
+
+def cache_path(L, cache_dir=DEFAULT_CACHE_DIR, **kwargs):
+    """
+    Cache file of wang_landau(L, **kwargs): the name carries a hash of
+    every setting that changes the estimate (defaults filled in), so runs
+    with different windows, walkers or seeds do not overwrite each other.
+    """
+    bound = inspect.signature(wang_landau).bind(L, **kwargs)
+    bound.apply_defaults()
+    settings = {name: value for name, value in bound.arguments.items()
+                if name not in _UNKEYED}
+    digest = hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()
+    return os.path.join(cache_dir, f"ising_L{L}_{digest[:12]}.npz")
+
+
+def density_of_states(L, cache_dir=DEFAULT_CACHE_DIR, ln_f_final=1e-6, **kwargs):
+    """
+    ln g(E) for an L x L lattice, from the on-disk cache when a run with
+    the same settings and at least as converged (smaller ln_f_final)
+    exists, otherwise computed with wang_landau(L, **kwargs) and saved.
+    """
+    path = cache_path(L, cache_dir, **kwargs)
+    if os.path.exists(path):
+        with np.load(path) as data:
+            if float(data["ln_f_final"]) <= ln_f_final:
+                return data["energies"], data["ln_g"]
+    energies, ln_g = wang_landau(L, ln_f_final=ln_f_final, **kwargs)
+    os.makedirs(cache_dir, exist_ok=True)
+    np.savez(path, energies=energies, ln_g=ln_g, ln_f_final=ln_f_final)
+    return energies, ln_g
+
+
+def thermodynamics(energies, ln_g, T_values):
+    """
+    Canonical per-site observables at every T from one density of states.
+
+    Returns a dict with T, free_energy, energy, specific_heat and entropy.
+    """
+    T = np.atleast_1d(np.asarray(T_values, dtype=float))
+    n_sites = len(energies) - 1
+    ok = np.isfinite(ln_g)
+    E, ln_g = energies[ok].astype(float), ln_g[ok]
+    log_w = ln_g[None, :] - E[None, :] / T[:, None]
+    log_z = logsumexp(log_w, axis=1)
+    p = np.exp(log_w - log_z[:, None])
+    e1 = p @ E
+    e2 = p @ E ** 2
+    free_energy = -T * log_z / n_sites
+    energy = e1 / n_sites
+    return {
+        "T": T,
+        "free_energy": free_energy,
+        "energy": energy,
+        "specific_heat": (e2 - e1 ** 2) / (T ** 2 * n_sites),
+        "entropy": (energy - free_energy) / T,
+    }
@@ -1,16 +1,22 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """
-1. 删除重复下载的图片（文件名后缀为 _1、_1_2、_1_2_3 等）
-2. 根据剩余主文件重建 download_log.json
-3. 检查笔记中的图片 URL，缺失的重新下载
+1. 按内容哈希删除重复图片（仍被笔记引用的副本改为硬链接）
+2. 根据图片索引中记录的真实来源重建 download_log.json
+3. 检查笔记中的图片 URL，缺失的重新下载（线程池并发 + 连接复用 + 重试 + 断点续传）
 """
 
+import os
 import re
 import json
+import time
 import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from datetime import datetime
+from requests.adapters import HTTPAdapter
+
+from image_index import ImageIndex, referenced_image_names, write_json_atomic
 
 SCRIPT_DIR = Path(__file__).parent.absolute()
 DOCS_DIR = SCRIPT_DIR.parent.parent
@@ -18,72 +24,30 @@ IMAGES_DIR = SCRIPT_DIR
 LOG_FILE = SCRIPT_DIR / "download_log.json"
 IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.svg', '.bmp'}
 REQUEST_TIMEOUT = 15
+MAX_WORKERS = 8        # 并发下载线程数
+MAX_RETRIES = 3        # 每张图片的最大重试次数
+BACKOFF_SECONDS = 0.5  # 重试等待：0.5s、1s、2s ...
+CHUNK_SIZE = 64 * 1024
 HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
     'Accept': 'image/*,*/*;q=0.8',
 }
 
-# 重复文件：stem 以 _1、_1_2、_1_2_3 结尾
-DUPLICATE_STEM_PATTERN = re.compile(r'_\d+(_\d+)*$')
-
-
-def stem_is_duplicate(stem: str) -> bool:
-    """主文件 stem 不含 _1/_1_2；重复文件含 _1 或 _1_2 等"""
-    return bool(DUPLICATE_STEM_PATTERN.search(stem))
+def delete_duplicate_images(index: ImageIndex, docs_dir: Path = DOCS_DIR,
+                            log_file: Path = LOG_FILE):
+    """
+    按内容哈希去重：未被笔记引用的副本删除，仍被引用的副本改为硬链接。
+    返回 (deleted, linked)
+    """
+    index.refresh()
+    # 先迁移旧日志中的来源，删除副本时其 URL 会合并到保留的主文件
+    index.import_download_log(log_file)
+    return index.deduplicate(referenced_image_names(docs_dir))
 
 
-def delete_duplicate_images():
-    """删除重复图片（*_1.png, *_1_2.jpg 等）"""
-    deleted = []
-    for f in IMAGES_DIR.iterdir():
-        if not f.is_file() or f.suffix.lower() not in IMAGE_EXTENSIONS:
-            continue
-        if f.name.startswith('.') or f.suffix.lower() == '.py':
-            continue
-        if stem_is_duplicate(f.stem):
-            f.unlink()
-            deleted.append(f.name)
-    return deleted
-
-
-def uuid_and_ext_from_primary_filename(filename: str):
-    """从主文件名 01_001_748c3bba-f562-45f3-a6c9-a7be7f2d4cb5.jpg 提取 uuid 和 ext"""
-    stem = Path(filename).stem
-    ext = Path(filename).suffix.lower()
-    if ext not in IMAGE_EXTENSIONS:
-        return None, None
-    # 格式: 01_001_<name_part>
-    m = re.match(r'^\d{2}_\d{3}_(.+)$', stem)
-    if not m:
-        return None, None
-    name_part = m.group(1)
-    if not re.match(r'^[a-f0-9-]+$', name_part):  # UUID 或短哈希
-        return None, None
-    return name_part, ext
-
-
-def rebuild_log_from_primary_files():
-    """根据当前主文件重建 download_log.json（mdnice URL -> 本地文件名）"""
-    mapping = {}
-    for f in IMAGES_DIR.iterdir():
-        if not f.is_file() or f.suffix.lower() not in IMAGE_EXTENSIONS:
-            continue
-        if stem_is_duplicate(f.stem):
-            continue
-        uuid_part, ext = uuid_and_ext_from_primary_filename(f.name)
-        if not uuid_part:
-            continue
-        for user_id in ['141272', '129153']:
-            url = f"https://files.mdnice.com/user/{user_id}/{uuid_part}{ext}"
-            mapping[url] = f.name
-    log = {
-        "last_update": datetime.now().isoformat(),
-        "processed_files": {},
-        "downloaded_urls": mapping
-    }
-    with open(LOG_FILE, 'w', encoding='utf-8') as out:
-        json.dump(log, out, ensure_ascii=False, indent=2)
-    return len(mapping)
+def rebuild_log_from_primary_files(index: ImageIndex, log_file: Path = LOG_FILE):
+    """根据索引中记录的真实来源 URL 重建 download_log.json（URL -> 本地文件名）"""
+    return index.write_download_log(log_file)
 
 
 def extract_image_urls(content: str):
@@ -93,17 +57,64 @@ def extract_image_urls(content: str):
     return urls
 
 
-def download_one(url: str, save_path: Path) -> bool:
-    try:
-        r = requests.get(url, headers=HEADERS, timeout=REQUEST_TIMEOUT, stream=True)
-        r.raise_for_status()
-        with open(save_path, 'wb') as f:
-            for chunk in r.iter_content(chunk_size=8192):
-                f.write(chunk)
+def build_url_index(docs_dir: Path = DOCS_DIR):
+    """一次遍历所有笔记，建立 图片 URL -> 笔记名 的索引（同一 URL 以最后出现的笔记为准）"""
+    url_to_note = {}
+    for md in sorted(docs_dir.glob("*.md")):
+        with open(md, 'r', encoding='utf-8') as f:
+            for u in extract_image_urls(f.read()):
+                url_to_note[u] = md.stem
+    return url_to_note
+
+
+def make_session(pool_size: int = MAX_WORKERS) -> requests.Session:
+    """所有下载线程共用一个 Session，连接池大小与并发数一致，复用 TCP/TLS 连接"""
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def is_retryable(error: Exception) -> bool:
+    """4xx（除 408/429）重试也没用，其余网络错误和 5xx 可以重试"""
+    response = getattr(error, 'response', None)
+    if response is None:
         return True
-    except Exception as e:
-        print(f"  ✗ 下载失败: {e}")
-        return False
+    return response.status_code >= 500 or response.status_code in (408, 429)
+
+
+def download_one(url: str, save_path: Path, session: requests.Session = None,
+                 retries: int = MAX_RETRIES) -> bool:
+    """
+    下载单张图片，支持断点续传：先写入 <文件名>.part，
+    中断后再次下载时用 Range 请求从已有字节处继续，完成后再改名为正式文件。
+    失败时按指数退避重试。
+    """
+    session = session or make_session(1)
+    part_path = save_path.with_name(save_path.name + '.part')
+    for attempt in range(retries + 1):
+        offset = part_path.stat().st_size if part_path.exists() else 0
+        headers = {'Range': f'bytes={offset}-'} if offset else {}
+        try:
+            with session.get(url, headers=headers, timeout=REQUEST_TIMEOUT, stream=True) as r:
+                if offset and r.status_code == 416:
+                    break  # .part 已是完整文件
+                r.raise_for_status()
+                # 服务器不支持 Range 时返回 200，需要从头写
+                mode = 'ab' if offset and r.status_code == 206 else 'wb'
+                with open(part_path, mode) as f:
+                    for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                        f.write(chunk)
+            break
+        except (requests.RequestException, OSError) as e:
+            if attempt == retries or not is_retryable(e):
+                print(f"  ✗ 下载失败: {e}")
+                return False
+            time.sleep(BACKOFF_SECONDS * 2 ** attempt)
+    os.replace(part_path, save_path)
+    return True
 
 
 def url_to_filename(url: str, index: int, note_name: str) -> str:
@@ -120,53 +131,56 @@ def url_to_filename(url: str, index: int, note_name: str) -> str:
     return f"{nn}_{str(index).zfill(3)}_{name}{ext}"
 
 
-def find_missing_urls_and_download():
-    """收集所有 md 中的图片 URL，未在 log 或文件不存在的则下载"""
-    if not LOG_FILE.exists():
+def find_missing_urls_and_download(max_workers: int = MAX_WORKERS, session: requests.Session = None,
+                                   index: ImageIndex = None, docs_dir: Path = DOCS_DIR,
+                                   images_dir: Path = IMAGES_DIR, log_file: Path = LOG_FILE):
+    """
+    收集 docs_dir 下所有 md 中的图片 URL，未在 log_file 中或文件不存在的
+    并发下载到 images_dir，再原子地更新 log_file
+    """
+    if not log_file.exists():
         return 0
-    with open(LOG_FILE, 'r', encoding='utf-8') as f:
+    with open(log_file, 'r', encoding='utf-8') as f:
         log = json.load(f)
     mapping = dict(log.get("downloaded_urls", {}))
-    all_urls = set()
-    for md in sorted(DOCS_DIR.glob("*.md")):
-        with open(md, 'r', encoding='utf-8') as f:
-            all_urls.update(extract_image_urls(f.read()))
+    url_to_note = build_url_index(docs_dir)
     missing = []
-    for url in all_urls:
+    for url in sorted(url_to_note):
         if url not in mapping:
             missing.append(url)
         else:
-            local = IMAGES_DIR / mapping[url]
+            local = images_dir / mapping[url]
             if not local.exists():
                 missing.append(url)
     if not missing:
         return 0
     print(f"\n📥 需重新下载 {len(missing)} 张图片")
-    url_to_note = {}
-    for md in sorted(DOCS_DIR.glob("*.md")):
-        with open(md, 'r', encoding='utf-8') as f:
-            for u in extract_image_urls(f.read()):
-                if u in missing:
-                    url_to_note[u] = md.stem
     downloaded = 0
-    for i, url in enumerate(missing, 1):
-        note_name = url_to_note.get(url, "00")
-        filename = url_to_filename(url, i, note_name)
-        save_path = IMAGES_DIR / filename
-        if save_path.exists():
-            mapping[url] = filename
-            downloaded += 1
-            continue
-        print(f"  [{i}/{len(missing)}] {filename[:55]}...")
-        if download_one(url, save_path):
-            mapping[url] = filename
-            downloaded += 1
-            print("  ✓")
+    jobs = {}
+    session = session or make_session(max_workers)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for i, url in enumerate(missing, 1):
+            note_name = url_to_note.get(url, "00")
+            filename = url_to_filename(url, i, note_name)
+            save_path = images_dir / filename
+            if save_path.exists():
+                mapping[url] = filename
+                downloaded += 1
+                continue
+            jobs[pool.submit(download_one, url, save_path, session)] = (url, filename)
+        for done, future in enumerate(as_completed(jobs), 1):
+            url, filename = jobs[future]
+            ok = future.result()
+            print(f"  [{done}/{len(jobs)}] {filename[:55]} {'✓' if ok else '✗'}")
+            if ok:
+                mapping[url] = filename
+                downloaded += 1
+                if index is not None:
+                    index.record_download(url, filename)
     if downloaded > 0:
         log["downloaded_urls"] = mapping
         log["last_update"] = datetime.now().isoformat()
-        with open(LOG_FILE, 'w', encoding='utf-8') as out:
-            json.dump(log, out, ensure_ascii=False, indent=2)
+        write_json_atomic(log_file, log)
     return downloaded
 
 
@@ -175,18 +189,20 @@ def main():
     print("🧹 删除重复图片并补全下载")
     print("=" * 60)
 
-    deleted = delete_duplicate_images()
-    print(f"\n已删除 {len(deleted)} 个重复文件（*_1, *_1_2 等）")
+    index = ImageIndex(IMAGES_DIR)
+    deleted, linked = delete_duplicate_images(index)
+    print(f"\n已删除 {len(deleted)} 个内容重复的文件，{len(linked)} 个被引用的副本改为硬链接")
     if deleted:
         for name in deleted[:15]:
             print(f"  - {name}")
         if len(deleted) > 15:
             print(f"  ... 共 {len(deleted)} 个")
 
-    n = rebuild_log_from_primary_files()
-    print(f"\n已根据主文件重建 download_log.json，共 {n} 条映射")
+    n = rebuild_log_from_primary_files(index)
+    print(f"\n已根据图片来源记录重建 download_log.json，共 {n} 条映射")
 
-    redownloaded = find_missing_urls_and_download()
+    redownloaded = find_missing_urls_and_download(index=index)
+    index.save()
     print(f"\n补全下载：{redownloaded} 张")
     print("=" * 60)
     print("请再运行: python replace_image_urls.py  将笔记中的 URL 替换为本地路径")
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图片库的持久化内容索引（image_index.json）
+1. 以内容哈希（SHA-256）识别重复图片，而不是靠文件名后缀猜测
+2. 记录每个文件的 size/mtime，未变化的文件不再重新计算哈希
+3. 记录每张图片的真实来源 URL（下载时写入），据此生成 download_log.json
+"""
+
+import os
+import re
+import json
+import hashlib
+import stat
+import tempfile
+from pathlib import Path
+from datetime import datetime
+
+SCRIPT_DIR = Path(__file__).parent.absolute()
+DOCS_DIR = SCRIPT_DIR.parent.parent.parent
+IMAGES_DIR = SCRIPT_DIR
+INDEX_FILE = SCRIPT_DIR / "image_index.json"
+LOG_FILE = SCRIPT_DIR / "download_log.json"
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.svg', '.bmp'}
+DUPLICATE_STEM_PATTERN = re.compile(r'_\d+(_\d+)*$')
+
+
+def file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def file_mode(path: Path) -> int:
+    """已有文件的权限位；新文件则为 0o666 去掉 umask"""
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+def write_json_atomic(path: Path, data):
+    """先写临时文件再改名，避免中断时留下半个 JSON"""
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as out:
+            json.dump(data, out, ensure_ascii=False, indent=2)
+        # mkstemp 建的是 0600 文件，改名前恢复原有（或新文件应有）的权限
+        os.chmod(tmp_path, file_mode(path))
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def referenced_image_names(docs_dir: Path = DOCS_DIR):
+    """所有笔记中通过 assets/images/<文件名> 引用到的图片文件名"""
+    names = set()
+    for md in docs_dir.glob("**/*.md"):
+        with open(md, 'r', encoding='utf-8') as f:
+            names.update(re.findall(r'assets/images/([^)\s"\'<>]+)', f.read()))
+    return names
+
+
+class ImageIndex:
+    """
+    文件名 -> {size, mtime_ns, sha256, urls} 的索引。
+
+    urls 是该文件内容的真实下载来源，由 record_download 在下载成功时写入。
+    """
+    def __init__(self, images_dir: Path = IMAGES_DIR, index_file: Path = INDEX_FILE):
+        self.images_dir = Path(images_dir)
+        self.index_file = Path(index_file)
+        self.files = {}
+        if self.index_file.exists():
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                self.files = json.load(f).get("files", {})
+
+    def save(self):
+        write_json_atomic(self.index_file, {
+            "last_update": datetime.now().isoformat(),
+            "files": self.files,
+        })
+
+    def image_files(self):
+        for f in self.images_dir.iterdir():
+            if f.is_file() and not f.name.startswith('.') and f.suffix.lower() in IMAGE_EXTENSIONS:
+                yield f
+
+    def refresh(self):
+        """同步索引与磁盘：size 和 mtime 都没变的文件沿用旧哈希，返回重新哈希的文件数"""
+        hashed = 0
+        present = {}
+        for f in self.image_files():
+            st = f.stat()
+            entry = self.files.get(f.name, {})
+            if entry.get("size") != st.st_size or entry.get("mtime_ns") != st.st_mtime_ns:
+                entry = dict(entry, size=st.st_size, mtime_ns=st.st_mtime_ns, sha256=file_sha256(f))
+                hashed += 1
+            entry.setdefault("urls", [])
+            present[f.name] = entry
+        self.files = present
+        return hashed
+
+    def record_download(self, url: str, filename: str):
+        """下载成功后登记来源 URL（真实来源，而不是根据文件名推测）"""
+        f = self.images_dir / filename
+        st = f.stat()
+        entry = self.files.get(filename, {"urls": []})
+        if entry.get("size") != st.st_size or entry.get("mtime_ns") != st.st_mtime_ns:
+            entry.update(size=st.st_size, mtime_ns=st.st_mtime_ns, sha256=file_sha256(f))
+        if url not in entry["urls"]:
+            entry["urls"].append(url)
+        self.files[filename] = entry
+
+    def import_download_log(self, log_file: Path = LOG_FILE):
+        """把已有 download_log.json 中的 URL -> 文件名 记录迁移为来源信息"""
+        if not log_file.exists():
+            return 0
+        with open(log_file, 'r', encoding='utf-8') as f:
+            mapping = json.load(f).get("downloaded_urls", {})
+        imported = 0
+        for url, filename in mapping.items():
+            entry = self.files.get(filename)
+            if entry is not None and url not in entry["urls"]:
+                entry["urls"].append(url)
+                imported += 1
+        return imported
+
+    def duplicate_groups(self):
+        """内容完全相同的文件组：sha256 -> [文件名, ...]（至少两个）"""
+        by_hash = {}
+        for name, entry in sorted(self.files.items()):
+            by_hash.setdefault(entry["sha256"], []).append(name)
+        return {h: names for h, names in by_hash.items() if len(names) > 1}
+
+    def deduplicate(self, referenced=None, mode="remove"):
+        """
+        处理内容重复的图片，每组保留一个主文件：
+        - 未被笔记引用的副本：删除（mode="remove"）或改为指向主文件的硬链接（mode="hardlink"）
+        - 仍被笔记引用的副本：总是改为硬链接，保证笔记里的链接不失效
+        主文件优先选被引用的、文件名不带 _1/_1_2 后缀的。
+        返回 (removed, linked) 两个文件名列表。
+        """
+        referenced = set(referenced or ())
+        removed, linked = [], []
+        for names in self.duplicate_groups().values():
+            keep = min(names, key=lambda n: (n not in referenced,
+                                             bool(DUPLICATE_STEM_PATTERN.search(Path(n).stem)),
+                                             len(n), n))
+            keep_path = self.images_dir / keep
+            for name in names:
+                if name == keep:
+                    continue
+                path = self.images_dir / name
+                entry = self.files[name]
+                # 来源 URL 合并到主文件
+                for url in entry["urls"]:
+                    if url not in self.files[keep]["urls"]:
+                        self.files[keep]["urls"].append(url)
+                if mode == "remove" and name not in referenced:
+                    path.unlink()
+                    del self.files[name]
+                    removed.append(name)
+                    continue
+                if os.path.samefile(path, keep_path):
+                    continue  # 已经是硬链接
+                tmp_path = path.with_name(f'.{name}.link')
+                os.link(keep_path, tmp_path)
+                os.replace(tmp_path, path)
+                st = path.stat()
+                entry.update(size=st.st_size, mtime_ns=st.st_mtime_ns)
+                linked.append(name)
+        return removed, linked
+
+    def download_log(self):
+        """由真实来源生成 download_log.json 的 URL -> 文件名 映射"""
+        mapping = {}
+        for name, entry in sorted(self.files.items()):
+            for url in entry["urls"]:
+                mapping.setdefault(url, name)
+        return mapping
+
+    def write_download_log(self, log_file: Path = LOG_FILE):
+        mapping = self.download_log()
+        write_json_atomic(log_file, {
+            "last_update": datetime.now().isoformat(),
+            "processed_files": {},
+            "downloaded_urls": mapping,
+        })
+        return len(mapping)
@@ -4,7 +4,14 @@ Replace LaTeX formulas in image alt text with Unicode equivalents.
 This is needed because glightbox captions don't render LaTeX.
 """
 
+import argparse
+import hashlib
+import json
+import os
 import re
+import stat
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 # LaTeX command to Unicode mapping (without $ wrapping)
@@ -110,36 +117,60 @@ SUBSCRIPTS = {
 }
 
 
+# Command name -> Unicode, e.g. 'alpha' -> 'α' (keys above are regex-escaped)
+COMMAND_NAMES = {latex[2:]: unicode_char for latex, unicode_char in LATEX_COMMANDS.items()}
+
+# Brace group content with up to 3 levels of nesting; \{ and \} are escapes
+BRACE_CONTENT = r'(?:\\.|[^{}\\])*'
+for _ in range(3):
+    BRACE_CONTENT = r'(?:\\.|[^{}\\]|\{' + BRACE_CONTENT + r'\})*'
+
+# One alternation for everything the translator understands. Command names
+# are tried longest first, so \infty never turns into \in + "fty" and
+# \simeq never into \sim + "eq", whatever the order of LATEX_COMMANDS.
+LATEX_TOKEN_PATTERN = re.compile(
+    r'\\(?P<command>'
+    + '|'.join(sorted(map(re.escape, COMMAND_NAMES), key=len, reverse=True))
+    + r')'
+    r'|\\(?P<unknown>[a-zA-Z]+)'                                   # Other \commands
+    r'|\\(?P<brace>[{}])'                                          # Literal \{ \}
+    rf'|\^(?:\{{(?P<sup>{BRACE_CONTENT})\}}|(?P<sup_char>[0-9a-zA-Z+-]))'  # ^{...} or ^x
+    rf'|_(?:\{{(?P<sub>{BRACE_CONTENT})\}}|(?P<sub_char>[0-9a-zA-Z]))'     # _{...} or _x
+    rf'|\{{(?P<group>{BRACE_CONTENT})\}}'                          # Plain braces
+    r'|\$',
+    flags=re.DOTALL,
+)
+
+
+def _translate_token(m):
+    kind = m.lastgroup
+    if kind == 'command':
+        return COMMAND_NAMES[m.group('command')]
+    if kind in ('unknown', 'brace'):
+        return m.group(kind)  # Drop the backslash
+    if kind in ('sup', 'sup_char'):
+        return ''.join(SUPERSCRIPTS.get(c, c) for c in replace_latex_in_text(m.group(kind)))
+    if kind in ('sub', 'sub_char'):
+        return ''.join(SUBSCRIPTS.get(c, c) for c in replace_latex_in_text(m.group(kind)))
+    if kind == 'group':
+        return replace_latex_in_text(m.group('group'))
+    return ''  # $ signs
+
+
 def replace_latex_in_text(text):
-    """Replace all LaTeX commands in text with Unicode."""
-    result = text
-    
-    # Replace LaTeX commands
-    for latex, unicode_char in LATEX_COMMANDS.items():
-        result = re.sub(latex, unicode_char, result)
-    
-    # Handle superscripts: ^{...} or ^x
-    def replace_superscript(m):
-        content = m.group(1) if m.group(1) else m.group(2)
-        return ''.join(SUPERSCRIPTS.get(c, c) for c in content)
-    result = re.sub(r'\^\{([^}]+)\}|\^([0-9a-zA-Z+-])', replace_superscript, result)
-    
-    # Handle subscripts: _{...} or _x
-    def replace_subscript(m):
-        content = m.group(1) if m.group(1) else m.group(2)
-        return ''.join(SUBSCRIPTS.get(c, c) for c in content)
-    result = re.sub(r'_\{([^}]+)\}|_([0-9a-zA-Z])', replace_subscript, result)
-    
-    # Remove remaining braces
-    result = re.sub(r'\{([^}]*)\}', r'\1', result)
-    
-    # Remove $ signs
-    result = result.replace('$', '')
+    """
+    Replace all LaTeX commands in text with Unicode.
     
-    # Clean up extra backslashes
-    result = re.sub(r'\\([a-zA-Z]+)', r'\1', result)  # Remove remaining \commands
-    
-    return result
+    Single left-to-right scan with one precompiled pattern; only the
+    content of brace groups is scanned again (recursively).
+    """
+    return LATEX_TOKEN_PATTERN.sub(_translate_token, text)
+
+
+# Match image syntax: ![alt text](path)
+# Handle multiline alt text with DOTALL flag
+IMAGE_PATTERN = re.compile(
+    r'!\[((?:[^\[\]]|\[(?:[^\[\]]|\[[^\[\]]*\])*\])*)\]\(([^)]+)\)', flags=re.DOTALL)
 
 
 def replace_latex_in_alt_text(content):
@@ -155,11 +186,31 @@ def replace_latex_in_alt_text(content):
         # Return complete image syntax with closing paren
         return f'![{new_alt}]({path})'
     
-    # Match image syntax: ![alt text](path)
-    # Handle multiline alt text with DOTALL flag
-    pattern = r'!\[((?:[^\[\]]|\[(?:[^\[\]]|\[[^\[\]]*\])*\])*)\]\(([^)]+)\)'
-    
-    return re.sub(pattern, process_alt, content, flags=re.DOTALL)
+    return IMAGE_PATTERN.sub(process_alt, content)
+
+
+def file_mode(filepath):
+    """Permission bits of filepath, or those of a new file (0o666 minus umask)."""
+    try:
+        return stat.S_IMODE(os.stat(filepath).st_mode)
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+def write_atomic(filepath, text):
+    """Write text via a temporary file and rename, so readers never see a partial file."""
+    fd, tmp_path = tempfile.mkstemp(dir=filepath.parent, prefix=f'.{filepath.name}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+        # mkstemp creates 0600 files; keep the mode the file had (or would get)
+        os.chmod(tmp_path, file_mode(filepath))
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
 
 
 def process_file(filepath):
@@ -172,8 +223,7 @@ def process_file(filepath):
     new_content = replace_latex_in_alt_text(content)
     
     if content != new_content:
-        with open(filepath, 'w', encoding='utf-8') as f:
-            f.write(new_content)
+        write_atomic(filepath, new_content)
         print(f"  Updated: {filepath.name}")
         return True
     else:
@@ -181,18 +231,105 @@ def process_file(filepath):
         return False
 
 
-def main():
+# ============================================================
+# Incremental mode
+# ============================================================
+# The manifest records size, mtime and SHA-256 of every file after it was
+# processed. A file whose size and mtime still match is skipped without
+# being read; if only the mtime changed, the hash decides. The manifest is
+# tied to this script's own hash, so editing the translation tables
+# reprocesses everything.
+
+MANIFEST_FILE = Path(__file__).parent / '.replace_latex_manifest.json'
+
+
+def file_digest(filepath):
+    return hashlib.sha256(filepath.read_bytes()).hexdigest()
+
+
+def manifest_entry(filepath):
+    st = filepath.stat()
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha256': file_digest(filepath)}
+
+
+def is_unchanged(filepath, entry):
+    """
+    True if filepath still has the content recorded in its manifest entry.
+    A file that was only touched gets its recorded mtime refreshed in place.
+    """
+    if entry is None:
+        return False
+    st = filepath.stat()
+    if st.st_size != entry['size']:
+        return False
+    if st.st_mtime_ns == entry['mtime_ns']:
+        return True
+    if file_digest(filepath) != entry['sha256']:
+        return False
+    entry['mtime_ns'] = st.st_mtime_ns
+    return True
+
+
+def load_manifest(path=MANIFEST_FILE):
+    version = file_digest(Path(__file__))
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        manifest = {}
+    if manifest.get('version') != version:
+        manifest = {'version': version, 'files': {}}
+    return manifest
+
+
+def dump_manifest(manifest):
+    return json.dumps(manifest, ensure_ascii=False, indent=1, sort_keys=True)
+
+
+def process_file_for_manifest(filepath):
+    """Worker task: process one file and return its new manifest entry."""
+    return process_file(filepath), manifest_entry(filepath)
+
+
+def main(argv=None):
     script_dir = Path(__file__).parent
     docs_dir = script_dir.parent / 'docs'
     
-    md_files = list(docs_dir.glob('**/*.md'))
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--full', action='store_true',
+                        help='ignore the manifest and reprocess every file')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='processes used for changed files')
+    args = parser.parse_args(argv)
+    
+    md_files = sorted(docs_dir.glob('**/*.md'))
+    manifest = load_manifest()
+    loaded = dump_manifest(manifest)
+    if args.full:
+        manifest['files'] = {}
+    entries = manifest['files']
+    
+    keys = [md_file.relative_to(docs_dir).as_posix() for md_file in md_files]
+    changed = [(key, md_file) for key, md_file in zip(keys, md_files)
+               if not is_unchanged(md_file, entries.get(key))]
+    
+    if len(changed) > 1 and args.workers > 1:
+        with ProcessPoolExecutor(max_workers=min(args.workers, len(changed))) as pool:
+            results = list(pool.map(process_file_for_manifest, [f for _, f in changed]))
+    else:
+        results = [process_file_for_manifest(f) for _, f in changed]
     
     updated_count = 0
-    for md_file in md_files:
-        if process_file(md_file):
-            updated_count += 1
+    for (key, _), (updated, entry) in zip(changed, results):
+        entries[key] = entry
+        updated_count += updated
+    # Forget deleted files
+    manifest['files'] = {key: entries[key] for key in keys if key in entries}
+    text = dump_manifest(manifest)
+    if text != loaded:
+        write_atomic(MANIFEST_FILE, text)
     
-    print(f"\nDone! Updated {updated_count} files.")
+    print(f"\nDone! Checked {len(changed)} of {len(md_files)} files, updated {updated_count}.")
 
 
 if __name__ == '__main__':